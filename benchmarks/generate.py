@@ -0,0 +1,196 @@
+"""
+Generates synthetic git repositories following the cactus model.
+
+The repositories are written with a single ``git fast-import`` process and are
+fully determined by their parameters, so benchmark results of different runs
+are comparable.
+"""
+
+import argparse
+from dataclasses import asdict, dataclass
+import os
+import random
+import subprocess
+
+AUTHOR = "Cactus Keeper <benchmark@example.com>"
+START_TIME = 1500000000
+
+WORDS = (
+    "fix crash when parsing empty input handle missing config value "
+    "avoid race in cache update correct off by one error in pagination "
+    "restore compatibility with older clients log failures instead of raising"
+).split()
+
+
+@dataclass(frozen=True)
+class RepositorySize:
+    """
+    The parameters of a synthetic repository.
+
+    ``commits`` is the number of commits on master. ``cherry_pick_ratio`` is
+    the share of fixes on release branches which are also picked to master.
+    ``message_length`` is the length of the commit message bodies in characters.
+    """
+
+    commits: int = 1000
+    release_branches: int = 5
+    fixes_per_branch: int = 20
+    cherry_pick_ratio: float = 0.8
+    message_length: int = 200
+    seed: int = 0
+
+    @property
+    def name(self):
+        return "c{commits}-b{release_branches}-f{fixes_per_branch}-p{ratio}-m{message_length}".format(
+            ratio=int(self.cherry_pick_ratio * 100), **asdict(self)
+        )
+
+
+SIZES = {
+    "small": RepositorySize(commits=500, release_branches=3),
+    "medium": RepositorySize(commits=5000, release_branches=8, fixes_per_branch=50),
+    "large": RepositorySize(
+        commits=50000, release_branches=15, fixes_per_branch=200, message_length=1000
+    ),
+}
+
+
+def release_version(index):
+    return "{0}.{1}".format(index // 10 + 1, index % 10)
+
+
+class FastImportWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.mark = 0
+        self.time = START_TIME
+
+    def write(self, text):
+        self.stream.write(text.encode())
+
+    def data(self, text):
+        encoded = text.encode()
+        self.stream.write(b"data %d\n" % len(encoded) + encoded + b"\n")
+
+    def commit(self, branch, message, parent=None, files=None):
+        """
+        Writes a commit and returns its mark.
+        """
+        self.mark += 1
+        self.time += 60
+        self.write("commit refs/heads/{0}\nmark :{1}\n".format(branch, self.mark))
+        self.write("committer {0} {1} +0000\n".format(AUTHOR, self.time))
+        self.data(message)
+        if parent is not None:
+            self.write("from :{0}\n".format(parent))
+        for path, content in (files or {}).items():
+            self.write("M 644 inline {0}\n".format(path))
+            self.data(content)
+        self.write("\n")
+        return self.mark
+
+
+def make_message(rng, shortlog, length, issue=None):
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rng.choice(WORDS))
+    body = " ".join(words)
+    if issue is not None:
+        body += "\n\nFixes #{0}".format(issue)
+    return "{0}\n\n{1}\n".format(shortlog, body)
+
+
+def generate_repository(path, size):
+    """
+    Creates a repository following the cactus model at the given path.
+
+    Master receives ``size.commits`` commits with a release commit and a new
+    release branch at regular intervals. Between releases, fixes are committed
+    to the existing release branches and a part of them is picked to master.
+
+    :param path:
+        The directory to create the repository in, it must not exist.
+    :param size:
+        A RepositorySize describing the repository.
+    """
+    rng = random.Random(size.seed)
+    subprocess.run(["git", "init", "-q", "-b", "master", path], check=True)
+    process = subprocess.Popen(
+        ["git", "-C", path, "fast-import", "--quiet"], stdin=subprocess.PIPE
+    )
+    writer = FastImportWriter(process.stdin)
+
+    release_interval = size.commits // (size.release_branches + 1)
+    fix_probability = (
+        size.release_branches * size.fixes_per_branch / max(size.commits, 1)
+    )
+    # branch name -> mark of the branch tip
+    branches = {}
+    master = None
+    issue = 0
+
+    for index in range(size.commits):
+        release = len(branches)
+        if index and index % release_interval == 0 and release < size.release_branches:
+            version = release_version(release)
+            master = writer.commit(
+                "master", "release: v{0}.0\n".format(version), master
+            )
+            branches["release/v" + version] = master
+            continue
+
+        if branches and rng.random() < fix_probability:
+            branch = rng.choice(sorted(branches))
+            issue += 1
+            files = {"fixes/{0}.txt".format(issue): "fixed {0}\n".format(issue)}
+            message = make_message(
+                rng, "fix: {0}".format(rng.choice(WORDS)), size.message_length, issue
+            )
+            fix = writer.commit(branch, message, branches[branch], files)
+            branches[branch] = fix
+
+            if rng.random() < size.cherry_pick_ratio:
+                message += "\n(cherry picked from commit :{0})\n".format(fix)
+                master = writer.commit("master", message, master, files)
+            continue
+
+        message = make_message(
+            rng, "feature: {0}".format(rng.choice(WORDS)), size.message_length
+        )
+        master = writer.commit(
+            "master", message, master, {"src/{0}.txt".format(index % 100): str(index)}
+        )
+
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError("git fast-import failed")
+    subprocess.run(["git", "-C", path, "checkout", "-q", "master"], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", help="Where to create the repository")
+    parser.add_argument("--commits", type=int, default=RepositorySize.commits)
+    parser.add_argument(
+        "--release-branches", type=int, default=RepositorySize.release_branches
+    )
+    parser.add_argument(
+        "--fixes-per-branch", type=int, default=RepositorySize.fixes_per_branch
+    )
+    parser.add_argument(
+        "--cherry-pick-ratio", type=float, default=RepositorySize.cherry_pick_ratio
+    )
+    parser.add_argument(
+        "--message-length", type=int, default=RepositorySize.message_length
+    )
+    parser.add_argument("--seed", type=int, default=RepositorySize.seed)
+    args = parser.parse_args()
+
+    path = args.path
+    del args.path
+    generate_repository(path, RepositorySize(**vars(args)))
+    print("Created {0}".format(os.path.abspath(path)))
+
+
+if __name__ == "__main__":
+    main()
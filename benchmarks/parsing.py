@@ -0,0 +1,89 @@
+"""
+Measures the throughput of commit message parsing.
+
+Synthetic messages like the ones in the generated repositories are parsed one
+at a time with the single message regular expression cactuskeeper used before
+and in blocks by ``MessageParser``, with the default and with additional JIRA
+style issue patterns.
+"""
+
+import argparse
+import random
+import re
+import time
+
+from benchmarks.generate import make_message, WORDS
+from cactuskeeper.git import MAX_PARSE_BLOCK
+from cactuskeeper.messages import MessageParser
+
+COMMIT_REGEX = re.compile(
+    r"^(?P<shortlog>(release: v(?P<version>(\d+)\.(\d+)\.(\d)))|.+)"
+    r"[^#]*(?P<issue>#\d+)?"
+)
+
+
+def make_messages(count, length, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for index in range(count):
+        if index % 100 == 0:
+            messages.append("release: v1.{0}.0\n".format(index % 10))
+        elif index % 3:
+            shortlog = "fix: {0}".format(rng.choice(WORDS))
+            messages.append(make_message(rng, shortlog, length, issue=index))
+        else:
+            shortlog = "feature: {0}".format(rng.choice(WORDS))
+            messages.append(make_message(rng, shortlog, length))
+    return messages
+
+
+def parse_one_by_one(messages):
+    result = []
+    for message in messages:
+        m = COMMIT_REGEX.match(message)
+        result.append(
+            (message.split("\n")[0].strip(), m.group("issue"), m.group("version"))
+        )
+    return result
+
+
+def parse_in_blocks(parser, messages):
+    result = []
+    for start in range(0, len(messages), MAX_PARSE_BLOCK):
+        result += parser.parse(messages[start : start + MAX_PARSE_BLOCK])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=10**6)
+    parser.add_argument(
+        "--message-length",
+        type=int,
+        default=200,
+        help="The length of the message bodies in characters",
+    )
+    args = parser.parse_args()
+
+    messages = make_messages(args.count, args.message_length)
+    benchmarks = {
+        "one by one (single regex)": lambda: parse_one_by_one(messages),
+        "blocks (#123)": lambda: parse_in_blocks(MessageParser(), messages),
+        "blocks (#123, ABC-123)": lambda: parse_in_blocks(
+            MessageParser([r"#\d+", r"[A-Z][A-Z0-9]+-\d+"]), messages
+        ),
+    }
+
+    for name, function in benchmarks.items():
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        print(
+            "{0:30} {1:8.3f}s {2:12,.0f} messages/s".format(
+                name, seconds, len(messages) / seconds
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
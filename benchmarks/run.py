@@ -0,0 +1,181 @@
+"""
+Times cactuskeeper on synthetic repositories.
+
+Repositories are generated once per size and kept in the work directory.
+Every benchmark runs several times and the minimum and median are reported.
+Results can be written as JSON and compared against a previous run.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from click.testing import CliRunner
+from git import Repo
+
+from benchmarks.generate import SIZES, generate_repository
+from cactuskeeper.cli import cli
+from cactuskeeper.git import (
+    get_bugfixes_for_branch,
+    get_latest_release_commit,
+    get_release_branches,
+)
+
+
+def get_repository(workdir, size):
+    path = os.path.join(workdir, size.name)
+    if not os.path.exists(path):
+        generate_repository(path, size)
+    return path
+
+
+def remove_caches(path):
+    shutil.rmtree(os.path.join(path, ".git", "cactuskeeper"), ignore_errors=True)
+
+
+def run_cli(path, args, input=None):
+    result = CliRunner().invoke(cli, ["--repo", path] + args, input=input)
+    if result.exception is not None and not isinstance(result.exception, SystemExit):
+        raise result.exception
+
+
+def get_benchmarks(path):
+    """
+    Returns a dict mapping benchmark names to (setup, function) tuples.
+    """
+    repo = Repo(path)
+    release_branches = get_release_branches(repo)
+    oldest = str(release_branches[-1]["branch"])
+
+    def no_setup():
+        pass
+
+    return {
+        "get_release_branches": (no_setup, lambda: get_release_branches(repo)),
+        "get_bugfixes_for_branch": (
+            no_setup,
+            lambda: get_bugfixes_for_branch(repo, oldest, "master"),
+        ),
+        "get_bugfixes_for_branch (full history)": (
+            no_setup,
+            lambda: get_bugfixes_for_branch(repo, "master"),
+        ),
+        "get_latest_release_commit": (
+            no_setup,
+            lambda: get_latest_release_commit(repo, "master"),
+        ),
+        "check (cold cache)": (
+            lambda: remove_caches(path),
+            lambda: run_cli(path, ["check"]),
+        ),
+        "check (warm cache)": (no_setup, lambda: run_cli(path, ["check"])),
+        "check (pack reader)": (
+            lambda: remove_caches(path),
+            lambda: run_cli(path, ["--reader", "pack", "check"]),
+        ),
+        "check (async reader)": (
+            lambda: remove_caches(path),
+            lambda: run_cli(path, ["--reader", "async", "check"]),
+        ),
+        "check (stream reader)": (
+            lambda: remove_caches(path),
+            lambda: run_cli(path, ["--reader", "stream", "check"]),
+        ),
+        "release": (no_setup, lambda: run_cli(path, ["release"], input="n\n")),
+    }
+
+
+def time_benchmark(setup, function, repeat):
+    timings = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "runs": repeat,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the change of every benchmark compared to a baseline and returns
+    the names of the benchmarks which got slower than the threshold allows.
+    """
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if previous is None:
+            continue
+        ratio = result["min"] / previous["min"]
+        marker = ""
+        if ratio > threshold:
+            marker = "  REGRESSION"
+            regressions.append(name)
+        print("{0:45} {1:7.2f}x{2}".format(name, ratio, marker))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--workdir",
+        default=".benchmarks",
+        help="Directory the generated repositories are kept in",
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="A JSON result file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="Slowdown factor reported as a regression when comparing",
+    )
+    args = parser.parse_args()
+
+    size = SIZES[args.size]
+    path = get_repository(args.workdir, size)
+
+    git_version = subprocess.run(
+        ["git", "--version"], capture_output=True, text=True
+    ).stdout.strip()
+    results = {
+        "repository": size.name,
+        "python": platform.python_version(),
+        "git": git_version,
+        "benchmarks": {},
+    }
+
+    for name, (setup, function) in get_benchmarks(path).items():
+        result = time_benchmark(setup, function, args.repeat)
+        results["benchmarks"][name] = result
+        print(
+            "{0:45} min {1:8.4f}s  median {2:8.4f}s".format(
+                name, result["min"], result["median"]
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\nCompared to {0}:".format(args.compare))
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Measures the startup time of the ck command line with ``python -X importtime``.
+
+Commands which do not read the history, like ``--help``, ``config`` or the
+``client`` commands used from hooks, must not import GitPython or packaging.
+The import time of every module a command loads on top of the interpreter's
+own is summed up and compared against a budget.
+"""
+
+import argparse
+import subprocess
+import sys
+
+COMMANDS = [["--help"], ["config"], ["client", "--help"]]
+
+# only commands working on the history may import these
+HEAVY_MODULES = ["git", "packaging", "cactuskeeper.git"]
+
+
+def get_import_times(code, args=()):
+    """
+    Runs python code with ``-X importtime``.
+
+    :return:
+        A list of (name, depth, cumulative microseconds) tuples, one per import.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, *args],
+        capture_output=True,
+        text=True,
+    )
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(cumulative)))
+    return imports
+
+
+def measure_command(args, baseline):
+    """
+    Returns the import time of a ck command in seconds, not counting modules
+    in the baseline, and the names of all modules it imported.
+    """
+    imports = get_import_times("from cactuskeeper.cli import cli; cli()", args)
+    seconds = sum(
+        cumulative
+        for name, depth, cumulative in imports
+        if depth == 0 and name not in baseline
+    )
+    return seconds / 1e6, {name for name, _, _ in imports}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repo", default=".", help="The repository to run ck in")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.1,
+        help="The maximum import time of a command in seconds",
+    )
+    args = parser.parse_args()
+
+    baseline = {name for name, _, _ in get_import_times("pass")}
+
+    failed = False
+    for command in COMMANDS:
+        seconds, modules = measure_command(["--repo", args.repo] + command, baseline)
+        heavy = [name for name in HEAVY_MODULES if name in modules]
+        marker = ""
+        if seconds > args.budget:
+            marker = "  OVER BUDGET"
+        if heavy:
+            marker += "  IMPORTS " + ", ".join(heavy)
+        failed = failed or bool(marker)
+        print("ck {0:20} {1:8.4f}s{2}".format(" ".join(command), seconds, marker))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import asyncio
+import subprocess
+
+from cactuskeeper.readers import (
+    CommitRecord,
+    LOG_FORMAT,
+    parse_commit_object,
+    parse_log_record,
+)
+from cactuskeeper.stats import stats
+
+# the most output of a process buffered by the event loop before git is paused
+BUFFER_LIMIT = 8 * 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def start_git(git_dir, *args, stdin=False):
+    """
+    Starts a git process whose stdout and stderr are read by the event loop.
+
+    The event loop reads the output of all running processes whenever it
+    waits, so processes started ahead of their use run concurrently with the
+    ones being read, until ``BUFFER_LIMIT`` bytes of their output are buffered.
+    """
+    stats.count("git subprocesses")
+    command = ["git", "--git-dir", git_dir, *args]
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        limit=BUFFER_LIMIT,
+    )
+    # kept for error messages, like the args of a subprocess.Popen
+    process.args = command
+    return process
+
+
+async def stop_git(process):
+    """
+    Kills a git process if it is still running and waits for it to exit.
+    """
+    if process.returncode is None:
+        process.kill()
+    await process.wait()
+
+
+async def iter_records(process, separator=b"\0"):
+    """
+    Streams the separator terminated records a git process writes to stdout.
+
+    Records are yielded in blocks of all records completed by a chunk of
+    output, so consumers stepping the event loop for every block do not pay
+    for it on every record. The process is killed if the consumer stops early.
+
+    :raises subprocess.CalledProcessError:
+        If git fails.
+    """
+    complete = False
+    try:
+        buffer = b""
+        while True:
+            chunk = await process.stdout.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            *records, buffer = (buffer + chunk).split(separator)
+            if records:
+                yield records
+        complete = True
+    finally:
+        if not complete:
+            await stop_git(process)
+
+    stderr = await process.stderr.read()
+    await process.wait()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, process.args, stderr=stderr
+        )
+
+
+class CatFile:
+    """
+    A long-lived ``git cat-file --batch`` process, started on first use.
+    """
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.process = None
+
+    async def read(self, names):
+        """
+        Reads several objects at once. The requests are written while the
+        responses are read, so the pipes never fill up.
+
+        :param names:
+            The SHAs or other names of the objects.
+
+        :return:
+            A list with a ``(hexsha, type, data)`` tuple for every object,
+            or None for missing objects.
+        """
+        if self.process is None:
+            self.process = await start_git(
+                self.git_dir, "cat-file", "--batch", stdin=True
+            )
+
+        async def write():
+            self.process.stdin.write("".join(name + "\n" for name in names).encode())
+            await self.process.stdin.drain()
+
+        async def read_one():
+            header = (await self.process.stdout.readline()).split()
+            if len(header) != 3:
+                return None
+            data = await self.process.stdout.readexactly(int(header[2]) + 1)
+            return header[0].decode(), header[1].decode(), data[:-1]
+
+        async def read_all():
+            return [await read_one() for _ in names]
+
+        return (await asyncio.gather(write(), read_all()))[1]
+
+    async def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            await self.process.wait()
+            self.process = None
+
+
+class AsyncReader:
+    """
+    Reads commits like StreamReader, from ``git log`` and ``git cat-file``
+    processes driven by an asyncio event loop.
+
+    While a walk waits for output, the loop keeps reading the output of all
+    other running processes. Walks started ahead with ``prefetch`` therefore
+    run concurrently with the walk being consumed, without threads.
+    """
+
+    def __init__(self, repo):
+        self.git_dir = repo.git_dir
+        self.loop = asyncio.new_event_loop()
+        self._cat_file = CatFile(self.git_dir)
+        self._started = {}
+
+    def _log_args(self, rev, topo_order, grep):
+        revs = [str(r) for r in rev] if isinstance(rev, list) else [str(rev)]
+        options = ["--topo-order"] if topo_order else []
+        if grep is not None:
+            options.append("--grep=" + grep)
+        return ("log", "-z", LOG_FORMAT, *options, *revs, "--")
+
+    def prefetch(self, revs, topo_order=False, grep=None):
+        """
+        Starts the walks of several revisions, which are consumed later by
+        calling ``iter_commits`` with the same arguments.
+        """
+        for rev in revs:
+            args = self._log_args(rev, topo_order, grep)
+            if args not in self._started:
+                self._started[args] = self.loop.run_until_complete(
+                    start_git(self.git_dir, *args)
+                )
+
+    def iter_commits(self, rev, topo_order=False, grep=None):
+        """
+        Walks the history of one or more revisions, see ``StreamReader.iter_commits``.
+        """
+        args = self._log_args(rev, topo_order, grep)
+        process = self._started.pop(args, None)
+        if process is None:
+            process = self.loop.run_until_complete(start_git(self.git_dir, *args))
+
+        blocks = iter_records(process)
+        try:
+            while True:
+                try:
+                    block = self.loop.run_until_complete(blocks.__anext__())
+                except StopAsyncIteration:
+                    return
+                for record in block:
+                    yield parse_log_record(record)
+        finally:
+            self.loop.run_until_complete(blocks.aclose())
+
+    def commit(self, hexsha):
+        """
+        Loads a single commit through the ``git cat-file --batch`` process.
+
+        :param hexsha:
+            The SHA of the commit, abbreviated SHAs are accepted.
+
+        :return:
+            A CommitRecord or None if no such commit exists.
+        """
+        result = self.loop.run_until_complete(self._cat_file.read([hexsha]))[0]
+        if result is None or result[1] != "commit":
+            return None
+        parent_shas, timestamp, message = parse_commit_object(result[2])
+        return CommitRecord(result[0], parent_shas, message, timestamp)
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        # walks started ahead may never have been consumed
+        for process in self._started.values():
+            self.loop.run_until_complete(stop_git(process))
+        self._started = {}
+        self.loop.run_until_complete(self._cat_file.close())
+        self.loop.close()
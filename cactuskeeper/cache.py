@@ -0,0 +1,357 @@
+from bisect import bisect_left
+import hashlib
+import json
+import os
+import tempfile
+
+from cactuskeeper.git import ANALYSIS_VERSION, DEFAULT_PARSER, stats
+from cactuskeeper.messages import RELEASE_PATTERN
+
+CACHE_DIR = "cactuskeeper"
+
+
+def get_cache_path(repo, name):
+    """
+    Returns the path of a cache file inside the ``.git`` directory of a repository.
+
+    :param repo:
+        The repository the cache belongs to.
+    :param name:
+        The file name of the cache.
+
+    :return:
+        The path to the cache file or None if the repository has no git directory.
+    """
+    if repo.git_dir is None:
+        return None
+    return os.path.join(repo.git_dir, CACHE_DIR, name)
+
+
+class ShaCache:
+    """
+    A persistent mapping from commit SHAs to JSON serializable values.
+
+    Commits are immutable, so anything derived from a commit alone can be stored
+    forever. The stored data is discarded when ``version`` or the fingerprint
+    given on creation change, e.g. because the way the values are computed changed.
+    """
+
+    version = 1
+    filename = None
+
+    def __init__(self, path=None, fingerprint=""):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self.dirty = False
+
+        if path is not None:
+            self.load()
+
+    @classmethod
+    def for_repo(cls, repo, **kwargs):
+        """
+        Creates the cache stored in the git directory of a repository.
+        Keyword arguments are passed on to the constructor.
+        """
+        return cls(get_cache_path(repo, cls.filename), **kwargs)
+
+    def load(self):
+        try:
+            with stats.phase("cache io"), open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if (
+            data.get("version") == self.version
+            and data.get("fingerprint") == self.fingerprint
+        ):
+            self.restore(data)
+
+    def restore(self, data):
+        """
+        Takes over the stored data after it was loaded and validated.
+        """
+        self.entries = data["entries"]
+
+    def dump(self):
+        """
+        Returns the JSON serializable data to store.
+        """
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "entries": self.entries,
+        }
+
+    def get(self, hexsha):
+        return self.entries.get(hexsha)
+
+    def put(self, hexsha, value):
+        self.entries[hexsha] = value
+        self.dirty = True
+
+    def save(self):
+        """
+        Writes the cache to disk, if it has a path and was changed since loading.
+        The file is replaced atomically, so concurrent readers never see partial data.
+        """
+        if self.path is None or not self.dirty:
+            return
+
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+
+        with stats.phase("cache io"):
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.dump(), f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+class CommitCache(ShaCache):
+    """
+    Caches the parsed shortlog, issue and version of commits. The stored data
+    is only used with a MessageParser for the same issue patterns.
+    """
+
+    filename = "commits.json"
+
+    def __init__(self, path=None, parser=None):
+        pattern = (parser or DEFAULT_PARSER).pattern.pattern
+        fingerprint = hashlib.sha1(pattern.encode()).hexdigest()
+        super().__init__(path, fingerprint)
+
+
+class PatchIdCache(ShaCache):
+    """
+    Caches the stable patch-id of commits. Commits without a patch, like merges
+    or empty commits, are stored with an empty string.
+    """
+
+    filename = "patch-ids.json"
+
+    def __init__(self, path=None):
+        super().__init__(path, fingerprint="stable")
+
+
+def parse_version_query(query):
+    """
+    Parses a version query like ``3``, ``3.x``, ``3.1.x`` or ``3.1.2``.
+
+    :return:
+        A tuple of the version numbers the matching versions start with.
+    """
+    parts = query.lower().split(".")
+    if parts[-1] in ("x", "*"):
+        parts.pop()
+    try:
+        return tuple(int(part) for part in parts)
+    except ValueError:
+        raise ValueError("Invalid version query '{0}'".format(query)) from None
+
+
+class ReleaseIndex(ShaCache):
+    """
+    An index of release commits, mapping their SHAs to the released version.
+
+    For every indexed branch, the tip it was indexed at and the SHAs of its
+    release commits, newest first, are kept in ``branches``. Releases are
+    looked up by branch or by version without walking any history.
+    """
+
+    filename = "releases.json"
+
+    def __init__(self, path=None):
+        self.branches = {}
+        self._sorted = None
+        fingerprint = hashlib.sha1(RELEASE_PATTERN.encode()).hexdigest()
+        super().__init__(path, fingerprint)
+
+    def restore(self, data):
+        super().restore(data)
+        self.branches = data["branches"]
+
+    def dump(self):
+        return dict(super().dump(), branches=self.branches)
+
+    def put(self, hexsha, value):
+        super().put(hexsha, value)
+        self._sorted = None
+
+    def set_branch(self, name, tip, releases):
+        """
+        Stores the tip a branch was indexed at and its release commit SHAs.
+        """
+        self.branches[name] = {"tip": tip, "releases": releases}
+        self.dirty = True
+
+    def latest(self, branch):
+        """
+        Returns a tuple of SHA and version of the latest release on an indexed
+        branch, or None if there is none.
+        """
+        releases = self.branches[str(branch)]["releases"]
+        if not releases:
+            return None
+        return releases[0], self.entries[releases[0]]
+
+    def shared(self, branch, other):
+        """
+        Returns the SHA of the latest release commit on an indexed branch which
+        is also on another indexed branch, or None if they share no release.
+        """
+        others = set(self.branches[str(other)]["releases"])
+        for hexsha in self.branches[str(branch)]["releases"]:
+            if hexsha in others:
+                return hexsha
+        return None
+
+    def find(self, query=None):
+        """
+        Finds releases by version.
+
+        :param query:
+            A version query as understood by ``parse_version_query``,
+            all releases are returned if it is None.
+
+        :return:
+            A list of ``(version, hexsha, branches)`` tuples, newest version
+            first. ``branches`` lists the indexed branches containing the release.
+        """
+        if self._sorted is None:
+            self._sorted = sorted(
+                (tuple(int(n) for n in version.split(".") if n.isdigit()), sha)
+                for sha, version in self.entries.items()
+            )
+
+        prefix = parse_version_query(query) if query is not None else ()
+        start = bisect_left(self._sorted, (prefix,))
+        result = []
+        for numbers, sha in self._sorted[start:]:
+            if numbers[: len(prefix)] != prefix:
+                break
+            branches = sorted(
+                name
+                for name, state in self.branches.items()
+                if sha in state["releases"]
+            )
+            result.append((self.entries[sha], sha, branches))
+        result.reverse()
+        return result
+
+
+class FixIndex(ShaCache):
+    """
+    An index of bugfix commits, mapping their SHAs to the issue they fix.
+
+    Like in ReleaseIndex, the tip every indexed branch was indexed at and the
+    SHAs of its fix commits, newest first, are kept in ``branches``. The fixes
+    missing between indexed branches are found without walking any history.
+    The stored data is only used with a MessageParser for the same issue patterns.
+    """
+
+    filename = "fixes.json"
+
+    def __init__(self, path=None, parser=None):
+        self.branches = {}
+        pattern = (parser or DEFAULT_PARSER).pattern.pattern
+        fingerprint = hashlib.sha1(pattern.encode()).hexdigest()
+        super().__init__(path, fingerprint)
+
+    def restore(self, data):
+        super().restore(data)
+        self.branches = data["branches"]
+
+    def dump(self):
+        return dict(super().dump(), branches=self.branches)
+
+    def set_branch(self, name, tip, fixes):
+        """
+        Stores the tip a branch was indexed at and its fix commit SHAs.
+        """
+        self.branches[name] = {"tip": tip, "fixes": fixes}
+        self.dirty = True
+
+    def remove_branch(self, name):
+        if self.branches.pop(name, None) is not None:
+            self.dirty = True
+
+    def missing(self, branch, base, ignored_issues=(), branches=None):
+        """
+        Finds the fixes on an indexed branch which are missing on another one.
+
+        :param branches:
+            The branch states to use instead of ``branches``, e.g. a copy
+            taken before the index was updated.
+
+        :return:
+            A list of the SHAs of the fix commits on ``branch`` whose issue is
+            not fixed on ``base`` nor ignored, newest first and once per issue.
+        """
+        branches = self.branches if branches is None else branches
+        fixed = set(self.entries[sha] for sha in branches[base]["fixes"])
+        fixed.update(ignored_issues)
+        result = []
+        for hexsha in branches[branch]["fixes"]:
+            issue = self.entries[hexsha]
+            if issue not in fixed:
+                fixed.add(issue)
+                result.append(hexsha)
+        return result
+
+
+class CheckResultCache(ShaCache):
+    """
+    Caches the complete result of ``ck check``, keyed by ``result_key``.
+
+    Unlike commits, the branch tips a result was computed for move all the time,
+    so old results are never used again. Only the ``max_entries`` most recently
+    used results are kept. The stored results are only used with the same
+    ``ANALYSIS_VERSION`` and a MessageParser for the same issue patterns.
+    """
+
+    filename = "checks.json"
+
+    def __init__(self, path=None, parser=None, max_entries=64):
+        self.max_entries = max_entries
+        pattern = (parser or DEFAULT_PARSER).pattern.pattern
+        fingerprint = hashlib.sha1(
+            "{0}\n{1}".format(ANALYSIS_VERSION, pattern).encode()
+        ).hexdigest()
+        super().__init__(path, fingerprint)
+
+    @staticmethod
+    def result_key(tips, config, options):
+        """
+        Computes the key of a check result.
+
+        :param tips:
+            A dict mapping the names of the current branch and all release
+            branches to the SHAs of their tips.
+        :param config:
+            The ``cactuskeeper`` configuration section.
+        :param options:
+            A dict of the command line options changing the result.
+
+        :return:
+            A SHA1 hexdigest of all of them.
+        """
+        data = json.dumps([tips, config, options], sort_keys=True, default=str)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None and next(reversed(self.entries)) != key:
+            # dicts keep the insertion order, the least recently used entry comes first
+            self.entries[key] = self.entries.pop(key)
+            self.dirty = True
+        return value
+
+    def put(self, key, value):
+        self.entries.pop(key, None)
+        super().put(key, value)
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]
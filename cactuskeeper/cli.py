@@ -1,86 +1,515 @@
+from collections import namedtuple
+from contextlib import ExitStack
+from functools import partial
+import json
+import os
 import sys
+import time
 
 import click
-from git import Repo
 
+from cactuskeeper.client import get_default_socket_path, send_request
 from cactuskeeper.files import read_config_file
-from cactuskeeper.git import (
-    get_bugfixes_for_branch,
-    get_commits_since_commit,
-    get_latest_release_commit,
-    get_release_branches,
-)
+from cactuskeeper.readers import READERS
+from cactuskeeper.stats import stats
+
+# GitPython, packaging and the modules depending on them take a while to import.
+# They are imported inside the commands needing them, so that ``--help``,
+# ``config`` and the ``client`` commands used from hooks start quickly.
+
+
+def open_repo(path):
+    """
+    Opens a repository with GitPython, which is only imported on first use.
+    """
+    from git import Repo
+
+    return Repo(path)
+
+
+def echo_missing_fixes(base, branch, missing_fixes):
+    """
+    Prints the fixes on a branch which are missing on the base branch
+    together with the command to pick them.
+    """
+    click.echo(
+        "\nBranch '{other}' contains the following "
+        "fixes not present in '{base}' (newest first)".format(
+            base=base,
+            other=click.style(str(branch), fg="yellow"),
+        )
+    )
+
+    commits_to_pick = []
+
+    for commit in missing_fixes:
+        click.echo(
+            "\t({hexsha})\t{issue}\t{shortlog}".format(
+                shortlog=commit.shortlog,
+                issue=commit.issue,
+                hexsha=commit.hexsha[:11],
+            )
+        )
+        commits_to_pick.append(commit.hexsha[:11])
+
+    pick_command = "git cherry-pick -x " + " -x ".join(reversed(commits_to_pick))
+    click.echo(f"Pick them all using this command: '{pick_command}'")
+
+
+# a missing fix as plain data, which can be sent between processes
+MissingFix = namedtuple("MissingFix", ["hexsha", "issue", "shortlog"])
+
+
+def load_missing_fixes(missing):
+    """
+    Converts the missing fixes of a check result, see ``check_current_branch``,
+    to tuples of release branch name and list of MissingFix.
+    """
+    return [(branch, [MissingFix(*fix) for fix in fixes]) for branch, fixes in missing]
+
+
+def echo_shallow_warnings(cut_off):
+    """
+    Warns about the shallow clone boundaries the walks of a check stopped at.
+    """
+    for hexsha in cut_off:
+        click.echo(
+            "Warning: the history ends at {0} in this shallow clone, "
+            "older fixes were not checked.".format(hexsha[:11]),
+            err=True,
+        )
+
+
+def echo_check_result(base, missing, cut_off, quiet=False):
+    """
+    Prints the result of ``ck check`` and exits with 1 if fixes are missing.
+
+    :param base:
+        The checked branch.
+    :param missing:
+        A list of tuples of release branch name and list of MissingFix.
+    :param cut_off:
+        The SHAs of the shallow clone boundaries the walks stopped at.
+    :param quiet:
+        Print only the warnings about shallow clones.
+    """
+    if not quiet:
+        with stats.phase("output"):
+            for branch, missing_fixes in missing:
+                echo_missing_fixes(base, branch, missing_fixes)
+
+    echo_shallow_warnings(cut_off)
+
+    if missing:
+        sys.exit(1)
+    if not quiet:
+        click.echo("The current branch is clean")
+
+
+def check_repository(path, reader="gitpython", remote=None, match_patch_ids=False):
+    """
+    Runs ``check_current_branch`` on a repository, using the configuration in
+    the repository's own ``setup.cfg``. Used as the worker of ``check-many``.
+
+    :param path:
+        The path to the repository root.
+    :param reader:
+        The name of the commit reader to use.
+    :param remote:
+        The remote whose release branches are checked, see ``--remote``.
+    :param match_patch_ids:
+        Also match fixes by patch-id, see ``--patch-id``.
+
+    :return:
+        The result of ``check_current_branch`` with the ``path`` and an
+        ``error`` message if the repository could not be checked.
+    """
+    from cactuskeeper.git import check_current_branch
+
+    result = {"path": path, "branch": None, "missing": [], "cut_off": [], "error": None}
+    try:
+        config = read_config_file(path)
+        repo = open_repo(path)
+        try:
+            result.update(
+                check_current_branch(
+                    repo,
+                    config,
+                    reader,
+                    remote=remote,
+                    match_patch_ids=match_patch_ids,
+                )
+            )
+        finally:
+            repo.close()
+    except Exception as error:
+        result["error"] = "{0}: {1}".format(type(error).__name__, error)
+
+    return result
 
 
 @click.group()
 @click.option("--repo", default=".", help="Path to the repository root")
+@click.option(
+    "--reader",
+    type=click.Choice(sorted(READERS)),
+    default="gitpython",
+    help="The backend used to read commits from the repository",
+)
+@click.option(
+    "--remote",
+    help="Use the remote-tracking release branches of this remote instead of "
+    "the local ones",
+)
+@click.option(
+    "--timings",
+    is_flag=True,
+    default=False,
+    help="Print the time spent in each phase and event counters to stderr",
+)
+@click.option(
+    "--timings-json",
+    type=click.Path(dir_okay=False),
+    help="Write the timings and event counters as JSON to this file",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False),
+    help="Write a cProfile dump of the run to this file",
+)
 @click.pass_context
-def cli(context, repo):
+def cli(context, repo, reader, remote, timings, timings_json, profile):
     context.obj = {}
     context.obj["repo"] = repo
+    context.obj["reader"] = reader
+    context.obj["remote"] = remote
+
+    if timings or timings_json:
+        stats.reset()
+        stats.enabled = True
+        start = time.perf_counter()
+
+        def report_timings():
+            stats.enabled = False
+            stats.timings["total"] = time.perf_counter() - start
+            if timings:
+                click.echo("\nTimings:", err=True)
+                for name, seconds in stats.timings.items():
+                    click.echo("\t{0:24}{1:10.4f}s".format(name, seconds), err=True)
+                click.echo("Counters:", err=True)
+                for name, number in stats.counters.items():
+                    click.echo("\t{0:24}{1:10}".format(name, number), err=True)
+            if timings_json:
+                with open(timings_json, "w") as f:
+                    json.dump(stats.as_dict(), f, indent=2)
+
+        context.call_on_close(report_timings)
+
+    if profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+        def dump_profile():
+            profiler.disable()
+            profiler.dump_stats(profile)
+
+        context.call_on_close(dump_profile)
+        profiler.enable()
 
-    context.obj["config"] = read_config_file(repo)
+    try:
+        context.obj["config"] = read_config_file(repo)
+    except ValueError as error:
+        raise click.ClickException(str(error))
 
 
 @cli.command()
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of release branches to analyse concurrently",
+)
+@click.option(
+    "--patch-id",
+    "match_patch_ids",
+    is_flag=True,
+    default=False,
+    help="Also treat fixes as present if a commit with the same patch-id "
+    "exists on the current branch",
+)
+@click.option(
+    "--quiet",
+    "-q",
+    is_flag=True,
+    default=False,
+    help="Print nothing and stop at the first missing fix, only set the exit code",
+)
+@click.option(
+    "--max-depth",
+    type=click.IntRange(min=1),
+    help="Walk at most this many commits per branch",
+)
+@click.option(
+    "--since",
+    type=click.DateTime(),
+    help="Do not walk commits committed before this date",
+)
+@click.option(
+    "--full-history",
+    is_flag=True,
+    default=False,
+    help="Walk the whole history, ignoring --max-depth, --since and their settings",
+)
+@click.option(
+    "--stop-at-shared-release",
+    is_flag=True,
+    default=False,
+    help="Do not look for fixed issues on the current branch beyond the oldest "
+    "release it shares with a release branch. Faster, but issues fixed before "
+    "that release and fixed again on a release branch are reported as missing",
+)
 @click.pass_context
-def check(context):
+def check(
+    context,
+    jobs,
+    match_patch_ids,
+    quiet,
+    max_depth,
+    since,
+    full_history,
+    stop_at_shared_release,
+):
     """
     Checks if the current branch is clean.
     A branch is considered clean, if no previous release branches
     contain fixes not present on this branch.
     """
-    repo = Repo(context.obj["repo"])
+    from cactuskeeper.git import check_current_branch
+
+    repo = open_repo(context.obj["repo"])
+    try:
+        result = check_current_branch(
+            repo,
+            context.obj["config"],
+            context.obj["reader"],
+            remote=context.obj["remote"],
+            match_patch_ids=match_patch_ids,
+            max_depth=max_depth,
+            since=since,
+            full_history=full_history,
+            stop_at_shared_release=stop_at_shared_release,
+            quiet=quiet,
+            jobs=jobs,
+            open_repo=lambda: open_repo(context.obj["repo"]),
+        )
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+    echo_check_result(
+        result["branch"],
+        load_missing_fixes(result["missing"]),
+        result["cut_off"],
+        quiet,
+    )
+
+
+@cli.command()
+@click.pass_context
+def hook(context):
+    """
+    Reports the fixes which became missing or present with a ref update, for
+    use in git hooks. The updates are read from stdin in the format git passes
+    them to the pre-receive, post-receive, reference-transaction and pre-push
+    hooks. After a merge, pass ``<ORIG_HEAD> <HEAD> <ref>``.
+
+    The fixes of every branch are stored and only the commits added since the
+    last run are walked, new branches and branches rewritten by a force-push
+    are seeded from the indexed branch they share the most history with.
+    Branches which do not exist anymore are forgotten.
+
+    Exits with 1 if a fix became missing on an updated branch, the updates
+    are not stored then, so retrying them fails again. Fixes which became
+    missing on other branches, e.g. because a fix was pushed to a release
+    branch, are only reported.
+    """
+    from cactuskeeper.cache import CommitCache, FixIndex
+    from cactuskeeper.git import (
+        get_branches_to_check,
+        get_release_branches,
+        load_metadata,
+        parse_ref_updates,
+        update_fix_index,
+        ZERO_SHA,
+    )
+    from cactuskeeper.messages import MessageParser
+    from cactuskeeper.refs import iter_refs
+
+    parser = MessageParser(context.obj["config"]["issue_patterns"])
+    repo = open_repo(context.obj["repo"])
+    cache = CommitCache.for_repo(repo, parser=parser)
+    index = FixIndex.for_repo(repo, parser=parser)
+    reader = READERS[context.obj["reader"]](repo)
     ignored_issues = set(context.obj["config"]["ignore_issues"])
-    current_branch = repo.active_branch
     release_branches = get_release_branches(repo)
 
-    branches_to_check = []
-    for branch in reversed(release_branches):
-        if current_branch == branch["branch"]:
-            break
+    previous = dict(index.branches)
+    updates = parse_ref_updates(click.get_text_stream("stdin"))
+    for _, new, name in updates:
+        if new == ZERO_SHA:
+            index.remove_branch(name)
         else:
-            branches_to_check.append(branch)
+            update_fix_index(repo, index, name, new, cache, reader, parser)
+    # the fixes of the release branches are needed, even if they were not pushed
+    pushed = set(name for _, _, name in updates)
+    for branch in release_branches:
+        if branch["name"] not in pushed:
+            update_fix_index(repo, index, branch["name"], None, cache, reader, parser)
+    # forget branches which were deleted without a hook seeing it, e.g. merged ones
+    existing = pushed | set(
+        name[len("refs/heads/") :] for name, _ in iter_refs(repo.git_dir, "refs/heads/")
+    )
+    for name in list(index.branches):
+        if name not in existing:
+            index.remove_branch(name)
 
-    fixes_on_base = set(get_bugfixes_for_branch(repo, current_branch).keys())
+    # only pairs of branches with an updated one can have changed
+    updated = set(
+        name
+        for name, state in index.branches.items()
+        if state["tip"] != previous.get(name, {}).get("tip")
+    )
+    pairs = [
+        (base, branch["name"])
+        for base in sorted(index.branches)
+        for branch in get_branches_to_check(release_branches, base)
+        if branch["name"] in index.branches and {base, branch["name"]} & updated
+    ]
 
-    clean = True
-    for branch in branches_to_check:
-        fixes = get_bugfixes_for_branch(repo, branch["branch"], current_branch)
-        missing_fixes = fixes.keys() - fixes_on_base - ignored_issues
-        if len(missing_fixes) > 0:
-            clean = False
-            click.echo(
-                "\nBranch '{other}' contains the following "
-                "fixes not present in '{base}' (newest first)".format(
-                    base=current_branch,
-                    other=click.style(str(branch["branch"]), fg="yellow"),
+    newly_missing = False
+    with stats.phase("output"):
+        for base, branch in pairs:
+            missing = index.missing(branch, base, ignored_issues)
+            known = []
+            if base in previous and branch in previous:
+                known = index.missing(branch, base, ignored_issues, previous)
+            set_of_known, set_of_missing = set(known), set(missing)
+            added = [hexsha for hexsha in missing if hexsha not in set_of_known]
+            removed = [hexsha for hexsha in known if hexsha not in set_of_missing]
+            if added:
+                # only the pushed branches are to blame, others are just reported
+                newly_missing = newly_missing or base in pushed
+                echo_missing_fixes(
+                    base,
+                    branch,
+                    [load_metadata(repo, h, cache, reader, parser) for h in added],
                 )
-            )
-
-            commits_to_pick = []
-
-            fixes_keys = list(fixes.keys())
-            for issue_number in sorted(
-                missing_fixes, key=lambda x: fixes_keys.index(x)
-            ):
-                commit = fixes[issue_number]
+            if removed:
                 click.echo(
-                    "\t({hexsha})\t{issue}\t{shortlog}".format(
-                        shortlog=commit.shortlog,
-                        issue=commit.issue,
-                        hexsha=commit.object.hexsha[:11],
-                    )
+                    "\nThe following fixes from '{branch}' are now present "
+                    "in '{base}'".format(branch=branch, base=base)
                 )
-                commits_to_pick.append(commit.object.hexsha[:11])
+                for hexsha in removed:
+                    commit = load_metadata(repo, hexsha, cache, reader, parser)
+                    click.echo(
+                        "\t({hexsha})\t{issue}\t{shortlog}".format(
+                            shortlog=commit.shortlog,
+                            issue=commit.issue,
+                            hexsha=commit.hexsha[:11],
+                        )
+                    )
 
-            pick_command = "git cherry-pick -x " + " -x ".join(
-                reversed(commits_to_pick)
-            )
-            click.echo(f"Pick them all using this command: '{pick_command}'")
-    if clean:
+    if newly_missing:
+        # the updates are rejected, so a retry is compared against the same state
+        for _, _, name in updates:
+            if name in previous:
+                index.set_branch(name, **previous[name])
+            else:
+                index.remove_branch(name)
+
+    reader.close()
+    cache.save()
+    index.save()
+    if newly_missing:
+        sys.exit(1)
+
+
+@cli.command()
+@click.option(
+    "--patch-id",
+    "match_patch_ids",
+    is_flag=True,
+    default=False,
+    help="Do not pick fixes with the same patch-id as a commit on the current branch",
+)
+@click.pass_context
+def sync(context, match_patch_ids):
+    """
+    Picks the fixes missing on the current branch onto it, like the
+    ``git cherry-pick -x`` command printed by ``check``.
+
+    The new commits are created from the object database alone, without
+    checking out anything for every fix, and the branch is moved once at the
+    end. Only the files changed by the fixes are updated in the working tree.
+    If a fix does not apply cleanly, the fixes before it are kept and the
+    command to pick the remaining ones is printed.
+    """
+    from subprocess import CalledProcessError
+
+    from cactuskeeper.git import pick_commits, update_branch
+
+    result = check_repository(
+        context.obj["repo"],
+        context.obj["reader"],
+        context.obj["remote"],
+        match_patch_ids,
+    )
+    if result["error"]:
+        raise click.ClickException(result["error"])
+    echo_shallow_warnings(result["cut_off"])
+
+    # oldest release branch and oldest fix first, every issue only once
+    fixes = []
+    issues = set()
+    for _, missing_fixes in load_missing_fixes(result["missing"]):
+        for fix in reversed(missing_fixes):
+            if fix.issue not in issues:
+                issues.add(fix.issue)
+                fixes.append(fix)
+    if not fixes:
         click.echo("The current branch is clean")
-    else:
+        return
+
+    repo = open_repo(context.obj["repo"])
+    old = repo.head.commit.hexsha
+    try:
+        new, conflict = pick_commits(repo, old, [fix.hexsha for fix in fixes])
+        if new != old:
+            update_branch(repo, result["branch"], old, new)
+    except CalledProcessError as error:
+        raise click.ClickException(
+            "Could not pick the fixes: {0}".format(error.stderr.decode().strip())
+        )
+    finally:
+        repo.close()
+
+    picked = [fix.hexsha for fix in fixes].index(conflict) if conflict else len(fixes)
+    if picked:
+        click.echo("Picked the following fixes onto '{0}':".format(result["branch"]))
+        for fix in fixes[:picked]:
+            click.echo(
+                "\t({hexsha})\t{issue}\t{shortlog}".format(
+                    shortlog=fix.shortlog, issue=fix.issue, hexsha=fix.hexsha[:11]
+                )
+            )
+    if conflict:
+        remaining = [fix.hexsha[:11] for fix in fixes[picked:]]
+        click.echo(
+            "The fix {0} {1} does not apply cleanly. Pick the remaining fixes "
+            "using this command: 'git cherry-pick -x {2}'".format(
+                remaining[0], fixes[picked].issue, " -x ".join(remaining)
+            )
+        )
         sys.exit(1)
 
 
@@ -90,36 +519,42 @@ def check(context):
 )
 @click.pass_context
 def release(context, no_check):
-    repo = Repo(context.obj["repo"])
+    from cactuskeeper.cache import CommitCache, ReleaseIndex
+    from cactuskeeper.git import BranchHistory, update_release_index
+    from cactuskeeper.messages import MessageParser
+
+    parser = MessageParser(context.obj["config"]["issue_patterns"])
+    repo = open_repo(context.obj["repo"])
+    cache = CommitCache.for_repo(repo, parser=parser)
+    index = ReleaseIndex.for_repo(repo)
+    reader = READERS[context.obj["reader"]](repo)
 
     current_branch = repo.active_branch
 
-    release = get_latest_release_commit(repo, current_branch)
+    update_release_index(repo, index, current_branch, reader=reader)
+    index.save()
+    latest = index.latest(current_branch)
+    if latest is None:
+        raise click.ClickException("No release found on the branch")
+    base_commit, version = latest
 
     click.echo(
-        "The last release on the branch is {0}.".format(
-            click.style(release.version, fg="red")
-        )
+        "The last release on the branch is {0}.".format(click.style(version, fg="red"))
     )
     changelog_confirmed = False
-    base_commit = release.object.hexsha
+    # walked once, so entering another base commit does not walk the history again
+    history = BranchHistory(repo, current_branch, cache, reader, parser)
 
     while not changelog_confirmed:
         click.echo("This is the release log:")
-        commits = get_commits_since_commit(repo, current_branch, base_commit)
-        not_found = False
+        commits = history.commits_since(base_commit)
+        not_found = commits is None
 
-        if len(commits) == 0:
+        if not_found:
+            click.echo("The specified commit was not found.")
+        elif len(commits) == 0:
             click.echo("Last commit is already a release.")
             break
-
-        # check if the specified base_commit is actually in the parents of the last found commit
-        # otherwise we went until the end of the branch and did not find it
-        if not any(
-            c.hexsha.startswith(base_commit) for c in commits[-1].object.parents
-        ):
-            click.echo("The specified commit was not found.")
-            not_found = True
         else:
             for commit in commits:
                 click.echo(
@@ -133,6 +568,306 @@ def release(context, no_check):
         else:
             changelog_confirmed = True
 
+    history.close()
+    reader.close()
+    cache.save()
+
+
+@cli.command()
+@click.argument("version", required=False)
+@click.pass_context
+def releases(context, version):
+    """
+    Lists the releases on the release branches and the current branch, newest
+    first. VERSION limits the list to a version range like 3.x or 3.1.x.
+    """
+    from cactuskeeper.cache import ReleaseIndex
+    from cactuskeeper.git import get_release_branches, update_release_index
+
+    repo = open_repo(context.obj["repo"])
+    index = ReleaseIndex.for_repo(repo)
+    reader = READERS[context.obj["reader"]](repo)
+
+    release_branches = get_release_branches(repo, remote=context.obj["remote"])
+    branches = [branch["branch"] for branch in release_branches]
+    branches.append(repo.active_branch)
+    for branch in branches:
+        update_release_index(repo, index, branch, reader=reader)
+    reader.close()
+    index.save()
+
+    try:
+        found = index.find(version)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="VERSION")
+
+    if not found:
+        click.echo("No releases found.")
+    for release_version, hexsha, names in found:
+        click.echo(
+            "{0}\t({1})\t{2}".format(
+                click.style(release_version, fg="red"), hexsha[:11], ", ".join(names)
+            )
+        )
+
+
+@cli.command("check-many")
+@click.argument("paths", nargs=-1, type=click.Path(file_okay=False))
+@click.option(
+    "--scan",
+    type=click.Path(exists=True, file_okay=False),
+    help="Also check every repository directly inside this directory",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=os.cpu_count(),
+    show_default=True,
+    help="Number of repositories to check concurrently",
+)
+@click.option(
+    "--patch-id",
+    "match_patch_ids",
+    is_flag=True,
+    default=False,
+    help="Also treat fixes as present if a commit with the same patch-id "
+    "exists on the current branch",
+)
+@click.pass_context
+def check_many(context, paths, scan, jobs, match_patch_ids):
+    """
+    Checks several repositories like ``check`` in a pool of processes.
+    Every repository is checked on its active branch with its own configuration.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    paths = list(paths)
+    if scan:
+        for name in sorted(os.listdir(scan)):
+            path = os.path.join(scan, name)
+            if os.path.exists(os.path.join(path, ".git")):
+                paths.append(path)
+
+    worker = partial(
+        check_repository,
+        reader=context.obj["reader"],
+        remote=context.obj["remote"],
+        match_patch_ids=match_patch_ids,
+    )
+    clean = failed = 0
+    with ExitStack() as stack:
+        if jobs == 1:
+            results = map(worker, paths)
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+            results = executor.map(worker, paths)
+
+        # results arrive in the order of the paths as soon as they are ready
+        for result in results:
+            click.echo(
+                "\n== {path} ({branch}) ==".format(
+                    path=click.style(result["path"], bold=True),
+                    branch=result["branch"],
+                )
+            )
+            if result["error"]:
+                failed += 1
+                click.echo("Could not check the repository: " + result["error"])
+            elif not result["missing"]:
+                clean += 1
+                click.echo("The current branch is clean")
+            for branch, missing_fixes in load_missing_fixes(result["missing"]):
+                echo_missing_fixes(result["branch"], branch, missing_fixes)
+            echo_shallow_warnings(result["cut_off"])
+
+    unclean = len(paths) - clean - failed
+    click.echo(
+        "\n{0} repositories checked: {1} clean, {2} with missing fixes, "
+        "{3} failed".format(len(paths), clean, unclean, failed)
+    )
+    if clean != len(paths):
+        sys.exit(1)
+
+
+@cli.command()
+@click.pass_context
+def matrix(context):
+    """
+    Shows the fixes missing between every pair of release branches.
+    """
+    from cactuskeeper.cache import CommitCache
+    from cactuskeeper.git import get_release_branches, get_release_matrix
+    from cactuskeeper.messages import MessageParser
+
+    parser = MessageParser(context.obj["config"]["issue_patterns"])
+    repo = open_repo(context.obj["repo"])
+    cache = CommitCache.for_repo(repo, parser=parser)
+    reader = READERS[context.obj["reader"]](repo)
+    ignored_issues = set(context.obj["config"]["ignore_issues"])
+    release_branches = get_release_branches(repo, remote=context.obj["remote"])
+
+    missing_fixes = get_release_matrix(
+        repo,
+        release_branches,
+        ignored_issues,
+        cache=cache,
+        reader=reader,
+        parser=parser,
+    )
+    reader.close()
+    cache.save()
+
+    if not release_branches:
+        click.echo("No release branches found.")
+        return
+
+    names = [str(branch["branch"]) for branch in release_branches]
+    width = max(len(name) for name in names)
+
+    click.echo(
+        "Number of fixes missing on the branch of each row, "
+        "which are present on the branch of each column:\n"
+    )
+    click.echo(" " * width + "".join("  " + name for name in names))
+    for target in names:
+        cells = [
+            "-" if source == target else str(len(missing_fixes[(source, target)]))
+            for source in names
+        ]
+        click.echo(
+            target.ljust(width)
+            + "".join("  " + cell.rjust(len(name)) for cell, name in zip(cells, names))
+        )
+
+    for (source, target), commits in missing_fixes.items():
+        if not commits:
+            continue
+        click.echo(
+            "\nBranch '{target}' is missing the following fixes "
+            "from '{source}' (newest first)".format(
+                target=click.style(target, fg="yellow"), source=source
+            )
+        )
+        for commit in commits:
+            click.echo(
+                "\t({hexsha})\t{issue}\t{shortlog}".format(
+                    shortlog=commit.shortlog,
+                    issue=commit.issue,
+                    hexsha=commit.hexsha[:11],
+                )
+            )
+
+
+def get_socket_path(socket_path):
+    """
+    Returns the given socket path or the default one for the current user.
+    """
+    if socket_path is not None:
+        return socket_path
+    try:
+        return get_default_socket_path()
+    except OSError as error:
+        raise click.ClickException(str(error))
+
+
+@cli.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    help="Path of the Unix socket to listen on, by default in $XDG_RUNTIME_DIR "
+    "or in a directory private to the user",
+)
+@click.pass_context
+def serve(context, socket_path):
+    """
+    Runs a daemon answering the queries of ``ck client``. It keeps the state
+    of the queried repositories in memory, so repeated queries are fast.
+    """
+    from cactuskeeper.server import Server
+
+    socket_path = get_socket_path(socket_path)
+    try:
+        server = Server(socket_path, context.obj["reader"])
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+    with server:
+        click.echo("Listening on {0}".format(socket_path))
+        server.serve_forever()
+
+
+@cli.command()
+@click.argument(
+    "command", type=click.Choice(["check", "release-log", "config", "shutdown"])
+)
+@click.option("--base", help="The base commit of the release log")
+@click.option(
+    "--patch-id",
+    "match_patch_ids",
+    is_flag=True,
+    default=False,
+    help="Also treat fixes as present if a commit with the same patch-id "
+    "exists on the current branch",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    help="Path of the Unix socket of the daemon, by default the one of ck serve",
+)
+@click.pass_context
+def client(context, command, base, match_patch_ids, socket_path):
+    """
+    Queries a running ``ck serve`` daemon about the repository.
+    """
+    socket_path = get_socket_path(socket_path)
+    request = {"command": command, "repo": os.path.abspath(context.obj["repo"])}
+    if base:
+        request["base"] = base
+    if context.obj["remote"]:
+        request["remote"] = context.obj["remote"]
+    if match_patch_ids:
+        request["patch_id"] = True
+
+    try:
+        response = send_request(socket_path, request)
+    except OSError as error:
+        raise click.ClickException(
+            "Could not connect to '{0}', is ck serve running? ({1})".format(
+                socket_path, error
+            )
+        )
+    if "error" in response:
+        raise click.ClickException(response["error"])
+
+    if command == "check":
+        echo_check_result(
+            response["branch"],
+            load_missing_fixes(response["missing"]),
+            response["cut_off"],
+        )
+
+    elif command == "release-log":
+        click.echo(
+            "The last release on the branch is {0}.".format(
+                click.style(response["version"], fg="red")
+            )
+        )
+        if not response["found"]:
+            click.echo("The specified commit was not found.")
+        elif not response["commits"]:
+            click.echo("Last commit is already a release.")
+        else:
+            click.echo("This is the release log:")
+            for shortlog, issue in response["commits"]:
+                click.echo(
+                    "\t{shortlog} {issue}".format(shortlog=shortlog, issue=issue)
+                )
+
+    elif command == "config":
+        click.echo("Running with the following configuration:\n")
+        for key, value in response["config"].items():
+            click.echo("\t{0}: {1}".format(key, value))
+
 
 @cli.command()
 @click.pass_context
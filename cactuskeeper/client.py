@@ -0,0 +1,64 @@
+import json
+import os
+import socket
+import stat
+import tempfile
+
+
+def get_default_socket_path():
+    """
+    Returns the default path of the ``ck serve`` socket for the current user.
+
+    The socket is put into ``$XDG_RUNTIME_DIR``, which only the user can access.
+    Without it, a directory private to the user is created in the temporary
+    directory, as other users could take over a socket at a predictable path.
+
+    :raises PermissionError:
+        If the directory in the temporary directory exists, but is not private.
+    """
+    directory = os.environ.get("XDG_RUNTIME_DIR")
+    if directory:
+        return os.path.join(directory, "cactuskeeper-{0}.sock".format(os.getuid()))
+
+    directory = os.path.join(
+        tempfile.gettempdir(), "cactuskeeper-{0}".format(os.getuid())
+    )
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    # the directory may have been created by another user before
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise PermissionError(
+            "'{0}' is not a directory only the current user can access".format(
+                directory
+            )
+        )
+    return os.path.join(directory, "ck.sock")
+
+
+def send_request(socket_path, request):
+    """
+    Sends a request to a running ``ck serve`` daemon and returns its response.
+
+    Requests and responses are single lines of JSON. This module only depends
+    on the standard library, so clients start quickly.
+
+    :param socket_path:
+        The path of the daemon's Unix socket.
+    :param request:
+        A JSON serializable dict with at least a ``command`` key.
+
+    :return:
+        The decoded response dict.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(json.dumps(request).encode() + b"\n")
+        with connection.makefile("rb") as response:
+            return json.loads(response.readline())
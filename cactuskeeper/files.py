@@ -1,6 +1,8 @@
 import configparser
 import os
 
+from cactuskeeper.messages import ISSUE_PATTERNS, MessageParser
+
 
 def read_config_file(directory):
     """
@@ -13,6 +15,9 @@ def read_config_file(directory):
 
     :return:
         A dict holding the cactuskeeper configuration.
+
+    :raises ValueError:
+        If the configured issue patterns are invalid.
     """
     path = os.path.join(directory, "setup.cfg")
     parser = configparser.ConfigParser()
@@ -32,4 +37,13 @@ def read_config_file(directory):
     # prune out empty ones
     config["ignore_issues"] = [_ for _ in config["ignore_issues"] if _]
 
+    # one regular expression per line
+    config["issue_patterns"] = config.get("issue_patterns", "").split("\n")
+    # prune out empty ones, without any issue numbers like #123 are matched
+    config["issue_patterns"] = [_ for _ in config["issue_patterns"] if _]
+    if not config["issue_patterns"]:
+        config["issue_patterns"] = list(ISSUE_PATTERNS)
+    # report invalid patterns once here, instead of failing in every command
+    MessageParser(config["issue_patterns"])
+
     return config
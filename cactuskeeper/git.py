@@ -1,29 +1,82 @@
 from collections import OrderedDict
-from itertools import takewhile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice, takewhile
+from git import GitCommandError, Repo
 from packaging.version import Version
+import os
 import re
+import subprocess
+import tempfile
+import time
+
+from cactuskeeper.messages import MessageParser
+from cactuskeeper.readers import CommitRecord, READERS
+from cactuskeeper.refs import iter_refs, read_shallow_commits
+from cactuskeeper.stats import stats
+from cactuskeeper.table import CommitTable
 
 RELEASE_BRANCHES = re.compile(r"release/v(?P<version>\d+\.\d+(\.\d+)?)")
 
-COMMIT_REGEX = re.compile(
-    r"^(?P<shortlog>(release: v(?P<version>(\d+)\.(\d+)\.(\d)))|.+)"
-    r"[^#]*(?P<issue>#\d+)?"
-)
+DEFAULT_PARSER = MessageParser()
+
+# the SHA git uses for the missing side of created and deleted refs
+ZERO_SHA = "0" * 40
+
+# the most commit messages parsed in one block
+MAX_PARSE_BLOCK = 1024
+
+# the version of the analysis of ``check_current_branch``, stored check results
+# of other versions are discarded, so it must be increased with every change of
+# the results
+ANALYSIS_VERSION = 1
+
+# the date formats of the ``since`` setting, the same as for ``--since``
+SINCE_FORMATS = ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+def parse_messages(messages, parser=None):
+    """
+    Parses a block of commit messages, see ``MessageParser.parse``.
+
+    :param parser:
+        The MessageParser to use, defaults to one for ``#123`` issue numbers.
+    """
+    if stats.enabled:
+        start = time.perf_counter()
+
+    result = (parser or DEFAULT_PARSER).parse(messages)
+
+    if stats.enabled:
+        stats.record("commit parsing", time.perf_counter() - start)
+        stats.count("commits parsed", len(messages))
+    return result
 
 
 class CommitMetadata:
-    def __init__(self, commit):
-        self.shortlog = commit.message.split("\n")[0].strip()
-        self.object = commit
-        self.version = ""
-        self.issue = ""
-
-        m = COMMIT_REGEX.match(commit.message)
-        if m is not None:  # pragma: no cover, the regex matches everything
-            if m.group("issue"):
-                self.issue = m.group("issue")
-            if m.group("version"):
-                self.version = m.group("version")
+    """
+    The SHA, shortlog, issue and version of a commit. The commit object itself
+    is not kept, so walks do not hold on to the data of every commit.
+    """
+
+    __slots__ = ("hexsha", "shortlog", "issue", "version")
+
+    def __init__(self, commit, cache=None, parser=None, parsed=None):
+        self.hexsha = commit.hexsha
+
+        if parsed is None and cache is not None:
+            cached = cache.get(self.hexsha)
+            if cached is not None:
+                self.shortlog, self.issue, self.version = cached
+                stats.count("cache hits")
+                return
+
+        if parsed is None:
+            parsed = parse_messages([commit.message], parser)[0]
+        self.shortlog, self.issue, self.version = parsed
+
+        if cache is not None:
+            cache.put(self.hexsha, [self.shortlog, self.issue, self.version])
 
     def next_version(self, step="bugfix"):
         """
@@ -58,19 +111,90 @@ class CommitMetadata:
         return ".".join(map(lambda x: str(x), [major, minor, bugfix]))
 
 
-def get_release_branches(repo, release_branch_re=RELEASE_BRANCHES):
+def get_literal_prefix(pattern):
+    """
+    Returns the literal text every match of a regular expression starts with.
+    """
+    prefix = ""
+    for char in pattern.lstrip("^"):
+        if char in "*+?{":
+            # the previous character is optional or repeated
+            return prefix[:-1]
+        if char in ".$[]\\|()":
+            break
+        prefix += char
+    return prefix
+
+
+def get_release_branches(repo, release_branch_re=RELEASE_BRANCHES, remote=None):
+    """
+    Finds the release branches of a repository.
+
+    The refs are read from the git directory. Only refs starting with the
+    literal prefix of ``release_branch_re`` are considered at all, so the
+    number of other branches hardly matters.
+
+    :param repo:
+        The repository to process.
+    :param release_branch_re:
+        The regular expression matching release branch names. It must have a
+        ``version`` group.
+    :param remote:
+        If given, the remote-tracking release branches of this remote are
+        returned instead of the local ones.
+
+    :return:
+        A list of dicts, newest version first. ``version`` is the version of
+        the branch, ``name`` the name of the branch and ``branch`` the revision
+        to use for it, which includes the remote for remote-tracking branches.
+    """
     release_branches = []
+    base = "refs/remotes/{0}/".format(remote) if remote else "refs/heads/"
+
+    with stats.phase("ref enumeration"):
+        if repo.git_dir is None:
+            names = [str(branch) for branch in repo.branches]
+        else:
+            prefix = base + get_literal_prefix(release_branch_re.pattern)
+            names = [name[len(base) :] for name, _ in iter_refs(repo.git_dir, prefix)]
 
-    for branch in repo.branches:
-        m = release_branch_re.match(str(branch))
-        if m:
-            version = Version(m.group("version"))
-            release_branches.append({"version": version, "branch": branch})
+        for name in names:
+            m = release_branch_re.match(name)
+            if m:
+                release_branches.append(
+                    {
+                        "version": Version(m.group("version")),
+                        "name": name,
+                        "branch": "{0}/{1}".format(remote, name) if remote else name,
+                    }
+                )
 
     return sorted(release_branches, key=lambda x: x["version"], reverse=True)
 
 
-def get_latest_release_commit(repo, branch):
+def get_branches_to_check(release_branches, current_branch):
+    """
+    Selects the release branches whose fixes must be present on a branch.
+
+    :param release_branches:
+        The release branches as returned by ``get_release_branches``.
+    :param current_branch:
+        The branch to check.
+
+    :return:
+        The release branches older than ``current_branch``, oldest first. All
+        release branches if ``current_branch`` is not a release branch.
+    """
+    branches_to_check = []
+    for branch in reversed(release_branches):
+        if str(current_branch) == branch["name"]:
+            break
+        else:
+            branches_to_check.append(branch)
+    return branches_to_check
+
+
+def get_latest_release_commit(repo, branch, reader=None):
     """
     Finds the lates release commit in a repo on a given branch.
 
@@ -78,52 +202,1141 @@ def get_latest_release_commit(repo, branch):
         The repository to process.
     :param branch:
         The branch on which the function should look for commits.
+    :param reader:
+        The commit reader used to walk the history, see ``cactuskeeper.readers``.
+        Defaults to iterating the commits of ``repo`` directly.
 
     :return:
         A CommitMetadata object for the latest release commit or
         None if no release commit could be found.
     """
 
-    for commit in repo.iter_commits(branch):
-        if commit.message.startswith("release:"):
-            return CommitMetadata(commit)
+    with stats.phase("history walk"):
+        for commit in (reader or repo).iter_commits(branch):
+            stats.count("commits walked")
+            if commit.message.startswith("release:"):
+                return CommitMetadata(commit)
 
     # no release found
     return None
 
 
-def get_commits_while(repo, branch, test):
-    if test is not None:
-        commit_iterator = takewhile(test, repo.iter_commits(branch))
+def get_new_commits_range(repo, indexed_tip, tip):
+    """
+    Returns the revision range of the commits added to a branch since it was
+    indexed at ``indexed_tip``.
+
+    :return:
+        The range ``indexed_tip..tip`` or None if the branch was not indexed
+        yet or its history was rewritten since, e.g. by a force-push, and it
+        must be indexed from scratch.
+    """
+    if indexed_tip is None:
+        return None
+    try:
+        fast_forward = repo.is_ancestor(indexed_tip, tip)
+    except GitCommandError:
+        # the old tip does not exist anymore
+        fast_forward = False
+    return "{0}..{1}".format(indexed_tip, tip) if fast_forward else None
+
+
+def find_fix_index_seed(repo, index, tip):
+    """
+    Finds the indexed branch a branch not indexed yet can take its fixes from,
+    so that only the commits since their merge base must be walked.
+
+    :param repo:
+        The repository to process.
+    :param index:
+        The FixIndex holding the indexed branches.
+    :param tip:
+        The SHA of the branch to index.
+    :return:
+        A tuple of the state of the indexed branch with the most recent merge
+        base with ``tip`` and the SHA of the merge base, or None if no indexed
+        branch shares any history with it.
+    """
+    best = None
+    for name, state in sorted(index.branches.items()):
+        try:
+            bases = repo.merge_base(state["tip"], tip)
+        except GitCommandError:
+            # the indexed tip does not exist anymore
+            continue
+        if not bases:
+            continue
+        # on a tie, prefer a tip that is the merge base itself
+        key = (bases[0].committed_date, bases[0].hexsha == state["tip"])
+        if best is None or key > best[0]:
+            best = (key, state, bases[0].hexsha)
+    return best and best[1:]
+
+
+def update_release_index(repo, index, branch, reader=None):
+    """
+    Brings the release commits of a branch in a ReleaseIndex up to date.
+
+    Only the commits added since the branch was last indexed are walked. The
+    whole history is walked for branches not indexed yet or rewritten since.
+    Walks are filtered by the reader, so only release commits are loaded.
+
+    :param repo:
+        The repository to process.
+    :param index:
+        The ReleaseIndex to update.
+    :param branch:
+        The branch to index.
+    :param reader:
+        The commit reader used to walk the history, see ``cactuskeeper.readers``.
+    """
+    name = str(branch)
+    tip = repo.commit(name).hexsha
+    state = index.branches.get(name)
+    if state is not None and state["tip"] == tip:
+        stats.count("cache hits")
+        return
+
+    known = []
+    rev = get_new_commits_range(repo, state and state["tip"], tip)
+    if rev is None:
+        rev = tip
     else:
-        commit_iterator = repo.iter_commits(branch)
-    result = []
+        known = state["releases"]
 
-    for commit in commit_iterator:
-        result.append(CommitMetadata(commit))
-    return result
+    releases = []
+    with stats.phase("history walk"):
+        for commit in (reader or repo).iter_commits(rev, grep="^release:"):
+            stats.count("commits walked")
+            if commit.message.startswith("release:"):
+                metadata = CommitMetadata(commit)
+                index.put(metadata.hexsha, metadata.version)
+                releases.append(metadata.hexsha)
+    index.set_branch(name, tip, releases + known)
 
 
-def get_bugfixes_for_branch(repo, branch, base_branch=None):
+def get_shallow_commits(repo):
+    """
+    Returns the SHAs of the commits at the boundary of a shallow clone, whose
+    parents are missing from the repository. The set is empty for complete clones.
+    """
+    if repo.git_dir is None:
+        return set()
+    return read_shallow_commits(repo.git_dir)
 
+
+class HistoryHorizon:
+    """
+    Bounds how far back the history of a branch is walked.
+
+    Without a horizon, walks go back to the root commit, which is slow on long
+    histories and wrong on shallow clones, where the history ends early.
+    Walks which reach a shallow clone boundary record it in ``cut_off``, so
+    that results based on incomplete history can be reported.
+
+    :param max_depth:
+        If given, walks stop after this many commits.
+    :param since:
+        If given, walks stop at the first commit committed before this Unix timestamp.
+    :param shallow:
+        The SHAs of the shallow clone boundary, see ``get_shallow_commits``.
+    :param stop_at:
+        SHAs of commits which are not walked, together with their history.
+    """
+
+    def __init__(self, max_depth=None, since=None, shallow=(), stop_at=()):
+        self.max_depth = max_depth
+        self.since = since
+        self.shallow = shallow
+        self.stop = tuple(stop_at)
+        self.cut_off = set()
+
+    def stop_at(self, *hexshas):
+        """
+        Returns a copy of the horizon which also stops at the given commits.
+        Reached shallow clone boundaries are recorded in both.
+        """
+        horizon = HistoryHorizon(
+            self.max_depth, self.since, self.shallow, self.stop + hexshas
+        )
+        horizon.cut_off = self.cut_off
+        return horizon
+
+    def revs(self, branch):
+        """
+        Returns the revisions to walk for a branch or revision range.
+        """
+        if not self.stop:
+            return branch
+        return [str(branch)] + ["^" + hexsha for hexsha in self.stop]
+
+    def limit(self, commits):
+        """
+        Yields the commits of a walk until the horizon is reached.
+        """
+        for depth, commit in enumerate(commits):
+            if depth == self.max_depth:
+                return
+            if self.since is not None and commit.committed_date < self.since:
+                return
+            if commit.hexsha in self.shallow:
+                self.cut_off.add(commit.hexsha)
+            yield commit
+
+
+def load_metadata(repo, hexsha, cache=None, reader=None, parser=None):
+    """
+    Creates the CommitMetadata of a commit given by its full SHA. The commit
+    is only loaded if it is missing from the cache.
+    """
+    cached = cache.get(hexsha) if cache is not None else None
+    if cached is not None:
+        stats.count("cache hits")
+        return CommitMetadata(CommitRecord(hexsha), parsed=cached)
+    return CommitMetadata((reader or repo).commit(hexsha), cache, parser)
+
+
+def iter_commit_metadata(commits, cache=None, parser=None):
+    """
+    Yields a CommitMetadata object for each commit.
+
+    The messages of commits missing from the cache are parsed in blocks. The
+    blocks grow from a single commit up to ``MAX_PARSE_BLOCK`` commits, so a
+    consumer stopping early makes the walk read ahead by at most as many
+    commits as it consumed.
+    """
+    size = 1
+    while True:
+        block = list(islice(commits, size))
+        if not block:
+            return
+        size = min(2 * size, MAX_PARSE_BLOCK)
+
+        uncached = [c for c in block if cache is None or cache.get(c.hexsha) is None]
+        parsed = {}
+        if uncached:
+            messages = parse_messages([c.message for c in uncached], parser)
+            parsed = dict(zip([c.hexsha for c in uncached], messages))
+        for commit in block:
+            yield CommitMetadata(commit, cache, parser, parsed.get(commit.hexsha))
+
+
+def get_walk_revs(branch, base_branch=None, horizon=None):
+    """
+    Returns the revisions walked for the commits of a branch, which are not
+    on ``base_branch``, within a horizon. See ``iter_bugfixes_for_branch``.
+    """
     if base_branch is not None:
-        base_commits = set(c.hexsha for c in repo.iter_commits(base_branch))
-        test = lambda x: x.hexsha not in base_commits
-    else:
-        test = None
+        branch = "{0}..{1}".format(base_branch, branch)
+    return branch if horizon is None else horizon.revs(branch)
+
+
+def iter_commits_while(
+    repo, branch, test, cache=None, reader=None, horizon=None, parser=None
+):
+    """
+    Walks the history of a branch and yields a CommitMetadata object for each
+    commit, as long as ``test`` holds for the commits.
+
+    Commits are read and parsed only when the consumer asks for them, so it
+    can stop the walk early at any point.
+
+    :param repo:
+        The repository to process.
+    :param branch:
+        The branch or revision range to walk.
+    :param test:
+        A function called with each commit object, the walk stops at the first
+        commit it returns False for. If None, the whole history is walked.
+    :param horizon:
+        An optional HistoryHorizon bounding the walk.
+    :param parser:
+        An optional MessageParser, see ``parse_messages``.
+    """
+    commits = (reader or repo).iter_commits(get_walk_revs(branch, horizon=horizon))
+    commit_iterator = commits if test is None else takewhile(test, commits)
+    if horizon is not None:
+        commit_iterator = horizon.limit(commit_iterator)
+    commit_iterator = iter_commit_metadata(commit_iterator, cache, parser)
+
+    walked = 0
+    try:
+        while True:
+            with stats.phase("history walk"):
+                metadata = next(commit_iterator, None)
+                if metadata is None:
+                    break
+            walked += 1
+            yield metadata
+    finally:
+        commits.close()
+        stats.count("commits walked", walked)
+
 
-    commits = get_commits_while(repo, branch, test)
+def get_commits_while(
+    repo, branch, test, cache=None, reader=None, horizon=None, parser=None
+):
+    return list(iter_commits_while(repo, branch, test, cache, reader, horizon, parser))
 
+
+def iter_bugfixes_for_branch(
+    repo, branch, base_branch=None, cache=None, reader=None, horizon=None, parser=None
+):
+    """
+    Yields the bugfix commits on a branch as they are found, newest first.
+    An issue number can be yielded several times, if several commits refer to it.
+
+    :param repo:
+        The repository to process.
+    :param branch:
+        The branch to collect the bugfixes from.
+    :param base_branch:
+        If given, only commits reachable from ``branch`` but not from
+        ``base_branch`` are considered. They are walked as the revision range
+        ``base_branch..branch``, so the walk stops at the merge base instead of
+        loading the whole history of ``base_branch``.
+    :param horizon:
+        An optional HistoryHorizon bounding the walk.
+    :param parser:
+        An optional MessageParser, see ``parse_messages``.
+    """
+    for commit in iter_commits_while(
+        repo, get_walk_revs(branch, base_branch), None, cache, reader, horizon, parser
+    ):
+        if commit.issue and not commit.version:
+            yield commit
+
+
+def get_bugfixes_for_branch(
+    repo, branch, base_branch=None, cache=None, reader=None, horizon=None, parser=None
+):
+    """
+    Collects the bugfixes on a branch, newest first.
+    See ``iter_bugfixes_for_branch`` for the parameters.
+
+    :return:
+        An OrderedDict mapping issue numbers to CommitMetadata objects.
+    """
     result = OrderedDict()
-    for commit in commits:
-        if commit.version:
+    for commit in iter_bugfixes_for_branch(
+        repo, branch, base_branch, cache, reader, horizon, parser
+    ):
+        result[commit.issue] = commit
+    return result
+
+
+def update_fix_index(
+    repo, index, branch, tip=None, cache=None, reader=None, parser=None
+):
+    """
+    Brings the bugfix commits of a branch in a FixIndex up to date.
+
+    Only the commits added since the branch was last indexed are walked, so
+    the cost of an update depends on the number of new commits, not on the
+    length of the history. Branches not indexed yet or rewritten since are
+    seeded from the indexed branch they share the most history with, see
+    ``find_fix_index_seed``, and only walked completely if there is none.
+
+    :param repo:
+        The repository to process.
+    :param index:
+        The FixIndex to update.
+    :param branch:
+        The branch to index.
+    :param tip:
+        The SHA to index the branch at, defaults to the commit it points to.
+        Hooks running before a ref is updated pass its new SHA.
+    :param parser:
+        An optional MessageParser, see ``parse_messages``.
+    """
+    name = str(branch)
+    if tip is None:
+        tip = repo.commit(name).hexsha
+    state = index.branches.get(name)
+    if state is not None and state["tip"] == tip:
+        stats.count("cache hits")
+        return
+
+    known = []
+    rev = get_new_commits_range(repo, state and state["tip"], tip)
+    if rev is not None:
+        known = state["fixes"]
+    else:
+        seed = find_fix_index_seed(repo, index, tip)
+        if seed is None:
+            rev = tip
+            stats.count("full fix index updates")
+        else:
+            seed, merge_base = seed
+            known = seed["fixes"]
+            if merge_base != seed["tip"]:
+                # the fixes added to the seed after the merge base are not on it
+                dropped = set(
+                    commit.hexsha
+                    for commit in iter_bugfixes_for_branch(
+                        repo, seed["tip"], tip, cache, reader, parser=parser
+                    )
+                )
+                known = [hexsha for hexsha in known if hexsha not in dropped]
+            rev = "{0}..{1}".format(seed["tip"], tip)
+            stats.count("seeded fix index updates")
+
+    fixes = []
+    for commit in iter_bugfixes_for_branch(
+        repo, rev, cache=cache, reader=reader, parser=parser
+    ):
+        index.put(commit.hexsha, commit.issue)
+        fixes.append(commit.hexsha)
+    index.set_branch(name, tip, fixes + known)
+
+
+def parse_ref_updates(lines):
+    """
+    Parses the ref updates git passes to hooks on stdin.
+
+    Lines with three fields are ``<old-sha> <new-sha> <ref>``, as given to the
+    pre-receive, post-receive and reference-transaction hooks. Lines with four
+    fields are ``<local-ref> <local-sha> <remote-ref> <remote-sha>``, as given
+    to the pre-push hook, the local branch is taken as updated from the remote
+    SHA to the local one.
+
+    :return:
+        A list of ``(old, new, branch)`` tuples for the updated branches, other
+        refs like tags are skipped. ``ZERO_SHA`` stands for a missing commit,
+        the old SHA of created branches and the new SHA of deleted ones.
+    """
+    updates = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) == 4:
+            ref, new, _, old = fields
+        elif len(fields) == 3:
+            old, new, ref = fields
+        else:
             continue
-        if commit.issue:
-            result[commit.issue] = commit
+        if ref.startswith("refs/heads/"):
+            updates.append((old, new, ref[len("refs/heads/") :]))
+    return updates
+
+
+def get_patch_ids(repo, hexshas, cache=None):
+    """
+    Calculates the stable patch-ids of commits, like ``git cherry`` does.
+
+    All commits missing from the cache are processed in one batch by a single
+    ``git diff-tree --stdin | git patch-id --stable`` pipeline.
+
+    :param repo:
+        The repository to process.
+    :param hexshas:
+        The full SHAs of the commits.
+    :param cache:
+        An optional PatchIdCache, which is consulted first and updated
+        with the newly calculated patch-ids.
+
+    :return:
+        A dict mapping the SHAs to their patch-id. Commits without a patch,
+        like merges or empty commits, are mapped to an empty string.
+    """
+    result = {}
+    missing = []
+    for hexsha in hexshas:
+        patch_id = cache.get(hexsha) if cache is not None else None
+        if patch_id is None:
+            missing.append(hexsha)
+        else:
+            result[hexsha] = patch_id
+    stats.count("patch-id cache hits", len(result))
+
+    if not missing:
+        return result
+
+    git = ["git", "--git-dir", repo.git_dir]
+    stats.count("git subprocesses", 2)
+    with stats.phase("patch-id calculation"), tempfile.TemporaryFile() as shas:
+        shas.write("\n".join(missing).encode() + b"\n")
+        shas.seek(0)
+        diff_tree = subprocess.Popen(
+            git + ["diff-tree", "--stdin", "--root", "-p", "-r", "--no-color"],
+            stdin=shas,
+            stdout=subprocess.PIPE,
+        )
+        output = subprocess.run(
+            git + ["patch-id", "--stable"],
+            stdin=diff_tree.stdout,
+            capture_output=True,
+            check=True,
+        ).stdout
+        diff_tree.stdout.close()
+        diff_tree.wait()
+
+    for hexsha in missing:
+        result[hexsha] = ""
+    for line in output.decode().splitlines():
+        patch_id, hexsha = line.split()
+        result[hexsha] = patch_id
+
+    if cache is not None:
+        for hexsha in missing:
+            cache.put(hexsha, result[hexsha])
+
     return result
 
 
-def get_commits_since_commit(repo, branch, commit_hexsha):
+def iter_missing_fixes(
+    repo,
+    branch,
+    base_branch,
+    fixes_on_base,
+    ignored_issues=(),
+    cache=None,
+    reader=None,
+    match_patch_ids=False,
+    patch_id_cache=None,
+    horizon=None,
+    parser=None,
+):
+    """
+    Yields the bugfixes on a branch which are missing on a base branch,
+    newest first and once per issue number.
+
+    The fixes are yielded as they are found, so consumers only interested in
+    whether any fix is missing can stop at the first one. Matching patch-ids
+    needs all candidates at once, in that case the branch is walked completely.
+
+    :param repo:
+        The repository to process.
+    :param branch:
+        The branch to look for bugfixes on.
+    :param base_branch:
+        The branch the bugfixes should be present on.
+    :param fixes_on_base:
+        The issue numbers already fixed on ``base_branch``.
+    :param ignored_issues:
+        Issue numbers which are never reported as missing.
+    :param match_patch_ids:
+        If True, a fix is also considered present if a commit on ``base_branch``,
+        which is not on ``branch``, has the same patch-id.
+    :param patch_id_cache:
+        An optional PatchIdCache used when matching patch-ids.
+    :param horizon:
+        An optional HistoryHorizon bounding the walk of ``branch``.
+    :param parser:
+        An optional MessageParser, see ``parse_messages``.
+
+    :return:
+        A generator of CommitMetadata objects.
+    """
+    seen = set()
+
+    def missing_fixes():
+        for commit in iter_bugfixes_for_branch(
+            repo, branch, base_branch, cache, reader, horizon, parser
+        ):
+            if commit.issue in seen:
+                continue
+            seen.add(commit.issue)
+            if commit.issue not in fixes_on_base and commit.issue not in ignored_issues:
+                yield commit
+
+    if not match_patch_ids:
+        yield from missing_fixes()
+        return
+
+    missing = list(missing_fixes())
+    if missing:
+        with stats.phase("history walk"):
+            base_shas = [
+                c.hexsha
+                for c in (reader or repo).iter_commits(
+                    "{0}..{1}".format(branch, base_branch)
+                )
+            ]
+        stats.count("commits walked", len(base_shas))
+        patch_ids = get_patch_ids(
+            repo, base_shas + [c.hexsha for c in missing], patch_id_cache
+        )
+        patch_ids_on_base = set(patch_ids[hexsha] for hexsha in base_shas)
+        patch_ids_on_base.discard("")
+
+        for commit in missing:
+            if patch_ids[commit.hexsha] not in patch_ids_on_base:
+                yield commit
+
+
+def get_missing_fixes(*args, **kwargs):
+    """
+    Returns the result of ``iter_missing_fixes`` as a list.
+    """
+    return list(iter_missing_fixes(*args, **kwargs))
+
+
+def parse_since(value):
+    """
+    Parses a ``since`` setting in one of the date formats ``--since`` accepts.
+
+    :raises ValueError:
+        If the value is not a date.
+    """
+    for date_format in SINCE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ValueError(
+        "Invalid since setting '{0}', use one of the formats {1}".format(
+            value, ", ".join(SINCE_FORMATS)
+        )
+    )
+
+
+def get_check_horizon(repo, config, max_depth=None, since=None, full_history=False):
+    """
+    Builds the HistoryHorizon of a check. Limits not given fall back to the
+    ``max_depth`` and ``since`` settings.
+
+    :param config:
+        The ``cactuskeeper`` configuration section.
+    :param since:
+        A datetime, commits committed before it are not walked.
+    :param full_history:
+        Ignore all limits, only shallow clone boundaries end the history.
+
+    :raises ValueError:
+        If the settings are invalid.
+    """
+    if full_history:
+        max_depth = since = None
+    else:
+        if max_depth is None and "max_depth" in config:
+            try:
+                max_depth = int(config["max_depth"])
+                if max_depth < 1:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(
+                    "Invalid max_depth setting '{0}', use a number of commits "
+                    "of at least 1".format(config["max_depth"])
+                ) from None
+        if since is None and "since" in config:
+            since = parse_since(config["since"])
+
+    return HistoryHorizon(
+        max_depth,
+        since.timestamp() if since is not None else None,
+        get_shallow_commits(repo),
+    )
+
+
+def check_current_branch(
+    repo,
+    config,
+    reader_name="gitpython",
+    remote=None,
+    match_patch_ids=False,
+    max_depth=None,
+    since=None,
+    full_history=False,
+    stop_at_shared_release=False,
+    quiet=False,
+    jobs=1,
+    open_repo=None,
+    parser=None,
+    cache=None,
+    reader=None,
+    result_cache=None,
+):
+    """
+    Finds the fixes on older release branches which are missing on the
+    current branch. This is the analysis behind ``ck check`` and everything
+    acting on its result.
+
+    The same branch tips, configuration and options give the same result, so
+    results are stored in a CheckResultCache and an unchanged repository is
+    not walked again.
+
+    :param repo:
+        The repository to process.
+    :param config:
+        The ``cactuskeeper`` configuration section of the repository.
+    :param reader_name:
+        The name of the commit reader to use, see ``cactuskeeper.readers``.
+    :param remote:
+        If given, the remote-tracking release branches of this remote are checked.
+    :param match_patch_ids:
+        Also treat fixes as present if a commit with the same patch-id is on the
+        current branch, see ``iter_missing_fixes``.
+    :param max_depth:
+        Walk at most this many commits per branch.
+    :param since:
+        A datetime, commits committed before it are not walked.
+    :param full_history:
+        Ignore ``max_depth``, ``since`` and their settings.
+    :param stop_at_shared_release:
+        Do not look for fixed issues on the current branch beyond the oldest
+        release it shares with a release branch.
+    :param quiet:
+        Stop at the first missing fix. Such incomplete results are not stored.
+    :param jobs:
+        The number of release branches to analyse concurrently.
+    :param open_repo:
+        A callable opening another instance of the repository, used by the
+        threads analysing release branches. Defaults to opening its working
+        directory with GitPython.
+    :param parser:
+        The MessageParser to use, defaults to one for the configured issue patterns.
+    :param cache:
+        A CommitCache kept by the caller. Defaults to the one of the repository,
+        which is saved afterwards.
+    :param reader:
+        A commit reader kept open by the caller. Defaults to a new reader,
+        which is closed afterwards.
+    :param result_cache:
+        The CheckResultCache to use, defaults to the one of the repository.
+
+    :return:
+        A dict with the name of the checked ``branch``, the ``missing`` fixes
+        as a list of ``[release branch, [[hexsha, issue, shortlog], ...]]``
+        and the SHAs of the shallow clone boundaries the walks were ``cut_off`` at.
+
+    :raises ValueError:
+        If the settings are invalid.
+    """
+    from cactuskeeper.cache import (
+        CheckResultCache,
+        CommitCache,
+        PatchIdCache,
+        ReleaseIndex,
+    )
+
+    if parser is None:
+        parser = MessageParser(config["issue_patterns"])
+    ignored_issues = set(config["ignore_issues"])
+    current_branch = repo.active_branch
+    release_branches = get_release_branches(repo, remote=remote)
+    branches_to_check = get_branches_to_check(release_branches, current_branch)
+    horizon = get_check_horizon(repo, config, max_depth, since, full_history)
+
+    if result_cache is None:
+        result_cache = CheckResultCache.for_repo(repo, parser=parser)
+    result_key = CheckResultCache.result_key(
+        {
+            str(branch): repo.commit(str(branch)).hexsha
+            for branch in [current_branch] + [b["branch"] for b in release_branches]
+        },
+        config,
+        {
+            "patch_id": match_patch_ids,
+            "max_depth": horizon.max_depth,
+            "since": horizon.since,
+            "stop_at_shared_release": stop_at_shared_release,
+            "shallow": sorted(horizon.shallow),
+        },
+    )
+    result = result_cache.get(result_key)
+    if result is not None:
+        stats.count("cached check results")
+        result_cache.save()
+        return dict(result, branch=str(current_branch))
+
+    own_cache = cache is None
+    if own_cache:
+        cache = CommitCache.for_repo(repo, parser=parser)
+    own_reader = reader is None
+    if own_reader:
+        reader = READERS[reader_name](repo)
+    patch_id_cache = PatchIdCache.for_repo(repo) if match_patch_ids else None
+
+    # The walks of the release branches exclude the history of the current
+    # branch, so they never go beyond a shared release anyway. The walk of the
+    # current branch does, for the issues fixed on it.
+    base_horizon = horizon
+    if stop_at_shared_release and branches_to_check:
+        # the oldest release branch shares the oldest release with the current branch
+        oldest = branches_to_check[0]["branch"]
+        index = ReleaseIndex.for_repo(repo)
+        update_release_index(repo, index, current_branch, reader)
+        update_release_index(repo, index, oldest, reader)
+        index.save()
+        shared = index.shared(oldest, current_branch)
+        if shared:
+            base_horizon = horizon.stop_at(shared)
+
+    if hasattr(reader, "prefetch") and jobs == 1 and not quiet:
+        # start all walks at once, so they run while the first ones are processed
+        reader.prefetch(
+            [get_walk_revs(current_branch, horizon=base_horizon)]
+            + [
+                get_walk_revs(branch["branch"], current_branch, horizon)
+                for branch in branches_to_check
+            ]
+        )
+
+    fixes_on_base = set(
+        commit.issue
+        for commit in iter_bugfixes_for_branch(
+            repo,
+            current_branch,
+            cache=cache,
+            reader=reader,
+            horizon=base_horizon,
+            parser=parser,
+        )
+    )
+
+    def find_missing_fixes(branch_repo, branch_reader, branch, limit=None):
+        fixes = iter_missing_fixes(
+            branch_repo,
+            branch["branch"],
+            current_branch,
+            fixes_on_base,
+            ignored_issues,
+            cache=cache,
+            reader=branch_reader,
+            match_patch_ids=match_patch_ids,
+            patch_id_cache=patch_id_cache,
+            horizon=horizon,
+            parser=parser,
+        )
+        return list(islice(fixes, limit))
+
+    def find_missing_fixes_in_thread(branch):
+        # GitPython repositories must not be shared between threads
+        if open_repo is None:
+            branch_repo = Repo(repo.working_dir)
+        else:
+            branch_repo = open_repo()
+        branch_reader = READERS[reader_name](branch_repo)
+        try:
+            return find_missing_fixes(branch_repo, branch_reader, branch)
+        finally:
+            branch_reader.close()
+            branch_repo.close()
+
+    if quiet:
+        # stop at the first missing fix, the exit code is all that is needed
+        results = []
+        for branch in branches_to_check:
+            results.append(find_missing_fixes(repo, reader, branch, limit=1))
+            if results[-1]:
+                break
+    elif jobs == 1:
+        results = [
+            find_missing_fixes(repo, reader, branch) for branch in branches_to_check
+        ]
+    else:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            # map keeps the order of the branches, so the output order is the same
+            results = list(
+                executor.map(find_missing_fixes_in_thread, branches_to_check)
+            )
+
+    result = {
+        "missing": [
+            [
+                str(branch["branch"]),
+                [[c.hexsha, c.issue, c.shortlog] for c in missing_fixes],
+            ]
+            for branch, missing_fixes in zip(branches_to_check, results)
+            if missing_fixes
+        ],
+        "cut_off": sorted(horizon.cut_off),
+    }
+
+    if own_reader:
+        reader.close()
+    if own_cache:
+        cache.save()
+    if patch_id_cache is not None:
+        patch_id_cache.save()
+    if not quiet:
+        # quiet checks stop early, only complete results are stored
+        result_cache.put(result_key, result)
+        result_cache.save()
+    return dict(result, branch=str(current_branch))
+
+
+def pick_commits(repo, tip, hexshas):
+    """
+    Cherry-picks commits onto a commit like ``git cherry-pick -x`` does, but
+    without a checkout and without touching the index or working tree.
+
+    The patch of every commit is applied with a three-way merge to a temporary
+    index, from which the new tree is written. The new commits keep the author
+    and message of the picked ones, with a ``(cherry picked from commit ...)`` line.
+    No ref is updated, see ``update_branch``.
+
+    :param repo:
+        The repository to process.
+    :param tip:
+        The SHA of the commit to pick the commits onto.
+    :param hexshas:
+        The full SHAs of the commits to pick, in the order to pick them.
+
+    :return:
+        A tuple of the SHA of the last new commit, or ``tip`` if none was
+        created, and the SHA of the commit which did not apply cleanly, or None
+        if all commits were picked. The commits after it are not picked.
+    """
+    if not hexshas:
+        return tip, None
+
+    git = ["git", "--git-dir", repo.git_dir]
+    stats.count("git subprocesses", 2 + 4 * len(hexshas))
+    with stats.phase("cherry-picking"), tempfile.TemporaryDirectory() as directory:
+        # author name, email, date and message of every commit, separated by NULs
+        fields = (
+            subprocess.run(
+                git
+                + ["log", "--no-walk=unsorted", "-z", "--date=raw"]
+                + ["--format=%an%x00%ae%x00%ad%x00%B"]
+                + list(hexshas),
+                capture_output=True,
+                check=True,
+            )
+            .stdout.decode()
+            .split("\0")
+        )
+
+        env = dict(os.environ, GIT_INDEX_FILE=os.path.join(directory, "index"))
+        subprocess.run(
+            git + ["read-tree", tip], capture_output=True, check=True, env=env
+        )
+
+        for number, hexsha in enumerate(hexshas):
+            name, email, date, message = fields[4 * number : 4 * number + 4]
+            patch = subprocess.run(
+                git + ["diff-tree", "-p", "--binary", "--full-index", "--root", hexsha],
+                capture_output=True,
+                check=True,
+            ).stdout
+            # empty commits have no patch and are picked as they are
+            if patch:
+                applied = subprocess.run(
+                    git + ["apply", "--cached", "--3way"],
+                    input=patch,
+                    capture_output=True,
+                    env=env,
+                )
+                if applied.returncode != 0:
+                    return tip, hexsha
+
+            tree = (
+                subprocess.run(
+                    git + ["write-tree"], capture_output=True, check=True, env=env
+                )
+                .stdout.decode()
+                .strip()
+            )
+            tip = (
+                subprocess.run(
+                    git + ["commit-tree", tree, "-p", tip],
+                    input="{0}\n\n(cherry picked from commit {1})\n".format(
+                        message.rstrip(), hexsha
+                    ).encode(),
+                    capture_output=True,
+                    check=True,
+                    env=dict(
+                        os.environ,
+                        GIT_AUTHOR_NAME=name,
+                        GIT_AUTHOR_EMAIL=email,
+                        GIT_AUTHOR_DATE=date,
+                    ),
+                )
+                .stdout.decode()
+                .strip()
+            )
+
+    return tip, None
+
+
+def update_branch(repo, branch, old, new):
+    """
+    Moves a branch from one commit to another with a single ref update, which
+    fails if the branch does not point to ``old`` anymore.
+
+    If the branch is checked out, the index and working tree are updated as
+    well, which only rewrites the files changed between the two commits.
+    Nothing is changed if local changes to these files are in the way.
+
+    :raises subprocess.CalledProcessError:
+        If the working tree or the ref could not be updated.
+    """
+    update_ref = ["git", "--git-dir", repo.git_dir, "update-ref", "-m", "ck sync"]
+    update_ref.append("refs/heads/" + branch)
+    # the ref first, so the working tree is not touched if the branch moved
+    subprocess.run(update_ref + [new, old], capture_output=True, check=True)
+
+    if not repo.head.is_detached and str(repo.active_branch) == branch:
+        try:
+            subprocess.run(
+                ["git", "-C", repo.working_tree_dir, "read-tree", "-m", "-u"]
+                + [old, new],
+                capture_output=True,
+                check=True,
+            )
+        except subprocess.CalledProcessError:
+            # local changes are in the way, move the branch back
+            subprocess.run(update_ref + [old, new], capture_output=True, check=True)
+            raise
+
+
+def get_release_matrix(
+    repo, release_branches, ignored_issues=(), cache=None, reader=None, parser=None
+):
+    """
+    Finds the missing fixes between every pair of release branches.
+
+    The combined history of all branches is walked once in topological order.
+    For every commit a bitset of the branch tips it is reachable from is
+    propagated to its parents. Once every pending commit is reachable from all
+    tips, older history cannot contain missing fixes, but it may fix their
+    issues on all branches. The walk goes on only until every issue of the
+    fixes found so far is fixed on all branches.
+
+    :param repo:
+        The repository to process.
+    :param release_branches:
+        The release branches as returned by ``get_release_branches``.
+    :param ignored_issues:
+        Issue numbers which are never reported as missing.
+
+    :return:
+        A dict mapping ``(source, target)`` tuples of branch names to a list
+        of CommitMetadata objects for the fixes on ``source`` which are missing
+        on ``target``, newest first.
+    """
+    result = OrderedDict()
+    names = [str(branch["branch"]) for branch in release_branches]
+    if not names:
+        return result
+    complete = (1 << len(names)) - 1
+
+    reachable = {}
+    for index, name in enumerate(names):
+        hexsha = repo.commit(name).hexsha
+        reachable[hexsha] = reachable.get(hexsha, 0) | 1 << index
+    partial = set(sha for sha, mask in reachable.items() if mask != complete)
+
+    # issue number -> mask of the branches it is fixed on
+    issue_masks = {}
+    # issue number -> list of (mask, commit) for each fix commit
+    fix_commits = OrderedDict()
+    # the issues which are not fixed on all branches yet
+    unresolved = set()
+
+    walked = 0
+    with stats.phase("history walk"):
+        commits = (reader or repo).iter_commits(names, topo_order=True)
+        for commit in commits:
+            if not partial and not unresolved:
+                break
+            walked += 1
+
+            mask = reachable.pop(commit.hexsha)
+            partial.discard(commit.hexsha)
+            for parent in commit.parents:
+                parent_mask = reachable.get(parent.hexsha, 0) | mask
+                reachable[parent.hexsha] = parent_mask
+                if parent_mask == complete:
+                    partial.discard(parent.hexsha)
+                else:
+                    partial.add(parent.hexsha)
+
+            metadata = CommitMetadata(commit, cache, parser)
+            issue = metadata.issue
+            if not issue or metadata.version:
+                continue
+
+            issue_masks[issue] = issue_masks.get(issue, 0) | mask
+            # fixes on all branches are never missing, but fix their issue everywhere
+            if mask != complete:
+                fix_commits.setdefault(issue, []).append((mask, metadata))
+            if issue_masks[issue] == complete:
+                unresolved.discard(issue)
+            elif issue not in ignored_issues:
+                unresolved.add(issue)
+
+        commits.close()
+    stats.count("commits walked", walked)
+
+    for source_index, source in enumerate(names):
+        for target_index, target in enumerate(names):
+            if source_index == target_index:
+                continue
+
+            missing = []
+            for issue, entries in fix_commits.items():
+                mask = issue_masks[issue]
+                if issue in ignored_issues or not mask & 1 << source_index:
+                    continue
+                if mask & 1 << target_index:
+                    continue
+                missing.append(next(c for m, c in entries if m & 1 << source_index))
+            result[(source, target)] = missing
+
+    return result
+
+
+def get_commits_since_commit(repo, branch, commit_hexsha, cache=None, reader=None):
     return get_commits_while(
-        repo, branch, lambda commit: commit.hexsha != commit_hexsha
+        repo, branch, lambda commit: commit.hexsha != commit_hexsha, cache, reader
     )
+
+
+class BranchHistory:
+    """
+    The history of a branch, walked at most once and indexed by SHA, so that
+    the commits since any commit on it can be looked up repeatedly.
+
+    The history is only walked as far back as needed. Walked commits are kept
+    in a CommitTable and found by bisecting their binary SHAs, abbreviated
+    SHAs included. The metadata of commits is loaded again when they are
+    returned, which is cheap with a cache.
+    """
+
+    def __init__(self, repo, branch, cache=None, reader=None, parser=None):
+        self.repo = repo
+        self.cache = cache
+        self.reader = reader
+        self.parser = parser
+        self.commits = CommitTable()
+        self._walk = iter_commits_while(
+            repo, branch, None, cache, reader, parser=parser
+        )
+        self._complete = False
+
+    def find(self, hexsha):
+        """
+        Returns the position of the newest commit whose SHA starts with
+        ``hexsha``, or None if there is no such commit on the branch.
+        """
+        hexsha = hexsha.strip().lower()
+        position = min(self.commits.find_prefix(hexsha), default=None)
+        while position is None and not self._complete:
+            commit = next(self._walk, None)
+            if commit is None:
+                self._complete = True
+            else:
+                self.commits.append(commit.hexsha, commit.issue, commit.version)
+                if commit.hexsha.startswith(hexsha):
+                    position = len(self.commits) - 1
+        return position
+
+    def commits_since(self, hexsha):
+        """
+        Returns the commits on the branch newer than the given commit, newest
+        first, or None if the commit is not on the branch.
+        """
+        position = self.find(hexsha)
+        if position is None:
+            return None
+        return [
+            load_metadata(
+                self.repo, self.commits.hexsha(i), self.cache, self.reader, self.parser
+            )
+            for i in range(position)
+        ]
+
+    def close(self):
+        self._walk.close()
@@ -0,0 +1,121 @@
+import re
+
+# the issue number format of GitHub and GitLab, e.g. #123
+ISSUE_PATTERNS = (r"#\d+",)
+
+RELEASE_PATTERN = r"release: v(?P<version>\d+\.\d+\.\d)"
+
+
+def get_leading_class(pattern):
+    """
+    Returns the characters every match of a regular expression starts with,
+    as the content of a character class, or None if they are not obvious from
+    the first character or character class of the pattern.
+    """
+    if "|" in pattern:
+        return None
+
+    if pattern[:1] == "\\":
+        leading = rest = pattern[:2]
+        # escaped letters and digits are only kept if they are character classes
+        if leading[1:].isalnum() and leading[1:] not in "dDsSwW":
+            return None
+    elif pattern[:1] == "[":
+        rest = pattern[: pattern.find("]") + 1]
+        leading = rest[1:-1]
+        if leading[:1] in ("^", "]") or "\\" in leading or "[" in leading:
+            return None
+    elif pattern[:1] and pattern[0] not in ".^$*+?{}()":
+        rest = pattern[0]
+        leading = re.escape(rest)
+    else:
+        return None
+
+    # the first character must not be optional
+    rest = pattern[len(rest) :]
+    if not leading or rest[:1] in ("?", "*") or rest[:2] == "{0":
+        return None
+    return leading
+
+
+def scope_global_flags(pattern):
+    """
+    Turns inline flags at the start of a pattern, like ``(?i)`` in
+    ``(?i)jira-\\d+``, into flags scoped to the pattern. Global flags are only
+    allowed at the start of a whole expression, not of a combined pattern.
+    """
+    m = re.match(r"\(\?([aiLmsux]+)\)", pattern)
+    if m is None:
+        return pattern
+    return "(?{0}:{1})".format(m.group(1), pattern[m.end() :])
+
+
+class MessageParser:
+    """
+    Parses commit messages into their shortlog, issue and released version.
+
+    The issue is the first match of any of the issue patterns after the
+    shortlog, e.g. ``#123`` or JIRA style ``ABC-123``. The version is only set
+    for release commits, whose shortlog starts with ``release: v1.2.3``.
+
+    All issue patterns are combined into one compiled pattern, which matches
+    a whole message in a single pass. Where the leading characters of the
+    issue patterns are known, the text between issues is skipped by a negated
+    character class, without trying every pattern at every position.
+    """
+
+    def __init__(self, issue_patterns=ISSUE_PATTERNS):
+        """
+        :raises ValueError:
+            If an issue pattern is not a valid regular expression.
+        """
+        self.issue_patterns = tuple(issue_patterns)
+        scoped = [scope_global_flags(p) for p in self.issue_patterns]
+        for original, pattern in zip(self.issue_patterns, scoped):
+            try:
+                re.compile(pattern)
+            except re.error as error:
+                raise ValueError(
+                    "Invalid issue pattern '{0}': {1}".format(original, error)
+                ) from None
+
+        issues = "|".join("(?:{0})".format(p) for p in scoped)
+        leading = [get_leading_class(p) for p in scoped]
+
+        if None in leading:
+            body = r"(?:(?!{0})[\s\S])*".format(issues)
+        else:
+            # characters that cannot start an issue are skipped in bulk
+            starts = "".join(leading)
+            body = r"[^{0}]*(?:(?!{1})[{0}][^{0}]*)*".format(starts, issues)
+
+        try:
+            self.pattern = re.compile(
+                # the first line, with the version of release commits
+                r"(?P<shortlog>(?:{0})?[^\n]*)"
+                # the text up to the first issue after it, if there is one
+                r"{1}(?P<issue>{2})?".format(RELEASE_PATTERN, body, issues)
+            )
+        except re.error as error:
+            # e.g. group names used by several patterns or by the parser itself
+            raise ValueError("Invalid issue patterns: {0}".format(error)) from None
+
+    def parse(self, messages):
+        """
+        Parses a block of commit messages.
+
+        :param messages:
+            A list of commit messages.
+
+        :return:
+            A list with a ``(shortlog, issue, version)`` tuple for every
+            message, missing issues and versions are empty strings.
+        """
+        match = self.pattern.match
+        result = []
+        for message in messages:
+            shortlog, issue, version = match(message).group(
+                "shortlog", "issue", "version"
+            )
+            result.append((shortlog.strip(), issue or "", version or ""))
+        return result
@@ -0,0 +1,372 @@
+from bisect import bisect_left
+from binascii import hexlify, unhexlify
+import mmap
+import os
+import struct
+import zlib
+
+from cactuskeeper.refs import get_common_dir
+
+OBJECT_TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+OFS_DELTA = 6
+REF_DELTA = 7
+
+IDX_MAGIC = b"\377tOc"
+
+GRAPH_MAGIC = b"CGPH"
+GRAPH_PARENT_NONE = 0x70000000
+GRAPH_EXTRA_EDGES = 0x80000000
+# the generation of commits missing from the commit-graph, they may reach anything
+GENERATION_INFINITY = float("inf")
+
+
+def open_mmap(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _ShaTable:
+    """
+    A sequence view of sorted binary SHAs in a memory-mapped file, with a
+    fan-out table of 256 cumulative counts by the first SHA byte. SHAs are
+    searched with the ``bisect`` module without copying them.
+    """
+
+    def __init__(self, data, start, fanout):
+        self.data = data
+        self.start = start
+        self.fanout = fanout
+
+    def __getitem__(self, index):
+        position = self.start + 20 * index
+        return self.data[position : position + 20]
+
+    def range(self, first_byte):
+        lo = self.fanout[first_byte - 1] if first_byte else 0
+        return lo, self.fanout[first_byte]
+
+    def find(self, sha):
+        """
+        Returns the index of a binary SHA or None if it is not in the table.
+        """
+        lo, hi = self.range(sha[0])
+        index = bisect_left(self, sha, lo, hi)
+        if index == hi or self[index] != sha:
+            return None
+        return index
+
+
+class PackIndex:
+    """
+    A memory-mapped version 2 pack index (``.idx`` file).
+
+    The index holds a fan-out table, the sorted SHAs, their CRC32 checksums and
+    the offsets of the objects in the pack. Offsets above 2 GiB are stored in an extra table.
+    """
+
+    def __init__(self, path):
+        self.data = open_mmap(path)
+        if self.data[:4] != IDX_MAGIC or struct.unpack_from(">I", self.data, 4)[0] != 2:
+            self.data.close()
+            raise ValueError("Unsupported pack index {0}".format(path))
+
+        fanout = struct.unpack_from(">256I", self.data, 8)
+        self.count = fanout[-1]
+        self.shas = _ShaTable(self.data, 8 + 256 * 4, fanout)
+        self.offsets_start = 8 + 256 * 4 + self.count * 24
+        self.large_offsets_start = self.offsets_start + self.count * 4
+
+    def offset(self, sha):
+        """
+        Returns the offset of an object in the pack or None if it is not in it.
+
+        :param sha:
+            The binary SHA of the object.
+        """
+        index = self.shas.find(sha)
+        if index is None:
+            return None
+
+        (offset,) = struct.unpack_from(">I", self.data, self.offsets_start + 4 * index)
+        if offset & 0x80000000:
+            position = self.large_offsets_start + 8 * (offset & 0x7FFFFFFF)
+            (offset,) = struct.unpack_from(">Q", self.data, position)
+        return offset
+
+    def find_prefix(self, prefix):
+        """
+        Returns the binary SHAs in the index starting with a hexadecimal prefix.
+        """
+        # an odd number of hex digits sorts between the two padded prefixes
+        low = unhexlify(prefix.ljust(40, "0"))
+        lo, hi = self.shas.range(low[0])
+        matches = []
+        for index in range(bisect_left(self.shas, low, lo, hi), hi):
+            sha = self.shas[index]
+            if not hexlify(sha).decode().startswith(prefix):
+                break
+            matches.append(sha)
+        return matches
+
+    def close(self):
+        self.data.close()
+
+
+def read_varint(data, position):
+    """
+    Reads a size encoded in the low seven bits of consecutive bytes, least
+    significant group first, as used in delta headers.
+    """
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def apply_delta(base, delta):
+    """
+    Rebuilds an object from its delta base and a git delta.
+    """
+    _, position = read_varint(delta, 0)
+    size, position = read_varint(delta, position)
+
+    result = bytearray()
+    while position < len(delta):
+        opcode = delta[position]
+        position += 1
+        if opcode & 0x80:
+            # copy a range of the base, offset and size bytes are optional
+            offset = length = 0
+            for bit in range(4):
+                if opcode & (1 << bit):
+                    offset |= delta[position] << (8 * bit)
+                    position += 1
+            for bit in range(3):
+                if opcode & (1 << (4 + bit)):
+                    length |= delta[position] << (8 * bit)
+                    position += 1
+            result += base[offset : offset + (length or 0x10000)]
+        else:
+            # insert the next opcode bytes of the delta
+            result += delta[position : position + opcode]
+            position += opcode
+
+    if len(result) != size:
+        raise ValueError("Corrupt delta")
+    return bytes(result)
+
+
+class Pack:
+    """
+    A memory-mapped pack file together with its index.
+    """
+
+    chunk_size = 4096
+
+    def __init__(self, path, store):
+        self.index = PackIndex(path[: -len(".pack")] + ".idx")
+        self.data = open_mmap(path)
+        self.store = store
+
+    def inflate(self, position):
+        decompressor = zlib.decompressobj()
+        result = b""
+        while not decompressor.eof:
+            chunk = self.data[position : position + self.chunk_size]
+            if not chunk:
+                raise ValueError("Truncated pack")
+            result += decompressor.decompress(chunk)
+            position += self.chunk_size
+        return result
+
+    def read(self, offset):
+        """
+        Reads the object at an offset, resolving deltas.
+
+        :return:
+            A tuple of type name and content.
+        """
+        byte = self.data[offset]
+        position = offset + 1
+        kind = (byte >> 4) & 7
+        while byte & 0x80:
+            byte = self.data[position]
+            position += 1
+
+        if kind == OFS_DELTA:
+            byte = self.data[position]
+            position += 1
+            distance = byte & 0x7F
+            while byte & 0x80:
+                byte = self.data[position]
+                position += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7F)
+            kind, base = self.read(offset - distance)
+            return kind, apply_delta(base, self.inflate(position))
+
+        if kind == REF_DELTA:
+            base_sha = hexlify(self.data[position : position + 20]).decode()
+            kind, base = self.store.read(base_sha)
+            return kind, apply_delta(base, self.inflate(position + 20))
+
+        return OBJECT_TYPES[kind], self.inflate(position)
+
+    def close(self):
+        self.index.close()
+        self.data.close()
+
+
+class CommitGraph:
+    """
+    A memory-mapped commit-graph file (``objects/info/commit-graph``).
+
+    It stores the parents, commit time and generation number of every commit
+    it contains, so walks do not have to inflate commit objects. The generation
+    number is the length of the longest path to a root commit, a commit can
+    only reach commits with a lower generation.
+
+    Split commit-graph chains are not supported.
+    """
+
+    def __init__(self, path):
+        self.data = open_mmap(path)
+        if self.data[:4] != GRAPH_MAGIC or self.data[4:6] != b"\1\1":
+            self.data.close()
+            raise ValueError("Unsupported commit-graph {0}".format(path))
+
+        chunks = {}
+        for index in range(self.data[6] + 1):
+            chunk_id, offset = struct.unpack_from(">4sQ", self.data, 8 + 12 * index)
+            chunks[chunk_id] = offset
+
+        fanout = struct.unpack_from(">256I", self.data, chunks[b"OIDF"])
+        self.count = fanout[-1]
+        self.shas = _ShaTable(self.data, chunks[b"OIDL"], fanout)
+        self.commit_data = chunks[b"CDAT"]
+        self.extra_edges = chunks.get(b"EDGE")
+
+    def _hexsha(self, position):
+        return hexlify(self.shas[position]).decode()
+
+    def lookup(self, hexsha):
+        """
+        Looks up a commit in the graph.
+
+        :return:
+            A tuple of the parent SHAs, the commit time and the generation
+            number, or None if the commit is not in the graph.
+        """
+        position = self.shas.find(unhexlify(hexsha))
+        if position is None:
+            return None
+
+        first, second, high, low = struct.unpack_from(
+            ">IIII", self.data, self.commit_data + 36 * position + 20
+        )
+        parents = []
+        if first != GRAPH_PARENT_NONE:
+            parents.append(self._hexsha(first))
+        if second & GRAPH_EXTRA_EDGES:
+            # octopus merges list their second and further parents separately
+            edge = self.extra_edges + 4 * (second & ~GRAPH_EXTRA_EDGES)
+            while True:
+                (value,) = struct.unpack_from(">I", self.data, edge)
+                parents.append(self._hexsha(value & ~GRAPH_EXTRA_EDGES))
+                if value & GRAPH_EXTRA_EDGES:
+                    break
+                edge += 4
+        elif second != GRAPH_PARENT_NONE:
+            parents.append(self._hexsha(second))
+
+        return tuple(parents), (high & 3) << 32 | low, high >> 2
+
+    def close(self):
+        self.data.close()
+
+
+class ObjectStore:
+    """
+    Reads objects of a repository straight from its object directory, without
+    starting git or going through GitPython.
+
+    Loose objects and packs are supported. Alternates, multi-pack indexes and
+    SHA-256 repositories are not. The commit-graph is loaded if there is one.
+    """
+
+    def __init__(self, git_dir):
+        # linked worktrees share the objects of the main repository
+        self.objects_dir = os.path.join(get_common_dir(git_dir), "objects")
+        pack_dir = os.path.join(self.objects_dir, "pack")
+        names = os.listdir(pack_dir) if os.path.isdir(pack_dir) else []
+        self.packs = [
+            Pack(os.path.join(pack_dir, name), self)
+            for name in sorted(names)
+            if name.endswith(".pack")
+        ]
+
+        graph_path = os.path.join(self.objects_dir, "info", "commit-graph")
+        self.commit_graph = None
+        if os.path.isfile(graph_path):
+            self.commit_graph = CommitGraph(graph_path)
+
+    def _loose_path(self, hexsha):
+        return os.path.join(self.objects_dir, hexsha[:2], hexsha[2:])
+
+    def read(self, hexsha):
+        """
+        Reads an object.
+
+        :param hexsha:
+            The full hexadecimal SHA of the object.
+
+        :return:
+            A tuple of type name and content.
+
+        :raises KeyError:
+            If the object does not exist.
+        """
+        sha = unhexlify(hexsha)
+        for pack in self.packs:
+            offset = pack.index.offset(sha)
+            if offset is not None:
+                return pack.read(offset)
+
+        try:
+            with open(self._loose_path(hexsha), "rb") as f:
+                data = zlib.decompress(f.read())
+        except FileNotFoundError:
+            raise KeyError(hexsha) from None
+        header, _, content = data.partition(b"\0")
+        return header.split()[0].decode(), content
+
+    def find_prefix(self, prefix):
+        """
+        Returns the full SHAs of all objects starting with a hexadecimal prefix.
+        """
+        prefix = prefix.lower()
+        matches = set()
+        for pack in self.packs:
+            matches.update(
+                hexlify(sha).decode() for sha in pack.index.find_prefix(prefix)
+            )
+
+        directory = os.path.join(self.objects_dir, prefix[:2])
+        if os.path.isdir(directory):
+            matches.update(
+                prefix[:2] + name
+                for name in os.listdir(directory)
+                if name.startswith(prefix[2:])
+            )
+        return sorted(matches)
+
+    def close(self):
+        for pack in self.packs:
+            pack.close()
+        self.packs = []
+        if self.commit_graph is not None:
+            self.commit_graph.close()
+            self.commit_graph = None
@@ -0,0 +1,446 @@
+from heapq import heappop, heappush
+from itertools import count
+import re
+import subprocess
+
+from cactuskeeper.objects import GENERATION_INFINITY, ObjectStore
+from cactuskeeper.refs import read_ref, read_shallow_commits
+from cactuskeeper.stats import stats
+
+LOG_FORMAT = "--format=%H %ct %P%n%B"
+
+# the number of commits walked beyond the last one which may reach the result,
+# without generation numbers, like git's SLOP
+WALK_SLOP = 5
+
+
+class CommitRecord:
+    """
+    A lightweight stand-in for a GitPython ``Commit`` holding only the data
+    cactuskeeper needs: the SHA, the parent SHAs, the commit message and the
+    committer timestamp.
+    """
+
+    __slots__ = ("hexsha", "parent_shas", "message", "committed_date")
+
+    def __init__(self, hexsha, parent_shas=(), message="", committed_date=0):
+        self.hexsha = hexsha
+        self.parent_shas = parent_shas
+        self.message = message
+        self.committed_date = committed_date
+
+    @property
+    def parents(self):
+        return [CommitRecord(sha) for sha in self.parent_shas]
+
+
+def parse_log_record(record):
+    """
+    Parses a single record written by ``git log`` using ``LOG_FORMAT``.
+
+    :param record:
+        The raw bytes of the record, without the terminating NUL byte.
+
+    :return:
+        A CommitRecord.
+    """
+    header, _, message = record.decode("utf-8", "replace").partition("\n")
+    hexsha, timestamp, *parent_shas = header.split()
+    return CommitRecord(hexsha, tuple(parent_shas), message, int(timestamp))
+
+
+def parse_commit_object(data):
+    """
+    Parses the content of a commit object.
+
+    :param data:
+        The raw bytes of the commit object.
+
+    :return:
+        A tuple of the parent SHAs, the committer timestamp and the message.
+    """
+    headers, _, message = data.decode("utf-8", "replace").partition("\n\n")
+    parent_shas = []
+    timestamp = 0
+    for line in headers.split("\n"):
+        if line.startswith("parent "):
+            parent_shas.append(line.split()[1])
+        elif line.startswith("committer "):
+            timestamp = int(line.rsplit(" ", 2)[1])
+    return tuple(parent_shas), timestamp, message
+
+
+class GitPythonReader:
+    """
+    Reads commits through GitPython, loading every commit object on demand.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def iter_commits(self, rev, topo_order=False, grep=None):
+        # GitPython runs one git rev-list process per walk
+        stats.count("git subprocesses")
+        options = {}
+        if topo_order:
+            options["topo_order"] = True
+        if grep is not None:
+            options["grep"] = grep
+        return self.repo.iter_commits(rev, **options)
+
+    def commit(self, hexsha):
+        # GitPython loads the commit object when its data is first accessed
+        return self.repo.commit(hexsha)
+
+    def close(self):
+        pass
+
+
+class StreamReader:
+    """
+    Reads commits by streaming NUL delimited records from a single ``git log``
+    process per walk. Single commits are looked up through one long-lived
+    ``git cat-file --batch`` process.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, repo):
+        self.git_dir = repo.git_dir
+        self._batch = None
+
+    def _git(self, *args):
+        return ["git", "--git-dir", self.git_dir, *args]
+
+    def iter_commits(self, rev, topo_order=False, grep=None):
+        """
+        Walks the history of one or more revisions.
+
+        :param rev:
+            A revision, revision range or a list of them.
+        :param topo_order:
+            If True, no parent is shown before all of its children.
+        :param grep:
+            If given, only commits with a message line matching this regular
+            expression are returned.
+        """
+        revs = [str(r) for r in rev] if isinstance(rev, list) else [str(rev)]
+        options = ["--topo-order"] if topo_order else []
+        if grep is not None:
+            options.append("--grep=" + grep)
+        stats.count("git subprocesses")
+        process = subprocess.Popen(
+            self._git("log", "-z", LOG_FORMAT, *options, *revs, "--"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            buffer = b""
+            for chunk in iter(lambda: process.stdout.read(self.chunk_size), b""):
+                *records, buffer = (buffer + chunk).split(b"\0")
+                for record in records:
+                    yield parse_log_record(record)
+        finally:
+            # the consumer may stop early, don't leave the process running
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            stderr = process.stderr.read()
+            process.stderr.close()
+            process.wait()
+
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(
+                process.returncode, process.args, stderr=stderr
+            )
+
+    def commit(self, hexsha):
+        """
+        Loads a single commit through the ``git cat-file --batch`` process.
+
+        :param hexsha:
+            The SHA of the commit, abbreviated SHAs are accepted.
+
+        :return:
+            A CommitRecord or None if no such commit exists.
+        """
+        if self._batch is None:
+            stats.count("git subprocesses")
+            self._batch = subprocess.Popen(
+                self._git("cat-file", "--batch"),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+
+        self._batch.stdin.write(hexsha.encode() + b"\n")
+        self._batch.stdin.flush()
+
+        header = self._batch.stdout.readline().split()
+        if len(header) != 3 or header[1] != b"commit":
+            if len(header) == 3:
+                # skip the contents of objects which are not commits
+                self._batch.stdout.read(int(header[2]) + 1)
+            return None
+
+        data = self._batch.stdout.read(int(header[2]) + 1)[:-1]
+        parent_shas, timestamp, message = parse_commit_object(data)
+        return CommitRecord(header[0].decode(), parent_shas, message, timestamp)
+
+    def close(self):
+        if self._batch is not None:
+            self._batch.stdin.close()
+            self._batch.wait()
+            self._batch = None
+
+
+def open_async_reader(repo):
+    """
+    Creates an AsyncReader, see ``cactuskeeper.aiogit``. asyncio takes a while
+    to import, so it is only imported when the reader is used.
+    """
+    from cactuskeeper.aiogit import AsyncReader
+
+    return AsyncReader(repo)
+
+
+HEXSHA = re.compile(r"^[0-9a-fA-F]{4,40}$")
+
+
+class PackReader:
+    """
+    Reads commits straight from the loose objects and pack files of a
+    repository, see ``cactuskeeper.objects``. No git process is started.
+
+    Like ``git log``, walks are ordered by committer date, newest first. When
+    the repository has a commit-graph, its parents and generation numbers are
+    used to walk excluded history without inflating commit objects, and to
+    tell exactly when the excluded history is walked far enough. Without
+    generation numbers, ranges are cut off like git does, which relies on
+    commit dates hardly going back in time along the history.
+
+    Like git, commits at the boundary of a shallow clone have no parents.
+    """
+
+    def __init__(self, repo):
+        self.git_dir = repo.git_dir
+        self.store = ObjectStore(self.git_dir)
+        self.shallow = read_shallow_commits(self.git_dir)
+
+    def resolve(self, rev):
+        """
+        Resolves a ref name, a full or an abbreviated SHA to the SHA of a commit.
+
+        :raises ValueError:
+            If the revision does not name a commit.
+        """
+        rev = str(rev)
+        candidates = [rev, "refs/" + rev]
+        candidates += ["refs/{0}/{1}".format(kind, rev) for kind in ("tags", "heads")]
+        candidates += ["refs/remotes/" + rev, "refs/remotes/{0}/HEAD".format(rev)]
+        for name in candidates:
+            hexsha = read_ref(self.git_dir, name)
+            if hexsha is not None:
+                break
+        else:
+            matches = self.store.find_prefix(rev) if HEXSHA.match(rev) else []
+            if len(matches) != 1:
+                raise ValueError("Unknown revision '{0}'".format(rev))
+            hexsha = matches[0]
+
+        # peel annotated tags
+        kind, data = self.store.read(hexsha)
+        while kind == "tag":
+            hexsha = data.split(b"\n", 1)[0].split()[1].decode()
+            kind, data = self.store.read(hexsha)
+        if kind != "commit":
+            raise ValueError("Revision '{0}' is not a commit".format(rev))
+        return hexsha
+
+    def _load(self, hexsha):
+        parent_shas, timestamp, message = parse_commit_object(
+            self.store.read(hexsha)[1]
+        )
+        if hexsha in self.shallow:
+            parent_shas = ()
+        return CommitRecord(hexsha, parent_shas, message, timestamp), timestamp
+
+    def _node(self, hexsha):
+        # parents, commit time and generation, from the commit-graph if possible
+        graph = self.store.commit_graph
+        node = graph.lookup(hexsha) if graph is not None else None
+        if node is not None:
+            if hexsha in self.shallow:
+                node = ((),) + node[1:]
+            return node + (None,)
+        record, timestamp = self._load(hexsha)
+        return record.parent_shas, timestamp, GENERATION_INFINITY, record
+
+    def _walk(self, include, exclude):
+        # Commits reachable from an excluded revision are marked uninteresting.
+        # A walk with exclusions is only returned once no remaining uninteresting
+        # commit can reach a commit already visited. Uninteresting commits found
+        # in the commit-graph are never inflated.
+        uninteresting = {}
+        marked = set()
+        nodes = {}
+        visited = {}
+        queue = []
+        order = count()
+        pending = 0
+
+        def mark(hexsha):
+            # Like git, the mark is passed on to the parents of all commits
+            # loaded so far. Commits not loaded yet are queued uninteresting.
+            nonlocal pending
+            stack = [hexsha]
+            while stack:
+                hexsha = stack.pop()
+                if hexsha not in uninteresting:
+                    marked.add(hexsha)
+                elif not uninteresting[hexsha]:
+                    uninteresting[hexsha] = True
+                    pending -= hexsha not in visited
+                    stack.extend(nodes[hexsha][0])
+
+        def push(hexsha, excluded):
+            nonlocal pending
+            if hexsha in uninteresting:
+                if excluded:
+                    mark(hexsha)
+                return
+            excluded = excluded or hexsha in marked
+            uninteresting[hexsha] = excluded
+            pending += not excluded
+            nodes[hexsha] = self._node(hexsha)
+            heappush(queue, (-nodes[hexsha][1], next(order), hexsha))
+            if excluded:
+                for parent in nodes[hexsha][0]:
+                    mark(parent)
+
+        def may_reach_visited():
+            nonlocal slop
+            # a commit only reaches commits with a lower generation
+            reaching = [
+                nodes[hexsha][2]
+                for _, _, hexsha in queue
+                if nodes[hexsha][2] == GENERATION_INFINITY or nodes[hexsha][2] > lowest
+            ]
+            if GENERATION_INFINITY not in reaching:
+                return bool(reaching)
+
+            # Without generation numbers, do like git: assume that commits older
+            # than the last visited one do not reach it, but walk a few more of
+            # them in case commit dates are skewed.
+            if -queue[0][0] >= oldest:
+                slop = WALK_SLOP
+            else:
+                slop -= 1
+            return slop > 0
+
+        for hexsha in exclude:
+            push(hexsha, True)
+        for hexsha in include:
+            push(hexsha, False)
+
+        oldest = lowest = GENERATION_INFINITY
+        slop = WALK_SLOP
+        while queue:
+            hexsha = heappop(queue)[2]
+            parent_shas, timestamp, generation, record = nodes[hexsha]
+            excluded = uninteresting[hexsha]
+            if not excluded:
+                pending -= 1
+                oldest = timestamp
+                lowest = min(lowest, generation)
+                slop = WALK_SLOP
+                if not exclude:
+                    yield record or self._load(hexsha)[0]
+            if exclude:
+                visited[hexsha] = True
+            for parent in parent_shas:
+                push(parent, excluded)
+            if excluded and not pending and queue and not may_reach_visited():
+                break
+
+        for hexsha in visited:
+            if not uninteresting[hexsha]:
+                yield nodes[hexsha][3] or self._load(hexsha)[0]
+
+    def _topo_sort(self, records):
+        # children come before their parents, lines of history are kept together
+        by_sha = {record.hexsha: record for record in records}
+        children = dict.fromkeys(by_sha, 0)
+        for record in records:
+            for parent in record.parent_shas:
+                if parent in children:
+                    children[parent] += 1
+
+        stack = [record for record in records if not children[record.hexsha]]
+        stack.reverse()
+        while stack:
+            record = stack.pop()
+            yield record
+            for parent in record.parent_shas:
+                if parent in children:
+                    children[parent] -= 1
+                    if not children[parent]:
+                        stack.append(by_sha[parent])
+
+    def iter_commits(self, rev, topo_order=False, grep=None):
+        """
+        Walks the history of one or more revisions.
+
+        :param rev:
+            A revision, revision range or a list of them. Revisions prefixed
+            with ``^`` are excluded with their history.
+        :param topo_order:
+            If True, no parent is shown before all of its children.
+        :param grep:
+            If given, only commits with a message line matching this regular
+            expression are returned.
+        """
+        include = []
+        exclude = []
+        for value in rev if isinstance(rev, list) else [rev]:
+            value = str(value)
+            if value.startswith("^"):
+                exclude.append(self.resolve(value[1:]))
+                continue
+            if ".." in value:
+                excluded, _, value = value.partition("..")
+                exclude.append(self.resolve(excluded))
+            include.append(self.resolve(value))
+
+        commits = self._walk(include, exclude)
+        if topo_order:
+            commits = self._topo_sort(list(commits))
+        if grep is not None:
+            pattern = re.compile(grep, re.MULTILINE)
+            commits = (c for c in commits if pattern.search(c.message))
+        yield from commits
+
+    def commit(self, hexsha):
+        """
+        Loads a single commit.
+
+        :param hexsha:
+            The SHA of the commit, abbreviated SHAs are accepted.
+
+        :return:
+            A CommitRecord or None if no such commit exists.
+        """
+        try:
+            return self._load(self.resolve(hexsha))[0]
+        except (KeyError, ValueError):
+            return None
+
+    def close(self):
+        self.store.close()
+
+
+READERS = {
+    "async": open_async_reader,
+    "gitpython": GitPythonReader,
+    "pack": PackReader,
+    "stream": StreamReader,
+}
@@ -0,0 +1,109 @@
+import os
+import re
+
+# the names of refs and of pseudo-refs like HEAD or ORIG_HEAD
+REF_NAME = re.compile(r"^(refs/.+|[A-Z][A-Z0-9_]*)$")
+
+# a full SHA as stored in a ref file
+HEXSHA = re.compile(r"^[0-9a-f]{40}$")
+
+
+def get_common_dir(git_dir):
+    """
+    Returns the directory holding the refs shared by all worktrees of a repository.
+    """
+    try:
+        with open(os.path.join(git_dir, "commondir")) as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except FileNotFoundError:
+        return git_dir
+
+
+def iter_packed_refs(git_dir, prefix=""):
+    """
+    Yields the name and SHA of the refs in ``packed-refs`` starting with a prefix.
+
+    Lines are filtered by the prefix before they are split, so refs outside of
+    it cost next to nothing.
+    """
+    try:
+        with open(os.path.join(get_common_dir(git_dir), "packed-refs")) as f:
+            for line in f:
+                # lines are "<40 hex digits> <name>", others are comments or peeled tags
+                if line.startswith(prefix, 41) and line[40:41] == " ":
+                    yield line[41:].rstrip("\n"), line[:40]
+    except FileNotFoundError:
+        return
+
+
+def read_ref(git_dir, name):
+    """
+    Reads the SHA a ref points to, following symbolic refs.
+
+    Only names below ``refs/`` and all-caps pseudo-refs like ``HEAD`` are refs,
+    other files in the git directory, like ``config``, are not.
+
+    :return:
+        The SHA or None if there is no such ref.
+    """
+    if not REF_NAME.match(name) or ".." in name:
+        return None
+
+    for directory in (git_dir, get_common_dir(git_dir)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path) as f:
+                value = f.read().strip()
+            if value.startswith("ref: "):
+                return read_ref(git_dir, value[5:])
+            return value if HEXSHA.match(value) else None
+
+    for ref, hexsha in iter_packed_refs(git_dir, name):
+        if ref == name:
+            return hexsha
+    return None
+
+
+def iter_refs(git_dir, prefix):
+    """
+    Lists the refs whose full name starts with a prefix, e.g. ``refs/heads/release/``.
+
+    Only the directory of the prefix is searched for loose refs, so enumerating
+    a few release branches stays fast among thousands of other branches.
+    Symbolic refs like ``refs/remotes/origin/HEAD`` are skipped.
+
+    :return:
+        A sorted list of ``(name, hexsha)`` tuples.
+    """
+    common_dir = get_common_dir(git_dir)
+    refs = dict(iter_packed_refs(git_dir, prefix))
+
+    # loose refs take precedence over packed ones
+    directory = os.path.join(common_dir, os.path.dirname(prefix))
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, common_dir).replace(os.sep, "/")
+            if not name.startswith(prefix) or name.endswith(".lock"):
+                continue
+            with open(path) as f:
+                value = f.read().strip()
+            if not value.startswith("ref: "):
+                refs[name] = value
+
+    return sorted(refs.items())
+
+
+def read_shallow_commits(git_dir):
+    """
+    Reads the SHAs of the commits at the boundary of a shallow clone, whose
+    parents are missing from the repository.
+
+    :return:
+        A set of SHAs, empty for complete clones.
+    """
+    try:
+        with open(os.path.join(get_common_dir(git_dir), "shallow")) as f:
+            return set(f.read().split())
+    except FileNotFoundError:
+        return set()
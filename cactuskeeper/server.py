@@ -0,0 +1,206 @@
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+
+from git import Repo
+
+from cactuskeeper.cache import CheckResultCache, CommitCache
+from cactuskeeper.files import read_config_file
+from cactuskeeper.git import (
+    BranchHistory,
+    check_current_branch,
+    get_latest_release_commit,
+)
+from cactuskeeper.messages import MessageParser
+from cactuskeeper.readers import READERS
+from cactuskeeper.refs import iter_refs
+
+
+class RepositoryState:
+    """
+    The warm state of a repository served by the daemon.
+
+    Parsed commits are kept in a CommitCache and check results in a
+    CheckResultCache in memory, keyed by the branch tips they were computed
+    for. Release logs are memoized by the SHAs of the branch tips as well.
+    """
+
+    def __init__(self, path, reader="gitpython"):
+        self.path = path
+        self.repo = Repo(path)
+        self.parser = MessageParser(read_config_file(path)["issue_patterns"])
+        self.cache = CommitCache.for_repo(self.repo, parser=self.parser)
+        self.results = CheckResultCache(parser=self.parser)
+        self.reader_name = reader
+        self.reader = READERS[reader](self.repo)
+        self.lock = threading.Lock()
+        self.tips = {}
+        # tip SHA -> latest release CommitMetadata
+        self.releases = {}
+        # tip SHA -> BranchHistory
+        self.histories = {}
+
+    def refresh(self):
+        """
+        Reads the current branch tips and drops memoized results of tips
+        that no longer exist.
+        """
+        # read from the git directory, without loading a commit per branch
+        tips = {
+            name[len("refs/heads/") :]: hexsha
+            for name, hexsha in iter_refs(self.repo.git_dir, "refs/heads/")
+        }
+        if tips == self.tips:
+            return
+
+        self.tips = tips
+        current = set(tips.values())
+        self.releases = {k: v for k, v in self.releases.items() if k in current}
+        for tip in set(self.histories) - current:
+            self.histories.pop(tip).close()
+
+    def check(self, remote=None, match_patch_ids=False):
+        return check_current_branch(
+            self.repo,
+            read_config_file(self.path),
+            self.reader_name,
+            remote=remote,
+            match_patch_ids=match_patch_ids,
+            parser=self.parser,
+            cache=self.cache,
+            reader=self.reader,
+            result_cache=self.results,
+        )
+
+    def release_log(self, base=None):
+        current_branch = self.repo.active_branch
+        tip = self.tips[str(current_branch)]
+
+        if tip not in self.releases:
+            self.releases[tip] = get_latest_release_commit(
+                self.repo, tip, reader=self.reader
+            )
+        release = self.releases[tip]
+        if release is None:
+            raise ValueError("No release found on the branch")
+        if base is None:
+            base = release.hexsha
+
+        if tip not in self.histories:
+            self.histories[tip] = BranchHistory(
+                self.repo, tip, self.cache, self.reader, self.parser
+            )
+        commits = self.histories[tip].commits_since(base)
+
+        return {
+            "version": release.version,
+            "base": base,
+            "found": commits is not None,
+            "commits": [[c.shortlog, c.issue] for c in commits or []],
+        }
+
+    def close(self):
+        for history in self.histories.values():
+            history.close()
+        self.reader.close()
+        self.cache.save()
+        self.repo.close()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line.strip():
+            # e.g. ``remove_stale_socket`` of another daemon probing the socket
+            return
+        try:
+            request = json.loads(line)
+            response = self.server.handle_request_data(request)
+        except Exception as error:
+            response = {"error": "{0}: {1}".format(type(error).__name__, error)}
+        try:
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+        except OSError:
+            # the client went away without waiting for the response
+            pass
+
+
+def remove_stale_socket(socket_path):
+    """
+    Removes the socket of a daemon which is not running anymore, e.g. after
+    it was killed. Anything else at the path is left alone.
+
+    :raises ValueError:
+        If the path is not a socket or a daemon still listens on it.
+    """
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError("'{0}' exists and is not a socket".format(socket_path))
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)
+            return
+    raise ValueError("A daemon is already listening on '{0}'".format(socket_path))
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    """
+    Answers check, release-log and config queries for any number of
+    repositories over a Unix socket, keeping their state warm between queries.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, reader="gitpython"):
+        """
+        :raises ValueError:
+            If something else than a stale socket exists at ``socket_path``.
+        """
+        remove_stale_socket(socket_path)
+        super().__init__(socket_path, RequestHandler)
+        self.reader = reader
+        self.states = {}
+        self.states_lock = threading.Lock()
+
+    def get_state(self, path):
+        path = os.path.realpath(path)
+        with self.states_lock:
+            if path not in self.states:
+                self.states[path] = RepositoryState(path, self.reader)
+            return self.states[path]
+
+    def handle_request_data(self, request):
+        command = request["command"]
+
+        if command == "shutdown":
+            # shutdown blocks until serve_forever returns, don't delay the response
+            threading.Thread(target=self.shutdown).start()
+            return {}
+        if command == "config":
+            return {"config": read_config_file(request["repo"])}
+        if command not in ("check", "release-log"):
+            raise ValueError("Unknown command '{0}'".format(command))
+
+        state = self.get_state(request["repo"])
+        # GitPython repositories must not be used by several threads at once
+        with state.lock:
+            state.refresh()
+            if command == "check":
+                return state.check(request.get("remote"), request.get("patch_id"))
+            return state.release_log(request.get("base"))
+
+    def server_close(self):
+        super().server_close()
+        for state in self.states.values():
+            state.close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
@@ -0,0 +1,71 @@
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+import threading
+import time
+
+
+class Stats:
+    """
+    Collects the time spent in the phases of a run and counts events like
+    walked commits, cache hits or started git subprocesses.
+
+    Phases can be nested, the time spent in a nested phase is not counted for
+    the enclosing one. Timings of phases running in several threads add up.
+    Nothing is collected until ``enabled`` is set.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timings = defaultdict(float)
+            self.counters = defaultdict(int)
+
+    def _stack(self):
+        return self._local.__dict__.setdefault("stack", [])
+
+    def phase(self, name):
+        """
+        Returns a context manager timing a phase. It is a no-op while
+        collection is disabled, so it is cheap enough to be used per commit.
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._timed_phase(name)
+
+    @contextmanager
+    def _timed_phase(self, name):
+        stack = self._stack()
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            nested = stack.pop()
+            self.record(name, time.perf_counter() - start, nested)
+
+    def record(self, name, seconds, nested=0.0):
+        """
+        Adds the duration of a phase, excluding the time of nested phases.
+        """
+        stack = self._stack()
+        if stack:
+            stack[-1] += seconds
+        with self._lock:
+            self.timings[name] += seconds - nested
+
+    def count(self, name, number=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += number
+
+    def as_dict(self):
+        return {"timings": dict(self.timings), "counters": dict(self.counters)}
+
+
+# statistics of the whole run, see ``Stats``
+stats = Stats()
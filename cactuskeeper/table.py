@@ -0,0 +1,93 @@
+from array import array
+from binascii import hexlify, unhexlify
+from bisect import bisect_left
+
+# the packed version of commits which are not release commits
+NO_VERSION = -1
+
+
+def pack_version(version):
+    """
+    Packs a version like ``1.2.3`` into an integer, 16 bits per number.
+    Empty versions are packed to ``NO_VERSION``.
+    """
+    if not version:
+        return NO_VERSION
+    major, minor, micro = (int(number) for number in version.split("."))
+    return major << 32 | minor << 16 | micro
+
+
+def unpack_version(packed):
+    if packed == NO_VERSION:
+        return ""
+    return "{0}.{1}.{2}".format(packed >> 32, packed >> 16 & 0xFFFF, packed & 0xFFFF)
+
+
+class CommitTable:
+    """
+    A compact table of the commits of a walk, in the order they were added.
+
+    Instead of one Python object per commit, the binary SHAs, issue ids and
+    packed versions are kept in parallel arrays, about 32 bytes per commit.
+    Issue numbers are stored once in ``issue_names`` and referenced by their
+    position in it, -1 meaning no issue.
+    """
+
+    def __init__(self):
+        self.shas = bytearray()
+        self.issues = array("l")
+        self.versions = array("q")
+        self.issue_names = []
+        self._issue_ids = {}
+        # positions sorted by SHA, built when the table is searched
+        self._by_sha = array("l")
+
+    def __len__(self):
+        return len(self.issues)
+
+    def append(self, hexsha, issue="", version=""):
+        if issue and issue not in self._issue_ids:
+            self._issue_ids[issue] = len(self.issue_names)
+            self.issue_names.append(issue)
+
+        self.shas += unhexlify(hexsha)
+        self.issues.append(self._issue_ids[issue] if issue else -1)
+        self.versions.append(pack_version(version))
+
+    def sha(self, position):
+        """
+        Returns the binary SHA of the commit at a position.
+        """
+        return bytes(self.shas[20 * position : 20 * position + 20])
+
+    def hexsha(self, position):
+        return hexlify(self.sha(position)).decode()
+
+    def issue(self, position):
+        issue_id = self.issues[position]
+        return self.issue_names[issue_id] if issue_id >= 0 else ""
+
+    def version(self, position):
+        return unpack_version(self.versions[position])
+
+    def find_prefix(self, prefix):
+        """
+        Returns the positions of the commits whose SHA starts with a
+        hexadecimal prefix, in the order they were added.
+        """
+        try:
+            # an odd number of hex digits sorts between the two padded prefixes
+            low = unhexlify(prefix.ljust(40, "0"))
+        except ValueError:
+            return []
+
+        if len(self._by_sha) != len(self):
+            self._by_sha = array("l", sorted(range(len(self)), key=self.sha))
+
+        positions = []
+        for index in range(bisect_left(self._by_sha, low, key=self.sha), len(self)):
+            position = self._by_sha[index]
+            if not self.hexsha(position).startswith(prefix):
+                break
+            positions.append(position)
+        return sorted(positions)
@@ -1,6 +1,8 @@
 from collections import defaultdict
 import configparser
 import os
+import re
+import subprocess
 import uuid
 
 import mock
@@ -13,13 +15,14 @@ class MockRepo(mock.MagicMock):
     def __init__(self, branches):
         super().__init__()
         self.branches = branches
+        self.git_dir = None
         self.commits = defaultdict(list)
         self.commits_by_sha = {}
         self._active_branch = None
 
     def add_commit(self, branch, commit_message, sha=None):
         if sha is None:
-            sha = str(uuid.uuid4()).replace("-", "")
+            sha = uuid.uuid4().hex + uuid.uuid4().hex[:8]
 
         commit = mock.Mock(message=commit_message, hexsha=str(sha), parents=[])
 
@@ -39,10 +42,40 @@ class MockRepo(mock.MagicMock):
     def add_existing_commit(self, branch, sha):
         self.commits[branch].insert(0, self.commits_by_sha[sha])
 
-    def iter_commits(self, branch, max_count=None):
-
-        for commit in self.commits[branch]:
-            yield commit
+    def history(self, rev):
+        if rev not in self.commits_by_sha:
+            return self.commits[rev]
+
+        # follow the first parents of a commit given by its SHA
+        commits = [self.commits_by_sha[rev]]
+        while commits[-1].parents:
+            commits.append(commits[-1].parents[0])
+        return commits
+
+    def iter_commits(self, rev, max_count=None, grep=None):
+        branch = None
+        excluded = set()
+        for value in rev if isinstance(rev, list) else [rev]:
+            # support "base..branch" revision ranges and "^base" exclusions
+            base, _, value = str(value).rpartition("..")
+            if value.startswith("^"):
+                base = value[1:]
+            else:
+                branch = value
+            if base:
+                excluded.update(c.hexsha for c in self.history(base))
+
+        for commit in self.history(branch):
+            if commit.hexsha in excluded:
+                continue
+            if grep is None or re.search(grep, commit.message, re.MULTILINE):
+                yield commit
+
+    def commit(self, rev):
+        return self.commits_by_sha.get(rev) or self.commits[rev][0]
+
+    def close(self):
+        pass
 
     @property
     def active_branch(self):
@@ -52,6 +85,60 @@ class MockRepo(mock.MagicMock):
             return self._active_branch
 
 
+class GitRepo:
+    """
+    A real git repository on disk, for tests which need git itself.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.git("init", "-q", "-b", "master")
+
+    def git(self, *args, input=None):
+        env = dict(
+            os.environ,
+            GIT_AUTHOR_NAME="cactuskeeper",
+            GIT_AUTHOR_EMAIL="test@example.com",
+            GIT_COMMITTER_NAME="cactuskeeper",
+            GIT_COMMITTER_EMAIL="test@example.com",
+            GIT_CONFIG_GLOBAL=os.devnull,
+            GIT_CONFIG_NOSYSTEM="1",
+        )
+        return subprocess.run(
+            ["git", "-C", self.path, *args],
+            check=True,
+            capture_output=True,
+            text=True,
+            env=env,
+            input=input,
+        ).stdout.strip()
+
+    def commit(self, message, files=None):
+        """
+        Creates a commit on the checked out branch and returns its SHA.
+
+        :param files:
+            An optional dict mapping file names to their new content.
+            Without files an empty commit is created.
+        """
+        for name, content in (files or {}).items():
+            with open(os.path.join(self.path, name), "w") as f:
+                f.write(content)
+            self.git("add", name)
+        self.git("commit", "-q", "--allow-empty", "-m", message)
+        return self.git("rev-parse", "HEAD")
+
+    def commits(self, messages):
+        return [self.commit(message) for message in messages]
+
+    def branch(self, name, start="HEAD"):
+        self.git("branch", name, start)
+
+    def checkout(self, name):
+        self.git("checkout", "-q", name)
+
+
 def write_config_file(base_dir, content):
     """
     Writes a new setup.cfg file with a "cactuskeeper" section to a given directory.
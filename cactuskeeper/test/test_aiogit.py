@@ -0,0 +1,30 @@
+import asyncio
+
+from cactuskeeper.aiogit import iter_records, start_git, stop_git
+from cactuskeeper.test.helpers import GitRepo
+
+
+def test_concurrent_processes(tmpdir):
+    repo = GitRepo(tmpdir)
+    shas = repo.commits(["a", "b"])
+    git_dir = str(tmpdir.join(".git"))
+
+    async def walk(rev):
+        process = await start_git(git_dir, "rev-list", rev)
+        return [
+            sha.decode()
+            async for block in iter_records(process, b"\n")
+            for sha in block
+        ]
+
+    async def main():
+        # waits for input until it is stopped
+        batch = await start_git(git_dir, "cat-file", "--batch", stdin=True)
+        walks = await asyncio.gather(walk("HEAD"), walk("HEAD~1"))
+        assert batch.returncode is None
+        await stop_git(batch)
+        return walks, batch.returncode
+
+    walks, returncode = asyncio.run(main())
+    assert walks == [shas[::-1], shas[:1]]
+    assert returncode < 0
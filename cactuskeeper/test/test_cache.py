@@ -0,0 +1,224 @@
+import json
+
+from mock import Mock
+import pytest
+
+from cactuskeeper.cache import (
+    CheckResultCache,
+    CommitCache,
+    FixIndex,
+    parse_version_query,
+    ReleaseIndex,
+    ShaCache,
+)
+from cactuskeeper.git import CommitMetadata, get_bugfixes_for_branch
+from cactuskeeper.messages import MessageParser
+from cactuskeeper.test.helpers import MockRepo
+
+
+def test_cache_without_git_dir():
+    cache = CommitCache.for_repo(MockRepo(branches=["master"]))
+
+    assert cache.path is None
+    cache.put("abc", ["shortlog", "", ""])
+    cache.save()
+    assert cache.get("abc") == ["shortlog", "", ""]
+
+
+def test_cache_roundtrip(tmpdir):
+    repo = Mock(git_dir=str(tmpdir))
+
+    cache = CommitCache.for_repo(repo)
+    assert cache.get("abc") is None
+
+    # saving an unchanged cache does not create a file
+    cache.save()
+    assert not tmpdir.join("cactuskeeper", "commits.json").exists()
+
+    cache.put("abc", ["fix: something", "#1", ""])
+    cache.save()
+    assert not cache.dirty
+
+    assert CommitCache.for_repo(repo).get("abc") == ["fix: something", "#1", ""]
+
+    # commits parsed for other issue patterns are parsed again
+    parser = MessageParser([r"[A-Z]+-\d+"])
+    assert CommitCache.for_repo(repo, parser=parser).get("abc") is None
+
+
+def test_cache_fingerprint_mismatch(tmpdir):
+    path = str(tmpdir.join("cache.json"))
+
+    cache = ShaCache(path, fingerprint="old")
+    cache.put("abc", 1)
+    cache.save()
+
+    assert ShaCache(path, fingerprint="old").get("abc") == 1
+    assert ShaCache(path, fingerprint="new").get("abc") is None
+
+
+def test_cache_version_mismatch(tmpdir):
+    path = tmpdir.join("cache.json")
+    path.write(json.dumps({"version": 0, "fingerprint": "", "entries": {"abc": 1}}))
+
+    assert ShaCache(str(path)).get("abc") is None
+
+
+def test_cache_corrupt_file(tmpdir):
+    path = tmpdir.join("cache.json")
+    path.write("{ not json")
+
+    assert ShaCache(str(path)).entries == {}
+
+
+def test_commit_metadata_uses_cache():
+    cache = CommitCache()
+    commit = Mock(message="fix: something \n #1", hexsha="abc")
+
+    metadata = CommitMetadata(commit, cache)
+    assert cache.get("abc") == ["fix: something", "#1", ""]
+
+    # a cached commit is not parsed again
+    commit = Mock(hexsha="abc", spec=["hexsha"])
+    metadata = CommitMetadata(commit, cache)
+    assert metadata.issue == "#1"
+    assert metadata.shortlog == "fix: something"
+
+
+def test_get_bugfixes_with_cache():
+    repo = MockRepo(branches=["master"])
+    repo.add_commits("master", ["fix: something1 \n #1", "fix: something2 \n #2"])
+    cache = CommitCache()
+
+    first = get_bugfixes_for_branch(repo, "master", cache=cache)
+    second = get_bugfixes_for_branch(repo, "master", cache=cache)
+
+    assert len(cache.entries) == 2
+    assert first.keys() == second.keys() == {"#1", "#2"}
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("3", (3,)),
+        ("3.x", (3,)),
+        ("3.1.X", (3, 1)),
+        ("3.1.*", (3, 1)),
+        ("1.2.3", (1, 2, 3)),
+    ],
+)
+def test_parse_version_query(query, expected):
+    assert parse_version_query(query) == expected
+
+
+def test_parse_version_query_invalid():
+    with pytest.raises(ValueError):
+        parse_version_query("3.y")
+
+
+def test_release_index(tmpdir):
+    repo = Mock(git_dir=str(tmpdir))
+
+    index = ReleaseIndex.for_repo(repo)
+    for hexsha, version in [
+        ("a", "2.9.0"),
+        ("b", "3.0.0"),
+        ("c", "3.1.0"),
+        ("d", "3.10.1"),
+    ]:
+        index.put(hexsha, version)
+    index.set_branch("release/v3.0", "tip-3.0", ["b", "a"])
+    index.set_branch("master", "tip", ["d", "c", "b", "a"])
+    index.set_branch("orphan", "tip-orphan", [])
+    index.save()
+
+    index = ReleaseIndex.for_repo(repo)
+    assert index.latest("master") == ("d", "3.10.1")
+    assert index.latest("orphan") is None
+    assert index.shared("master", "release/v3.0") == "b"
+    assert index.shared("master", "orphan") is None
+
+    assert [r[0] for r in index.find("3.x")] == ["3.10.1", "3.1.0", "3.0.0"]
+    assert index.find("3.0") == [("3.0.0", "b", ["master", "release/v3.0"])]
+    assert index.find("3.2.x") == []
+    assert [r[1] for r in index.find()] == ["d", "c", "b", "a"]
+
+    # adding releases updates the version lookup
+    index.put("e", "4.0.0")
+    assert index.find("4") == [("4.0.0", "e", [])]
+
+
+def test_fix_index(tmpdir):
+    repo = Mock(git_dir=str(tmpdir))
+
+    index = FixIndex.for_repo(repo)
+    for hexsha, issue in [("a", "#1"), ("b", "#2"), ("c", "#2"), ("d", "#3")]:
+        index.put(hexsha, issue)
+    index.set_branch("release/v1.0", "tip-1.0", ["d", "c", "b", "a"])
+    index.set_branch("master", "tip", ["a"])
+    index.save()
+
+    index = FixIndex.for_repo(repo)
+    assert index.missing("release/v1.0", "master") == ["d", "c"]
+    assert index.missing("release/v1.0", "master", {"#3"}) == ["c"]
+    assert index.missing("master", "release/v1.0") == []
+
+    previous = dict(index.branches)
+    index.set_branch("master", "new-tip", ["d", "c", "a"])
+    assert index.missing("release/v1.0", "master") == []
+    assert index.missing("release/v1.0", "master", branches=previous) == ["d", "c"]
+
+    index.remove_branch("master")
+    index.remove_branch("unknown")
+    assert list(index.branches) == ["release/v1.0"]
+
+    # the stored fixes depend on the issue patterns
+    index.save()
+    parser = MessageParser([r"[A-Z]+-\d+"])
+    assert FixIndex.for_repo(repo, parser=parser).branches == {}
+
+
+def test_check_result_cache(tmpdir):
+    repo = Mock(git_dir=str(tmpdir))
+
+    key = CheckResultCache.result_key({"master": "a"}, {"ignore_issues": []}, {})
+    assert key == CheckResultCache.result_key(
+        {"master": "a"}, {"ignore_issues": []}, {}
+    )
+    assert key != CheckResultCache.result_key(
+        {"master": "b"}, {"ignore_issues": []}, {}
+    )
+    assert key != CheckResultCache.result_key(
+        {"master": "a"}, {"ignore_issues": ["#1"]}, {}
+    )
+
+    cache = CheckResultCache.for_repo(repo, max_entries=2)
+    cache.put("a", {"missing": []})
+    cache.put("b", {"missing": []})
+    cache.save()
+
+    # reading the newest result does not change the order
+    cache = CheckResultCache.for_repo(repo, max_entries=2)
+    assert cache.get("b") == {"missing": []}
+    assert not cache.dirty
+    assert cache.get("c") is None
+
+    # the least recently used result is evicted
+    assert cache.get("a") == {"missing": []}
+    cache.put("c", {"missing": []})
+    cache.put("c", {"missing": []})
+    assert list(cache.entries) == ["a", "c"]
+
+
+def test_check_result_cache_fingerprint(tmpdir, monkeypatch):
+    repo = Mock(git_dir=str(tmpdir))
+    cache = CheckResultCache.for_repo(repo)
+    cache.put("a", {"missing": []})
+    cache.save()
+    assert CheckResultCache.for_repo(repo).get("a") == {"missing": []}
+
+    # results of other issue patterns or another analysis are not used
+    parser = MessageParser([r"[A-Z]+-\d+"])
+    assert CheckResultCache.for_repo(repo, parser=parser).get("a") is None
+    monkeypatch.setattr("cactuskeeper.cache.ANALYSIS_VERSION", -1)
+    assert CheckResultCache.for_repo(repo).get("a") is None
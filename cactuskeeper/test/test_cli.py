@@ -1,9 +1,16 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+
 from click.testing import CliRunner
 import mock
 import pytest
 
 from cactuskeeper.cli import cli
-from cactuskeeper.test.helpers import MockRepo, write_config_file
+from cactuskeeper.git import ZERO_SHA
+from cactuskeeper.test.helpers import GitRepo, MockRepo, write_config_file
 
 
 def test_help():
@@ -12,6 +19,26 @@ def test_help():
     assert result.exit_code == 0
 
 
+@pytest.mark.parametrize("args", [["--help"], ["config"], ["client", "--help"]])
+def test_startup_imports(args, tmpdir):
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c"]
+        + ["from cactuskeeper.cli import cli; cli()", "--repo", str(tmpdir)]
+        + args,
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode == 0
+    modules = {line.split("|")[-1].strip() for line in process.stderr.splitlines()}
+
+    # GitPython and packaging are only imported by commands reading the history
+    assert "cactuskeeper.cli" in modules
+    assert "git" not in modules
+    assert "packaging" not in modules
+    assert "cactuskeeper.git" not in modules
+    assert "asyncio" not in modules
+
+
 def test_config_without_file():
     runner = CliRunner()
     with runner.isolated_filesystem():
@@ -44,6 +71,15 @@ def test_config():
         )
 
 
+def test_invalid_issue_pattern(tmpdir):
+    write_config_file(str(tmpdir), {"issue_patterns": "#\\d+(?i)"})
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--repo", str(tmpdir), "config"])
+    assert result.exit_code == 1
+    assert "Error: Invalid issue pattern '#\\d+(?i)'" in result.output
+
+
 class TestCheck:
     def test_check_master_clean(self):
         """master is clean if no release branch holds fixes not in master"""
@@ -53,7 +89,7 @@ class TestCheck:
 
         repo.add_existing_commit("master", 1)
 
-        with mock.patch("cactuskeeper.cli.Repo", return_value=repo):
+        with mock.patch("cactuskeeper.cli.open_repo", return_value=repo):
             runner = CliRunner()
             result = runner.invoke(cli, ["check"])
             assert result.exit_code == 0
@@ -80,7 +116,7 @@ class TestCheck:
 
         write_config_file(str(tmpdir), {"ignore_issues": ",".join(ignore_issues)})
 
-        with mock.patch("cactuskeeper.cli.Repo", return_value=repo):
+        with mock.patch("cactuskeeper.cli.open_repo", return_value=repo):
             runner = CliRunner()
 
             result = runner.invoke(cli, ["--repo", str(tmpdir), "check"])
@@ -112,7 +148,7 @@ class TestCheck:
         repo.add_existing_commit("master", 1)
         repo.add_commit("master", "fix: bla \n blubi #123")
 
-        with mock.patch("cactuskeeper.cli.Repo", return_value=repo):
+        with mock.patch("cactuskeeper.cli.open_repo", return_value=repo):
             runner = CliRunner()
 
             result = runner.invoke(cli, ["check"])
@@ -120,13 +156,721 @@ class TestCheck:
             assert result.exit_code == 0
             assert "The current branch is clean" in result.output
 
+    def test_check_jobs(self):
+        """concurrent analysis reports the branches in the same order"""
+        repo = MockRepo(
+            branches=["master", "release/v0.7", "release/v0.9", "release/v0.8"]
+        )
+
+        repo.add_commit("master", "release: v0.7.0", sha=0)
+        for number, version in enumerate(["0.7", "0.8", "0.9"]):
+            repo.add_existing_commit("release/v" + version, 0)
+            repo.add_commit("release/v" + version, f"fix: bla \n blubi #{number}")
+
+        with mock.patch("cactuskeeper.cli.open_repo", return_value=repo):
+            runner = CliRunner()
+            sequential = runner.invoke(cli, ["check"])
+            concurrent = runner.invoke(cli, ["check", "--jobs", "3"])
+
+        assert sequential.exit_code == concurrent.exit_code == 1
+        assert sequential.output == concurrent.output
+        assert (
+            sequential.output.index("release/v0.7")
+            < sequential.output.index("release/v0.8")
+            < sequential.output.index("release/v0.9")
+        )
+
+    def test_check_patch_id(self, tmpdir):
+        """fixes ported with a different message are found by their patch-id"""
+        repo = GitRepo(tmpdir)
+        repo.commit("base", files={"a.txt": "a\n"})
+        repo.commit("release: v0.9.0")
+        repo.branch("release/v0.9")
+        repo.checkout("release/v0.9")
+        repo.commit("fix: something \n\n #1", files={"a.txt": "a\nfixed\n"})
+        repo.checkout("master")
+        repo.commit("port fix from 0.9", files={"a.txt": "a\nfixed\n"})
+
+        runner = CliRunner()
+        result = runner.invoke(cli, ["--repo", repo.path, "check"])
+        assert result.exit_code == 1
+        assert "#1\tfix: something" in result.output
+
+        for _ in range(2):
+            result = runner.invoke(cli, ["--repo", repo.path, "check", "--patch-id"])
+            assert result.exit_code == 0
+            assert "The current branch is clean" in result.output
+
+        assert tmpdir.join(".git", "cactuskeeper", "patch-ids.json").exists()
+
+    @pytest.mark.parametrize("missing", [True, False])
+    def test_check_quiet(self, missing):
+        repo = MockRepo(branches=["master", "release/v0.9", "release/v0.8"])
+
+        repo.add_commit("master", "release: v0.8.0", sha=0)
+        repo.add_existing_commit("release/v0.8", 0)
+        repo.add_existing_commit("release/v0.9", 0)
+        repo.add_commit("release/v0.8", "fix: bla \n blubi #1")
+        repo.add_commit("release/v0.8", "fix: foo \n blubi #2")
+        repo.add_commit("master", "fix: foo \n blubi #2")
+        if not missing:
+            repo.add_commit("master", "fix: bla \n blubi #1")
+
+        walked = []
+        iter_commits = repo.iter_commits
+        repo.iter_commits = lambda rev: walked.append(rev) or iter_commits(rev)
+
+        with mock.patch("cactuskeeper.cli.open_repo", return_value=repo):
+            runner = CliRunner()
+            result = runner.invoke(cli, ["check", "--quiet"])
+
+        assert result.output == ""
+        if missing:
+            assert result.exit_code == 1
+            # release/v0.9 is not analysed after the first missing fix was found
+            assert walked == ["master", "master..release/v0.8"]
+        else:
+            assert result.exit_code == 0
+            assert len(walked) == 3
+
+    def test_check_issue_patterns(self, tmpdir):
+        repo = MockRepo(branches=["master", "release/v0.9"])
+        repo.add_commit("release/v0.9", "release: v0.9.0", sha=1)
+        repo.add_commit("release/v0.9", "fix: bla \n CK-12")
+        repo.add_commit("release/v0.9", "fix: foo \n #4")
+        repo.add_existing_commit("master", 1)
+        repo.add_commit("master", "fix: foo \n #4")
+
+        runner = CliRunner()
+        with mock.patch("cactuskeeper.cli.open_repo", return_value=repo):
+            result = runner.invoke(cli, ["--repo", str(tmpdir), "check"])
+            assert result.exit_code == 0
+
+            write_config_file(str(tmpdir), {"issue_patterns": "\\#\\d+\n[A-Z]+-\\d+"})
+            result = runner.invoke(cli, ["--repo", str(tmpdir), "check"])
+            assert result.exit_code == 1
+            assert "CK-12\tfix: bla" in result.output
+
+    @pytest.mark.parametrize("shared", [True, False])
+    def test_check_stop_at_shared_release(self, shared):
+        repo = MockRepo(branches=["master", "release/v0.8"])
+
+        repo.add_commit("master", "fix: old \n blubi #1")
+        repo.add_commit("master", "release: v0.8.0" if shared else "feature", sha="0")
+        repo.add_existing_commit("release/v0.8", "0")
+        repo.add_commit("release/v0.8", "fix: follow up \n blubi #1")
+
+        walked = []
+        iter_commits = repo.iter_commits
+
+        def recording_iter_commits(rev, grep=None):
+            # walks of the release index are filtered by grep
+            if grep is None:
+                walked.append(rev)
+            return iter_commits(rev, grep=grep)
+
+        repo.iter_commits = recording_iter_commits
+
+        with mock.patch("cactuskeeper.cli.open_repo", return_value=repo):
+            runner = CliRunner()
+            result = runner.invoke(cli, ["check", "--stop-at-shared-release"])
+
+        # only the walk of the current branch stops at the shared release
+        if shared:
+            assert result.exit_code == 1
+            assert walked == [["master", "^0"], "master..release/v0.8"]
+        else:
+            assert result.exit_code == 0
+            assert walked == ["master", "master..release/v0.8"]
+
+    def test_check_reissued_issue(self, tmpdir):
+        """issues fixed before the branches diverged are fixed on both"""
+        repo = GitRepo(tmpdir)
+        repo.commits(["base", "release: v1.0.0", "fix: old \n\n #9"])
+        repo.commit("release: v1.0.1")
+        repo.branch("release/v1.0")
+        repo.branch("release/v1.1")
+        repo.checkout("release/v1.0")
+        repo.commit("fix: follow up \n\n #9")
+        repo.checkout("release/v1.1")
+        repo.commit("release: v1.1.0")
+
+        runner = CliRunner()
+        for args in [[], ["--full-history"]]:
+            result = runner.invoke(cli, ["--repo", repo.path, "check"] + args)
+            assert result.exit_code == 0
+
+        # the old fix of #9 is older than the shared release v1.0.1
+        result = runner.invoke(
+            cli, ["--repo", repo.path, "check", "--stop-at-shared-release"]
+        )
+        assert result.exit_code == 1
+        assert "#9\tfix: follow up" in result.output
+
+    @pytest.mark.parametrize(
+        "args,config",
+        [
+            ([], {}),
+            (["--max-depth", "2"], {}),
+            ([], {"max_depth": "2"}),
+            (["--since", "2021-01-01"], {}),
+            ([], {"since": "2021-01-01"}),
+            (["--full-history"], {"max_depth": "2", "since": "2021-01-01"}),
+        ],
+    )
+    def test_check_horizon(self, tmpdir, monkeypatch, args, config):
+        repo = GitRepo(tmpdir)
+
+        def commit(message, date):
+            monkeypatch.setenv("GIT_COMMITTER_DATE", date + "T12:00:00")
+            repo.commit(message)
+
+        commit("base", "2019-01-01")
+        commit("release: v0.9.0", "2019-02-01")
+        repo.branch("release/v0.9")
+        commit("fix: port \n\n #1", "2020-01-01")
+        commit("feature", "2022-01-01")
+        commit("feature 2", "2022-02-01")
+        repo.checkout("release/v0.9")
+        commit("fix: something \n\n #1", "2022-01-01")
+        repo.checkout("master")
+        write_config_file(repo.path, config)
+
+        runner = CliRunner()
+        result = runner.invoke(cli, ["--repo", repo.path, "check"] + args)
+
+        # the port of the fix is beyond the horizon
+        bounded = (args or config) and "--full-history" not in args
+        assert result.exit_code == (1 if bounded else 0)
+
+    @pytest.mark.parametrize(
+        "config,error",
+        [
+            ({"max_depth": "0"}, "Invalid max_depth setting '0'"),
+            ({"since": "yesterday"}, "Invalid since setting 'yesterday'"),
+        ],
+    )
+    def test_check_invalid_horizon_settings(self, tmpdir, config, error):
+        repo = GitRepo(tmpdir)
+        repo.commit("base")
+        write_config_file(repo.path, config)
+
+        result = CliRunner().invoke(cli, ["--repo", repo.path, "check"])
+        assert result.exit_code == 1
+        assert "Error: " + error in result.output
+
+    def test_check_cached_result(self, tmpdir):
+        repo = GitRepo(tmpdir)
+        repo.commits(["base", "release: v0.9.0"])
+        repo.branch("release/v0.9")
+        repo.checkout("release/v0.9")
+        repo.commit("fix: something \n\n #1")
+        repo.checkout("master")
+
+        runner = CliRunner()
+        first = runner.invoke(cli, ["--repo", repo.path, "check"])
+        assert first.exit_code == 1
+
+        # without any change, no reader is needed to get the same result
+        with mock.patch.dict("cactuskeeper.cli.READERS", clear=True):
+            result = runner.invoke(cli, ["--repo", repo.path, "check"])
+            assert result.exit_code == 1
+            assert result.output == first.output
+
+            result = runner.invoke(cli, ["--repo", repo.path, "check", "--quiet"])
+            assert result.exit_code == 1
+            assert result.output == ""
+
+        # results depend on the configuration and on the branch tips
+        write_config_file(repo.path, {"ignore_issues": "#1"})
+        result = runner.invoke(cli, ["--repo", repo.path, "check"])
+        assert result.exit_code == 0
+
+        repo.checkout("release/v0.9")
+        repo.commit("fix: something else \n\n #2")
+        repo.checkout("master")
+        result = runner.invoke(cli, ["--repo", repo.path, "check"])
+        assert result.exit_code == 1
+        assert "#2\tfix: something else" in result.output
+
+    def test_check_shallow_clone(self, tmpdir):
+        origin = GitRepo(tmpdir.join("origin"))
+        origin.commits(["base", "release: v0.9.0"])
+        origin.branch("release/v0.9")
+        origin.commits(["feature", "feature 2"])
+        origin.checkout("release/v0.9")
+        origin.commit("fix: something \n\n #1")
+        origin.checkout("master")
+        clone = str(tmpdir.join("clone"))
+        origin.git(
+            "clone",
+            "-q",
+            "--depth",
+            "2",
+            "--no-single-branch",
+            "file://" + origin.path,
+            clone,
+        )
+
+        runner = CliRunner()
+        result = runner.invoke(cli, ["--repo", clone, "--remote", "origin", "check"])
+
+        assert result.exit_code == 1
+        assert "#1\tfix: something" in result.output
+        boundary = origin.git("rev-parse", "master~1")
+        assert (
+            "Warning: the history ends at {0} in this shallow clone".format(
+                boundary[:11]
+            )
+            in result.output
+        )
+
+
+class TestHook:
+    def test_hook(self, tmpdir):
+        repo = GitRepo(tmpdir)
+        repo.commits(["base", "release: v0.9.0"])
+        repo.branch("release/v0.9")
+        path = os.path.join(repo.path, ".git", "cactuskeeper", "fixes.json")
+
+        def run_hook(*updates):
+            lines = "".join(" ".join(update) + "\n" for update in updates)
+            return CliRunner().invoke(cli, ["--repo", repo.path, "hook"], input=lines)
+
+        def indexed_branches():
+            with open(path) as f:
+                return sorted(json.load(f)["branches"])
+
+        # nothing is missing when the hook first runs
+        tip = repo.git("rev-parse", "HEAD")
+        result = run_hook((ZERO_SHA, tip, "refs/heads/master"))
+        assert result.exit_code == 0
+        assert result.output == ""
+
+        # nothing changed with a feature, the pre-push format works as well
+        old, tip = tip, repo.commit("feature")
+        result = run_hook(("refs/heads/master", tip, "refs/heads/master", old))
+        assert result.exit_code == 0
+        assert result.output == ""
+
+        # a new fix on the release branch is reported as missing on master,
+        # but master was not pushed, so the push is not rejected
+        repo.checkout("release/v0.9")
+        release = repo.git("rev-parse", "HEAD")
+        fix = repo.commit("fix: something \n\n #1")
+        repo.checkout("master")
+        result = run_hook((release, fix, "refs/heads/release/v0.9"))
+        assert result.exit_code == 0
+        assert "#1\tfix: something" in result.output
+
+        # a pushed branch without the fix is rejected and not stored,
+        # so retrying it fails again
+        repo.git("branch", "feature")
+        for _ in range(2):
+            result = run_hook((ZERO_SHA, tip, "refs/heads/feature"))
+            assert result.exit_code == 1
+            assert "#1\tfix: something" in result.output
+            assert indexed_branches() == ["master", "release/v0.9"]
+
+        # the port is reported, even if it is not on the branch yet
+        repo.git("cherry-pick", "-x", "--allow-empty", fix)
+        old, tip = tip, repo.git("rev-parse", "HEAD")
+        repo.git("reset", "-q", "--hard", old)
+        result = run_hook((old, tip, "refs/heads/master"))
+        assert result.exit_code == 0
+        assert "fixes from 'release/v0.9' are now present in 'master'" in result.output
+        assert "#1\tfix: something" in result.output
+
+        # so is a force-push dropping the port, the branch keeps its stored state
+        for _ in range(2):
+            result = run_hook((tip, old, "refs/heads/master"))
+            assert result.exit_code == 1
+            assert "#1\tfix: something" in result.output
+
+        # an indexed branch does not block fixes pushed to a release branch
+        repo.git("branch", "-f", "feature", tip)
+        assert run_hook((ZERO_SHA, tip, "refs/heads/feature")).exit_code == 0
+        repo.checkout("release/v0.9")
+        old, new_fix = fix, repo.commit("fix: other \n\n #2")
+        result = run_hook((old, new_fix, "refs/heads/release/v0.9"))
+        assert result.exit_code == 0
+        assert "fixes not present in 'feature'" in result.output
+        assert "#2\tfix: other" in result.output
+        assert "#1\tfix: something" not in result.output
+
+        # branches deleted without the hook are forgotten, tags are ignored
+        repo.git("branch", "-D", "feature")
+        result = run_hook((ZERO_SHA, tip, "refs/tags/v1"))
+        assert result.exit_code == 0
+        assert indexed_branches() == ["master", "release/v0.9"]
+
+        # deleted branches are forgotten
+        result = run_hook((tip, ZERO_SHA, "refs/heads/master"))
+        assert result.exit_code == 0
+        assert indexed_branches() == ["release/v0.9"]
+
+
+class TestSync:
+    @pytest.fixture()
+    def git_repo(self, tmpdir, monkeypatch):
+        monkeypatch.setenv("GIT_COMMITTER_NAME", "cactuskeeper")
+        monkeypatch.setenv("GIT_COMMITTER_EMAIL", "test@example.com")
+        repo = GitRepo(tmpdir)
+        repo.commits(["base", "release: v0.8.0"])
+        repo.branch("release/v0.8")
+        repo.commit("release: v0.9.0", {"a": "1\n"})
+        repo.branch("release/v0.9")
+        repo.checkout("release/v0.8")
+        repo.commit("fix: old \n\n #1")
+        repo.checkout("release/v0.9")
+        repo.commit("fix: old, ported \n\n #1")
+        repo.commit("fix: a \n\n #2", {"a": "fixed\n"})
+        repo.checkout("master")
+        return repo
+
+    def test_sync(self, git_repo):
+        runner = CliRunner()
+        result = runner.invoke(cli, ["--repo", git_repo.path, "sync"])
+
+        assert result.exit_code == 0
+        lines = result.output.splitlines()
+        assert lines[0] == "Picked the following fixes onto 'master':"
+        assert [line.split("\t")[3] for line in lines[1:]] == ["fix: old", "fix: a"]
+        with open(os.path.join(git_repo.path, "a")) as f:
+            assert f.read() == "fixed\n"
+        assert git_repo.git("status", "--porcelain") == ""
+
+        result = runner.invoke(cli, ["--repo", git_repo.path, "sync"])
+        assert result.output == "The current branch is clean\n"
+
+    @pytest.mark.parametrize("ignore_issues", ["", "#1"])
+    def test_sync_conflict(self, git_repo, ignore_issues):
+        write_config_file(git_repo.path, {"ignore_issues": ignore_issues})
+        git_repo.commit("feature", {"a": "2\n"})
+
+        result = CliRunner().invoke(cli, ["--repo", git_repo.path, "sync"])
+
+        assert result.exit_code == 1
+        assert ("#1\tfix: old" in result.output) == (not ignore_issues)
+        fix = git_repo.git("rev-parse", "--short=11", "release/v0.9")
+        assert (
+            "The fix {0} #2 does not apply cleanly. Pick the remaining fixes "
+            "using this command: 'git cherry-pick -x {0}'".format(fix) in result.output
+        )
+        assert git_repo.git("log", "-1", "--format=%s") == (
+            "feature" if ignore_issues else "fix: old"
+        )
+
+    def test_sync_local_changes(self, git_repo):
+        with open(os.path.join(git_repo.path, "a"), "w") as f:
+            f.write("local\n")
+
+        result = CliRunner().invoke(cli, ["--repo", git_repo.path, "sync"])
+
+        assert result.exit_code == 1
+        assert "Could not pick the fixes: error: Entry 'a' not uptodate" in (
+            result.output
+        )
+        assert git_repo.git("log", "-1", "--format=%s") == "release: v0.9.0"
+
+    def test_sync_remote(self, git_repo, tmpdir):
+        git_repo.git("clone", "-q", git_repo.path, str(tmpdir.join("clone")))
+        clone = GitRepo(tmpdir.join("clone"))
+
+        result = CliRunner().invoke(cli, ["--repo", clone.path, "sync"])
+        assert result.output == "The current branch is clean\n"
+
+        # the fixes on the remote-tracking release branches are picked
+        result = CliRunner().invoke(
+            cli, ["--repo", clone.path, "--remote", "origin", "sync"]
+        )
+        assert result.exit_code == 0
+        assert "Picked the following fixes onto 'master':" in result.output
+        assert clone.git("log", "-1", "--format=%s") == "fix: a"
+
+    def test_sync_error(self, tmpdir):
+        result = CliRunner().invoke(cli, ["--repo", str(tmpdir), "sync"])
+
+        assert result.exit_code == 1
+        assert "InvalidGitRepositoryError" in result.output
+
+
+class TestCheckMany:
+    @pytest.fixture()
+    def repositories(self, tmpdir):
+        clean = GitRepo(tmpdir.join("clean"))
+        clean.commits(["base", "release: v0.9.0"])
+        clean.branch("release/v0.9")
+
+        unclean = GitRepo(tmpdir.join("unclean"))
+        unclean.commits(["base", "release: v0.9.0"])
+        unclean.branch("release/v0.9")
+        unclean.checkout("release/v0.9")
+        unclean.commits(["fix: a \n\n #1", "fix: b \n\n #2"])
+        unclean.checkout("master")
+        # every repository uses its own configuration
+        write_config_file(unclean.path, {"ignore_issues": "#2"})
+
+        tmpdir.join("not_a_repository").mkdir()
+        tmpdir.join("broken", ".git").write("gitdir: /does/not/exist", ensure=True)
+
+        return tmpdir
+
+    @pytest.mark.parametrize("jobs", ["1", "2"])
+    def test_check_many(self, repositories, jobs):
+        runner = CliRunner()
+        result = runner.invoke(
+            cli, ["check-many", "--scan", str(repositories), "--jobs", jobs]
+        )
+
+        assert result.exit_code == 1
+        output = result.output
+        assert output.index("broken") < output.index("clean") < output.index("unclean")
+        assert "Could not check the repository" in output
+        assert "#1\tfix: a" in output
+        assert "#2" not in output
+        assert "not_a_repository" not in output
+        assert (
+            "3 repositories checked: 1 clean, 1 with missing fixes, 1 failed" in output
+        )
+
+    def test_check_many_like_check(self, tmpdir):
+        """repositories are checked with the same options and warnings as check"""
+        origin = GitRepo(tmpdir.join("origin"))
+        origin.commits(["base", "release: v0.9.0"])
+        origin.branch("release/v0.9")
+        origin.commit("port", {"a": "fixed\n"})
+        origin.checkout("release/v0.9")
+        origin.commit("fix: something \n\n #1", {"a": "fixed\n"})
+        origin.checkout("master")
+        clone = str(tmpdir.join("clone"))
+        origin.git(
+            "clone",
+            "-q",
+            "--depth",
+            "1",
+            "--no-single-branch",
+            "file://" + origin.path,
+            clone,
+        )
+        args = ["--remote", "origin", "check-many", "--jobs", "1", clone]
+
+        runner = CliRunner()
+        result = runner.invoke(cli, args)
+        assert result.exit_code == 1
+        assert "#1\tfix: something" in result.output
+        boundary = origin.git("rev-parse", "master")
+        assert (
+            "Warning: the history ends at {0} in this shallow clone".format(
+                boundary[:11]
+            )
+            in result.output
+        )
+
+        result = runner.invoke(cli, args + ["--patch-id"])
+        assert result.exit_code == 0
+
+    def test_check_many_clean(self, repositories):
+        runner = CliRunner()
+        result = runner.invoke(
+            cli, ["check-many", "--jobs", "1", str(repositories.join("clean"))]
+        )
+
+        assert result.exit_code == 0
+        assert "1 repositories checked: 1 clean" in result.output
+
+
+class TestReleases:
+    @pytest.fixture()
+    def git_repo(self, tmpdir):
+        repo = GitRepo(tmpdir)
+        repo.commits(["base", "release: v0.9.0"])
+        repo.branch("release/v0.9")
+        repo.commits(["feature", "release: v1.0.0", "feature 2"])
+        repo.checkout("release/v0.9")
+        repo.commits(["fix: a \n\n #1", "release: v0.9.1"])
+        repo.checkout("master")
+        return repo
+
+    def test_releases(self, git_repo):
+        runner = CliRunner()
+        result = runner.invoke(cli, ["--repo", git_repo.path, "releases"])
+
+        assert result.exit_code == 0
+        lines = result.output.splitlines()
+        assert [line.split("\t")[0] for line in lines] == ["1.0.0", "0.9.1", "0.9.0"]
+        assert lines[2].endswith("master, release/v0.9")
+        assert os.path.exists(
+            os.path.join(git_repo.path, ".git", "cactuskeeper", "releases.json")
+        )
+
+        result = runner.invoke(cli, ["--repo", git_repo.path, "releases", "0.9.x"])
+        assert [line.split("\t")[0] for line in result.output.splitlines()] == [
+            "0.9.1",
+            "0.9.0",
+        ]
+
+        result = runner.invoke(cli, ["--repo", git_repo.path, "releases", "2.x"])
+        assert result.output == "No releases found.\n"
+
+        result = runner.invoke(cli, ["--repo", git_repo.path, "releases", "two"])
+        assert result.exit_code == 2
+        assert "Invalid version query 'two'" in result.output
+
+    def test_releases_of_remote(self, git_repo):
+        git_repo.git("update-ref", "refs/remotes/origin/release/v0.9", "release/v0.9")
+        git_repo.git("branch", "-q", "-D", "release/v0.9")
+
+        runner = CliRunner()
+        result = runner.invoke(
+            cli, ["--repo", git_repo.path, "--remote", "origin", "releases", "0.9"]
+        )
+
+        assert result.exit_code == 0
+        assert result.output.split("\t")[-1] == "master, origin/release/v0.9\n"
+
+    def test_release_uses_index(self, git_repo):
+        runner = CliRunner()
+        result = runner.invoke(cli, ["--repo", git_repo.path, "release"], input="n\n")
+
+        assert result.exit_code == 0
+        assert "The last release on the branch is 1.0.0." in result.output
+        assert "\tfeature 2" in result.output
+
+    def test_release_without_release(self, tmpdir):
+        repo = GitRepo(tmpdir)
+        repo.commit("base")
+
+        runner = CliRunner()
+        result = runner.invoke(cli, ["--repo", repo.path, "release"])
+
+        assert result.exit_code == 1
+        assert "No release found on the branch" in result.output
+
+
+class TestMatrix:
+    def test_matrix(self, tmpdir):
+        repo = GitRepo(tmpdir)
+        repo.commits(["base", "release: v0.9.0"])
+        repo.branch("release/v0.9")
+        repo.commits(["feature", "release: v1.0.0"])
+        repo.branch("release/v1.0")
+        repo.checkout("release/v0.9")
+        repo.commits(["fix: a \n\n #1", "fix: b \n\n #2"])
+
+        write_config_file(str(tmpdir), {"ignore_issues": "#2"})
+
+        runner = CliRunner()
+        result = runner.invoke(cli, ["--repo", repo.path, "matrix"])
+
+        assert result.exit_code == 0
+        lines = result.output.splitlines()
+        assert lines[2].split() == ["release/v1.0", "release/v0.9"]
+        assert lines[3].split() == ["release/v1.0", "-", "1"]
+        assert lines[4].split() == ["release/v0.9", "0", "-"]
+        assert (
+            "Branch 'release/v1.0' is missing the following fixes "
+            "from 'release/v0.9'" in result.output
+        )
+        assert "#1\tfix: a" in result.output
+        assert "#2" not in result.output
+
+    def test_matrix_agrees_with_check(self, tmpdir):
+        repo = GitRepo(tmpdir)
+        repo.commits(["base", "fix: a \n\n #5"])
+        repo.branch("release/v1.0")
+        repo.branch("release/v1.1")
+        repo.checkout("release/v1.0")
+        repo.commits(["release: v1.0.0", "fix: a follow up \n\n #5", "fix: b \n\n #6"])
+        repo.checkout("release/v1.1")
+        repo.commits(["release: v1.1.0", "feature"])
+
+        runner = CliRunner()
+        check = runner.invoke(cli, ["--repo", repo.path, "check"])
+        matrix = runner.invoke(cli, ["--repo", repo.path, "matrix"])
+
+        # #5 is fixed in the shared history, only #6 is missing on release/v1.1
+        for result in (check, matrix):
+            assert "#6\tfix: b" in result.output
+            assert "#5" not in result.output
+        assert matrix.output.splitlines()[3].split() == ["release/v1.1", "-", "1"]
+
+    def test_matrix_without_release_branches(self):
+        repo = MockRepo(branches=["master"])
+
+        with mock.patch("cactuskeeper.cli.open_repo", return_value=repo):
+            runner = CliRunner()
+            result = runner.invoke(cli, ["matrix"])
+
+        assert result.exit_code == 0
+        assert "No release branches found." in result.output
+
+
+class TestTimings:
+    @pytest.fixture()
+    def git_repo(self, tmpdir):
+        repo = GitRepo(tmpdir.join("repo"))
+        repo.commits(["base", "release: v0.9.0"])
+        repo.branch("release/v0.9")
+        repo.checkout("release/v0.9")
+        repo.commit("fix: something \n\n #1")
+        repo.checkout("master")
+        return repo
+
+    def test_timings(self, git_repo):
+        runner = CliRunner()
+        result = runner.invoke(
+            cli, ["--repo", git_repo.path, "--reader", "stream", "--timings", "check"]
+        )
+
+        assert result.exit_code == 1
+        assert "Timings:" in result.output
+        for phase in ["ref enumeration", "history walk", "commit parsing", "output"]:
+            assert phase in result.output
+        assert "git subprocesses" in result.output
+        assert "commits parsed" in result.output
+
+    def test_timings_json(self, git_repo, tmpdir):
+        path = str(tmpdir.join("timings.json"))
+
+        runner = CliRunner()
+        for _ in range(2):
+            result = runner.invoke(
+                cli, ["--repo", git_repo.path, "--timings-json", path, "check"]
+            )
+            assert result.exit_code == 1
+            assert "Timings:" not in result.output
+            # without the stored result, the history is walked again
+            os.remove(
+                os.path.join(git_repo.path, ".git", "cactuskeeper", "checks.json")
+            )
+
+        with open(path) as f:
+            data = json.load(f)
+
+        # the second run reads all commits from the cache
+        assert data["counters"]["cache hits"] == 3
+        assert "commits parsed" not in data["counters"]
+        assert data["timings"]["total"] > 0
+
+    def test_profile(self, git_repo, tmpdir):
+        path = str(tmpdir.join("check.prof"))
+
+        runner = CliRunner()
+        result = runner.invoke(
+            cli, ["--repo", git_repo.path, "--profile", path, "check"]
+        )
+
+        assert result.exit_code == 1
+        assert "check" in str(pstats.Stats(path).stats)
+
 
 class TestRelease:
     @pytest.fixture()
     def setup_mock_repo(self):
         repo = MockRepo(branches=["master"])
 
-        repo.add_commit("master", "base", sha="12345")
+        repo.add_commit("master", "base", sha="12345".ljust(40, "0"))
 
         repo.add_commits(
             "master",
@@ -138,7 +882,7 @@ class TestRelease:
             ],
         )
 
-        with mock.patch("cactuskeeper.cli.Repo", return_value=repo):
+        with mock.patch("cactuskeeper.cli.open_repo", return_value=repo):
             yield
 
     def test_latest_commit_already_a_release(self):
@@ -146,7 +890,7 @@ class TestRelease:
 
         repo.add_commit("master", "release: v1.2.3 \n info")
 
-        with mock.patch("cactuskeeper.cli.Repo", return_value=repo):
+        with mock.patch("cactuskeeper.cli.open_repo", return_value=repo):
             runner = CliRunner()
             result = runner.invoke(cli, ["release"])
 
@@ -188,3 +932,16 @@ class TestRelease:
         assert "fix: something1" in result.output
         assert "fix: something0" in result.output
         assert "The specified commit was not found." in result.output
+
+    def test_release_abbreviated_base_walks_once(self, setup_mock_repo):
+        runner = CliRunner()
+        with mock.patch.object(
+            MockRepo, "iter_commits", autospec=True, side_effect=MockRepo.iter_commits
+        ) as iter_commits:
+            result = runner.invoke(cli, ["release"], input="y\nidonotexist\n123\nn\n")
+
+        assert result.exit_code == 0
+        assert "The specified commit was not found." in result.output
+        assert "fix: something0" in result.output
+        # one walk for the latest release, one for the release log
+        assert iter_commits.call_count == 2
@@ -1,6 +1,8 @@
+import pytest
+
 from cactuskeeper.files import read_config_file
 
-EMPTY_CONFIG = {"tagged-files": [], "ignore_issues": []}
+EMPTY_CONFIG = {"tagged-files": [], "ignore_issues": [], "issue_patterns": ["#\\d+"]}
 
 
 def test_read_empty_config(tmpdir):
@@ -14,20 +16,33 @@ def test_read_empty_config(tmpdir):
 
 def test_read_config_file(tmpdir):
 
-    content = """
+    content = r"""
     [cactuskeeper]
     tagged-files =
         version_info.json
         some_other_file.py
     ignore_issues = #1,#134
+    issue_patterns =
+        \#\d+
+        [A-Z][A-Z0-9]+-\d+
     """
 
     p = tmpdir.join("setup.cfg")
     p.write(content)
 
     config = read_config_file(str(tmpdir))
-    assert set(["tagged-files", "ignore_issues"]) == config.keys()
+    assert set(["tagged-files", "ignore_issues", "issue_patterns"]) == config.keys()
 
     assert ["version_info.json", "some_other_file.py"] == config["tagged-files"]
 
     assert ["#1", "#134"] == config["ignore_issues"]
+
+    # lines starting with # are comments, the # is escaped
+    assert ["\\#\\d+", "[A-Z][A-Z0-9]+-\\d+"] == config["issue_patterns"]
+
+
+def test_read_config_file_invalid_pattern(tmpdir):
+    tmpdir.join("setup.cfg").write("[cactuskeeper]\nissue_patterns = [A-Z+-\\d+\n")
+
+    with pytest.raises(ValueError, match="Invalid issue pattern"):
+        read_config_file(str(tmpdir))
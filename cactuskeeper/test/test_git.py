@@ -1,17 +1,39 @@
 from packaging.version import Version
+import os
 import re
+import subprocess
 
-from mock import Mock
+from git import Repo
+from mock import Mock, patch
 import pytest
 
+from cactuskeeper.cache import FixIndex, PatchIdCache, ReleaseIndex
+from cactuskeeper.files import read_config_file
 from cactuskeeper.git import (
+    BranchHistory,
+    check_current_branch,
     CommitMetadata,
     get_bugfixes_for_branch,
     get_commits_since_commit,
+    get_literal_prefix,
     get_latest_release_commit,
+    get_missing_fixes,
+    get_patch_ids,
     get_release_branches,
+    get_release_matrix,
+    get_shallow_commits,
+    HistoryHorizon,
+    iter_commit_metadata,
+    iter_missing_fixes,
+    parse_ref_updates,
+    pick_commits,
+    update_branch,
+    update_fix_index,
+    update_release_index,
+    ZERO_SHA,
 )
-from cactuskeeper.test.helpers import MockRepo
+from cactuskeeper.readers import READERS, StreamReader
+from cactuskeeper.test.helpers import GitRepo, MockRepo
 
 
 @pytest.mark.parametrize(
@@ -50,6 +72,45 @@ def test_get_release_branches_with_custom_regex():
     assert Version("1.2") == result[0]["version"]
 
 
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        (r"release/v(?P<version>\d+)", "release/v"),
+        (r"^release/v(?P<version>\d+)", "release/v"),
+        (r"releases?/v(?P<version>\d+)", "release"),
+        (r"rel.ase", "rel"),
+        (r"(?P<version>\d+)", ""),
+        (r"release", "release"),
+    ],
+)
+def test_get_literal_prefix(pattern, expected):
+    assert get_literal_prefix(pattern) == expected
+
+
+def test_get_release_branches_from_refs(tmpdir):
+    repo = GitRepo(tmpdir)
+    repo.commit("base")
+    for name in ("release/v1.0", "release/v1.10", "release/vnext", "feature/x"):
+        repo.branch(name)
+    repo.git("update-ref", "refs/remotes/origin/release/v1.1", "HEAD")
+    repo.git("update-ref", "refs/remotes/upstream/release/v2.0", "HEAD")
+
+    result = get_release_branches(Repo(repo.path))
+    assert [(b["name"], b["branch"]) for b in result] == [
+        ("release/v1.10", "release/v1.10"),
+        ("release/v1.0", "release/v1.0"),
+    ]
+
+    result = get_release_branches(Repo(repo.path), remote="origin")
+    assert result == [
+        {
+            "version": Version("1.1"),
+            "name": "release/v1.1",
+            "branch": "origin/release/v1.1",
+        }
+    ]
+
+
 @pytest.mark.parametrize("additional_commits", [True, False])
 def test_get_latest_release_commit(additional_commits):
 
@@ -67,6 +128,153 @@ def test_get_latest_release_commit_empty_repo():
     assert release is None
 
 
+def test_branch_history():
+    repo = MockRepo(branches=["master"])
+    for message, sha in [
+        ("base", "abc123"),
+        ("release: v1.0.0", "abd456"),
+        ("fix: something \n #1", "def789"),
+        ("feature", "abe000"),
+    ]:
+        repo.add_commit("master", message, sha=sha.ljust(40, "0"))
+
+    history = BranchHistory(repo, "master")
+    assert len(history.commits) == 0
+
+    # only walks as far as needed
+    assert [c.shortlog for c in history.commits_since("def")] == ["feature"]
+    assert len(history.commits) == 2
+    assert history.commits_since("ABE000") == []
+
+    # the newest of several matching commits is used
+    assert [c.hexsha for c in history.commits_since("ab")] == []
+    assert [c.hexsha[:6] for c in history.commits_since("abd")] == ["abe000", "def789"]
+
+    assert history.commits_since("fff") is None
+    assert len(history.commits) == 4
+    assert history.find("abc1") == 3
+    assert history.commits.issue(1) == "#1"
+    assert history.commits.version(2) == "1.0.0"
+
+    repo.iter_commits = None
+    assert history.find(" abc123 ") == 3
+    assert history.find("fff") is None
+    assert history.find("xyz") is None
+    history.close()
+
+
+def test_iter_commit_metadata_blocks():
+    read = []
+
+    def commits():
+        for number in range(20):
+            read.append(number)
+            yield Mock(hexsha=str(number), message="fix: {0}\n\n#{0}".format(number))
+
+    metadata = iter_commit_metadata(commits())
+    assert [next(metadata).issue for _ in range(3)] == ["#0", "#1", "#2"]
+    # blocks of one and two commits were parsed
+    assert len(read) == 3
+
+    assert len(list(metadata)) == 17
+    assert len(read) == 20
+
+
+@pytest.fixture()
+def picks(tmpdir, monkeypatch):
+    """
+    A release branch with fixes to pick onto master, one of them conflicting.
+    """
+    monkeypatch.setenv("GIT_COMMITTER_NAME", "cactuskeeper")
+    monkeypatch.setenv("GIT_COMMITTER_EMAIL", "test@example.com")
+    repo = GitRepo(tmpdir)
+    repo.commit("base", {"a": "1\n", "b": "1\n"})
+    repo.branch("release/v0.9")
+    repo.commit("feature", {"b": "2\n"})
+    repo.checkout("release/v0.9")
+    fixes = [
+        repo.commit("fix: a \n\n #1", {"a": "fixed\n"}),
+        repo.commit("fix: empty \n\n #2"),
+        repo.commit("fix: b \n\n #3", {"b": "fixed\n"}),
+    ]
+    repo.checkout("master")
+    return repo, fixes
+
+
+def test_pick_commits(picks):
+    git_repo, fixes = picks
+    repo = Repo(git_repo.path)
+    tip = repo.commit("master").hexsha
+
+    assert pick_commits(repo, tip, []) == (tip, None)
+
+    new_tip, conflict = pick_commits(repo, tip, fixes)
+    assert conflict == fixes[2]
+    assert git_repo.git("log", "--format=%s", "-2", new_tip).splitlines() == [
+        "fix: empty",
+        "fix: a",
+    ]
+    assert git_repo.git("show", new_tip + ":a") == "fixed"
+    assert git_repo.git("show", new_tip + ":b") == "2"
+    message = git_repo.git("log", "-1", "--format=%B", new_tip)
+    assert message.endswith("(cherry picked from commit {0})".format(fixes[1]))
+
+    # nothing was changed but the object database
+    assert repo.commit("master").hexsha == tip
+    assert git_repo.git("status", "--porcelain") == ""
+
+
+def test_update_branch(picks):
+    git_repo, fixes = picks
+    repo = Repo(git_repo.path)
+    tip = repo.commit("master").hexsha
+    new_tip, _ = pick_commits(repo, tip, fixes[:1])
+
+    # the checked out branch is updated together with the working tree
+    update_branch(repo, "master", tip, new_tip)
+    assert repo.commit("master").hexsha == new_tip
+    with open(os.path.join(git_repo.path, "a")) as f:
+        assert f.read() == "fixed\n"
+    assert git_repo.git("status", "--porcelain") == ""
+
+    # the branch must not have moved in the meantime
+    with pytest.raises(subprocess.CalledProcessError):
+        update_branch(repo, "release/v0.9", tip, new_tip)
+    assert repo.commit("release/v0.9").hexsha == fixes[-1]
+
+    # other branches are moved without touching the working tree
+    update_branch(repo, "release/v0.9", fixes[-1], new_tip)
+    assert repo.commit("release/v0.9").hexsha == new_tip
+    assert git_repo.git("status", "--porcelain") == ""
+
+    # neither must the checked out one, its working tree is left alone then
+    other_tip, _ = pick_commits(repo, tip, fixes[1:])
+    with pytest.raises(subprocess.CalledProcessError):
+        update_branch(repo, "master", tip, other_tip)
+    assert repo.commit("master").hexsha == new_tip
+    with open(os.path.join(git_repo.path, "a")) as f:
+        assert f.read() == "fixed\n"
+    assert git_repo.git("status", "--porcelain") == ""
+
+    # local changes in the way keep the branch where it was
+    git_repo.git("reset", "-q", "--hard", tip)
+    with open(os.path.join(git_repo.path, "a"), "w") as f:
+        f.write("local\n")
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        update_branch(repo, "master", tip, new_tip)
+    assert b"not uptodate" in error.value.stderr
+    assert repo.commit("master").hexsha == tip
+
+
+def test_pick_commits_error(picks):
+    git_repo, fixes = picks
+    repo = Repo(git_repo.path)
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        pick_commits(repo, "0" * 40, fixes)
+    assert b"fatal" in error.value.stderr
+
+
 def test_get_commits_since_commit():
 
     repo = MockRepo(branches=["master"])
@@ -102,6 +310,24 @@ def test_get_bugfixes_relative():
     assert result["#1"].shortlog == "fix: something"
 
 
+def test_get_bugfixes_relative_single_walk():
+    """only the revision range is walked, not the history of the base branch"""
+    repo = MockRepo(branches=["release/1.2", "master"])
+    repo.add_commit("release/1.2", "release: 1.2", sha=1)
+    repo.add_commit("release/1.2", "fix: something \n more info #1")
+    repo.add_existing_commit("master", 1)
+    repo.add_commit("master", "fix: something else \n more info #2")
+
+    walked = []
+    iter_commits = repo.iter_commits
+    repo.iter_commits = lambda rev: walked.append(rev) or iter_commits(rev)
+
+    result = get_bugfixes_for_branch(repo, "release/1.2", "master")
+
+    assert walked == ["master..release/1.2"]
+    assert list(result.keys()) == ["#1"]
+
+
 def test_get_bugfixes_absolute():
     repo = MockRepo(branches=["release/1.2", "master"])
 
@@ -119,6 +345,192 @@ def test_get_bugfixes_absolute():
     assert set(result.keys()) == set(["#2", "#1", "#0"])
 
 
+def test_get_missing_fixes():
+    repo = MockRepo(branches=["release/1.2", "master"])
+
+    repo.add_commit("release/1.2", "release: 1.2", sha=1)
+    repo.add_commits(
+        "release/1.2",
+        [
+            "fix: something1 \n #1",
+            "fix: something2 \n #2",
+            "fix: something3 \n #3",
+            "fix: something4 \n #4",
+        ],
+    )
+    repo.add_existing_commit("master", 1)
+
+    result = get_missing_fixes(
+        repo, "release/1.2", "master", fixes_on_base={"#2"}, ignored_issues={"#3"}
+    )
+
+    assert [commit.issue for commit in result] == ["#4", "#1"]
+
+
+def test_iter_missing_fixes_once_per_issue():
+    repo = MockRepo(branches=["release/1.2", "master"])
+
+    repo.add_commits(
+        "release/1.2",
+        ["fix: something1 \n #1", "fix: something2 \n #2", "fix: follow up \n #1"],
+    )
+
+    result = iter_missing_fixes(repo, "release/1.2", "master", fixes_on_base=set())
+
+    assert next(result).shortlog == "fix: follow up"
+    assert [commit.issue for commit in result] == ["#2"]
+
+
+@pytest.fixture()
+def cherry_picked_repo(tmpdir):
+    """
+    A repository with a fix on a release branch, which was ported to master
+    with a different commit message.
+    """
+    repo = GitRepo(tmpdir)
+    repo.commit("base", files={"a.txt": "a\n", "b.txt": "b\n"})
+    repo.commit("release: v0.9.0")
+    repo.branch("release/v0.9")
+    repo.checkout("release/v0.9")
+    repo.commit("fix: something \n\n #1", files={"a.txt": "a\nfixed\n"})
+    repo.commit("fix: other thing \n\n #2", files={"b.txt": "b\nfixed\n"})
+    repo.checkout("master")
+    repo.commit("port fix from 0.9", files={"a.txt": "a\nfixed\n"})
+    return repo
+
+
+def test_get_patch_ids(cherry_picked_repo):
+    repo = Mock(git_dir=cherry_picked_repo.git("rev-parse", "--absolute-git-dir"))
+    fix, port, empty, root = [
+        cherry_picked_repo.git("rev-parse", rev)
+        for rev in ["release/v0.9~1", "master", "master~1", "master~2"]
+    ]
+    cache = PatchIdCache()
+
+    patch_ids = get_patch_ids(repo, [fix, port, empty, root], cache)
+
+    assert patch_ids[fix] == patch_ids[port]
+    assert patch_ids[empty] == ""
+    assert patch_ids[root] not in ("", patch_ids[fix])
+    assert cache.get(empty) == ""
+
+    # cached values are not calculated again
+    cache.put(fix, "cached")
+    assert get_patch_ids(repo, [fix, empty], cache) == {fix: "cached", empty: ""}
+    assert get_patch_ids(repo, [fix])[fix] == patch_ids[fix]
+
+
+def test_get_missing_fixes_patch_ids(cherry_picked_repo):
+    repo = Repo(cherry_picked_repo.path)
+
+    by_issue = get_missing_fixes(repo, "release/v0.9", "master", fixes_on_base=set())
+    by_patch_id = get_missing_fixes(
+        repo,
+        "release/v0.9",
+        "master",
+        fixes_on_base=set(),
+        match_patch_ids=True,
+        patch_id_cache=PatchIdCache(),
+    )
+
+    assert [c.issue for c in by_issue] == ["#2", "#1"]
+    assert [c.issue for c in by_patch_id] == ["#2"]
+
+    # nothing to match when no fixes are missing
+    assert [] == get_missing_fixes(
+        repo, "release/v0.9", "master", {"#1", "#2"}, match_patch_ids=True
+    )
+
+
+@pytest.fixture()
+def release_lines(tmpdir):
+    """
+    Three release branches forked from master, each with its own fixes.
+    """
+    repo = GitRepo(tmpdir)
+    repo.commits(["base", "fix: old \n\n #9", "release: v0.8.0"])
+    repo.branch("release/v0.8")
+    repo.commits(["feature", "release: v0.9.0"])
+    repo.branch("release/v0.9")
+    repo.commits(["feature 2", "release: v1.0.0"])
+    repo.branch("release/v1.0")
+
+    repo.checkout("release/v0.8")
+    repo.commits(["fix: a \n\n #1", "fix: b \n\n #2"])
+    repo.checkout("release/v0.9")
+    repo.commits(["fix: a \n\n #1", "fix: c \n\n #3"])
+    repo.checkout("release/v1.0")
+    repo.git("merge", "-q", "--no-ff", "-m", "merge 0.9", "release/v0.9")
+    repo.commits(["fix: d \n\n #4"])
+    repo.checkout("master")
+    return repo
+
+
+@pytest.mark.parametrize("use_stream_reader", [False, True])
+def test_get_release_matrix(release_lines, use_stream_reader):
+    repo = Repo(release_lines.path)
+    reader = StreamReader(repo) if use_stream_reader else None
+
+    result = get_release_matrix(
+        repo, get_release_branches(repo), ignored_issues={"#2"}, reader=reader
+    )
+
+    def issues(source, target):
+        return [c.issue for c in result[("release/v" + source, "release/v" + target)]]
+
+    assert len(result) == 6
+    assert issues("1.0", "0.9") == ["#4"]
+    assert issues("1.0", "0.8") == ["#4", "#3"]
+    assert issues("0.9", "1.0") == []
+    assert issues("0.9", "0.8") == ["#3"]
+    assert issues("0.8", "1.0") == []
+    assert issues("0.8", "0.9") == []
+
+
+def test_get_release_matrix_trivial(release_lines):
+    repo = Repo(release_lines.path)
+    branches = get_release_branches(repo)
+
+    assert get_release_matrix(repo, []) == {}
+    assert get_release_matrix(repo, branches[:1]) == {}
+
+    # branches pointing at the same commit never miss each others fixes
+    release_lines.branch("release/v1.1", "release/v1.0")
+    result = get_release_matrix(repo, get_release_branches(repo)[:2])
+    assert list(result.values()) == [[], []]
+
+
+def test_get_release_matrix_unrelated_histories(tmpdir):
+    repo = GitRepo(tmpdir)
+    repo.commits(["base", "fix: a \n\n #1"])
+    repo.branch("release/v0.9")
+    repo.git("checkout", "-q", "--orphan", "release/v1.0")
+    repo.commits(["new base", "fix: b \n\n #2"])
+
+    git_repo = Repo(repo.path)
+    result = get_release_matrix(git_repo, get_release_branches(git_repo))
+
+    assert [c.issue for c in result[("release/v1.0", "release/v0.9")]] == ["#2"]
+    assert [c.issue for c in result[("release/v0.9", "release/v1.0")]] == ["#1"]
+
+
+def test_get_release_matrix_merged_release(tmpdir):
+    """commits reachable from all branches are not parsed"""
+    repo = GitRepo(tmpdir)
+    repo.commits(["base", "fix: a \n\n #1"])
+    repo.branch("release/v0.9")
+    repo.git("reset", "-q", "--hard", "HEAD~1")
+    repo.commits(["fix: b \n\n #2", "feature", "fix: c \n\n #3"])
+    repo.git("merge", "-q", "--no-ff", "-m", "merge 0.9", "release/v0.9")
+    repo.branch("release/v1.0")
+
+    git_repo = Repo(repo.path)
+    result = get_release_matrix(git_repo, get_release_branches(git_repo))
+
+    assert [c.issue for c in result[("release/v1.0", "release/v0.9")]] == ["#3", "#2"]
+    assert result[("release/v0.9", "release/v1.0")] == []
+
+
 def test_commit_get_next_version():
     repo = MockRepo(branches=["master"])
     repo.add_commits("master", ["release: v1.2.0"])
@@ -138,3 +550,212 @@ def test_commit_get_next_version_no_release():
     commit = CommitMetadata(Mock(message="Something, but surely no release"))
 
     assert commit.next_version() is None
+
+
+def test_update_release_index(release_lines):
+    repo = Repo(release_lines.path)
+    index = ReleaseIndex()
+    walks = []
+    iter_commits = repo.iter_commits
+
+    def counting_iter_commits(rev, **kwargs):
+        walks.append(rev)
+        return iter_commits(rev, **kwargs)
+
+    repo.iter_commits = counting_iter_commits
+
+    update_release_index(repo, index, "release/v0.9")
+    update_release_index(repo, index, "master")
+    assert index.latest("release/v0.9")[1] == "0.9.0"
+    assert [r[0] for r in index.find("0.x")] == ["0.9.0", "0.8.0"]
+    assert index.find("1")[0][2] == ["master"]
+
+    # unchanged branches are not walked again
+    update_release_index(repo, index, "master")
+    assert len(walks) == 2
+    assert index.shared("release/v0.9", "master") == index.latest("release/v0.9")[0]
+
+    # only new commits are walked
+    old_tip = index.branches["release/v0.9"]["tip"]
+    release_lines.checkout("release/v0.9")
+    new_tip = release_lines.commits(
+        ["fix: e \n\nrelease: mentioned in the body #5", "release: v0.9.1"]
+    )[-1]
+    update_release_index(repo, index, "release/v0.9")
+    assert walks[-1] == "{0}..{1}".format(old_tip, new_tip)
+    assert [r[0] for r in index.find("0.9.x")] == ["0.9.1", "0.9.0"]
+    assert index.find("0.9.0")[0][2] == ["master", "release/v0.9"]
+
+    # a rewritten branch is indexed from scratch
+    release_lines.git("reset", "-q", "--hard", "release/v0.8")
+    update_release_index(repo, index, "release/v0.9")
+    assert ".." not in walks[-1]
+    assert index.latest("release/v0.9")[1] == "0.8.0"
+
+    # so is a branch whose indexed tip does not exist anymore
+    index.branches["master"]["tip"] = "0" * 40
+    update_release_index(repo, index, "master")
+    assert ".." not in walks[-1]
+    assert index.latest("master")[1] == "1.0.0"
+
+
+def test_check_current_branch(release_lines):
+    repo = Repo(release_lines.path)
+    config = read_config_file(release_lines.path)
+
+    result = check_current_branch(repo, config, jobs=2)
+    assert result["branch"] == "master"
+    assert [
+        (branch, [fix[1] for fix in fixes]) for branch, fixes in result["missing"]
+    ] == [
+        ("release/v0.8", ["#2", "#1"]),
+        ("release/v0.9", ["#3", "#1"]),
+        ("release/v1.0", ["#4", "#3", "#1"]),
+    ]
+    assert result["cut_off"] == []
+
+    # the result is stored, checking again does not read any commit
+    with patch.dict(READERS, clear=True):
+        assert check_current_branch(repo, config) == result
+
+
+def test_update_fix_index(release_lines):
+    repo = Repo(release_lines.path)
+    index = FixIndex()
+    walks = []
+    iter_commits = repo.iter_commits
+
+    def counting_iter_commits(rev, **kwargs):
+        walks.append(rev)
+        return iter_commits(rev, **kwargs)
+
+    repo.iter_commits = counting_iter_commits
+
+    # a new branch is seeded from the indexed branch it shares the most
+    # history with, only the commits since their merge base are walked
+    update_fix_index(repo, index, "release/v0.9")
+    update_fix_index(repo, index, "master")
+    master, release = repo.commit("master").hexsha, repo.commit("release/v0.9").hexsha
+    assert walks[1:] == [
+        "{0}..{1}".format(master, release),
+        "{0}..{1}".format(release, master),
+    ]
+    assert index.missing("release/v0.9", "master") == [
+        repo.commit("release/v0.9").hexsha,
+        repo.commit("release/v0.9~1").hexsha,
+    ]
+
+    # unchanged branches are not walked again
+    update_fix_index(repo, index, "master")
+    assert len(walks) == 3
+
+    # only the new commits are walked, up to the given tip
+    old_tip = index.branches["master"]["tip"]
+    new_tip = release_lines.commits(["fix: port \n\n #3", "feature 3"])[-1]
+    release_lines.commit("not indexed yet")
+    update_fix_index(repo, index, "master", new_tip)
+    assert walks[-1] == "{0}..{1}".format(old_tip, new_tip)
+    assert index.missing("release/v0.9", "master") == [
+        repo.commit("release/v0.9~1").hexsha
+    ]
+
+    # the fixes the seed got after the merge base are dropped
+    release_lines.git("checkout", "-q", "-b", "feature", "master~3")
+    feature_tip = release_lines.commit("fix: feature \n\n #5")
+    update_fix_index(repo, index, "feature")
+    assert walks[-2:] == [
+        "{0}..{1}".format(feature_tip, new_tip),
+        "{0}..{1}".format(new_tip, feature_tip),
+    ]
+    assert index.branches["feature"]["fixes"] == [
+        feature_tip,
+        repo.commit("release/v0.8~3").hexsha,
+    ]
+
+    # a branch forked from an indexed tip takes over all of its fixes
+    release_lines.git("checkout", "-q", "-b", "feature-2", new_tip)
+    update_fix_index(repo, index, "feature-2")
+    assert walks[-1] == "{0}..{1}".format(new_tip, new_tip)
+    assert index.branches["feature-2"] == index.branches["master"]
+    release_lines.checkout("master")
+
+    # so is a force-pushed branch, only unrelated ones are indexed from scratch
+    release_lines.git("reset", "-q", "--hard", "release/v0.8")
+    update_fix_index(repo, index, "master")
+    assert walks[-1].endswith("..{0}".format(repo.commit("master").hexsha))
+    index.set_branch("gone", "0" * 40, [])
+    release_lines.git("checkout", "-q", "--orphan", "unrelated")
+    release_lines.commit("fix: unrelated \n\n #6")
+    update_fix_index(repo, index, "unrelated")
+    assert ".." not in walks[-1]
+    release_lines.checkout("master")
+    assert index.missing("release/v0.9", "master") == [
+        repo.commit("release/v0.9").hexsha
+    ]
+    assert index.missing("master", "release/v0.9") == [
+        repo.commit("release/v0.8").hexsha
+    ]
+
+
+def test_parse_ref_updates():
+    lines = [
+        "{0} {1} refs/heads/master\n".format("a" * 40, "b" * 40),
+        "{0} {1} refs/tags/v1.0\n".format(ZERO_SHA, "c" * 40),
+        "refs/heads/release/v1.0 {0} refs/heads/release/v1.0 {1}\n".format(
+            "d" * 40, ZERO_SHA
+        ),
+        "\n",
+    ]
+
+    assert parse_ref_updates(lines) == [
+        ("a" * 40, "b" * 40, "master"),
+        (ZERO_SHA, "d" * 40, "release/v1.0"),
+    ]
+
+
+@pytest.mark.parametrize("reader", sorted(READERS))
+def test_history_horizon(tmpdir, monkeypatch, reader):
+    git_repo = GitRepo(tmpdir)
+    shas = []
+    for number in range(5):
+        monkeypatch.setenv("GIT_COMMITTER_DATE", "@{0} +0000".format(1000 * number))
+        shas.append(git_repo.commit("fix: {0} \n\n #{0}".format(number)))
+    repo = Repo(git_repo.path)
+    reader = READERS[reader](repo)
+
+    def walk(**kwargs):
+        horizon = HistoryHorizon(**kwargs)
+        return list(
+            get_bugfixes_for_branch(repo, "master", reader=reader, horizon=horizon)
+        )
+
+    assert walk() == ["#4", "#3", "#2", "#1", "#0"]
+    assert walk(max_depth=2) == ["#4", "#3"]
+    assert walk(since=2000) == ["#4", "#3", "#2"]
+    assert walk(stop_at=[shas[1]]) == ["#4", "#3", "#2"]
+    assert walk(max_depth=4, stop_at=[shas[3]]) == ["#4"]
+    reader.close()
+
+
+def test_history_horizon_shallow_clone(tmpdir):
+    origin = GitRepo(tmpdir.join("origin"))
+    shas = origin.commits(["base", "fix: a \n\n #1", "fix: b \n\n #2"])
+    clone = str(tmpdir.join("clone"))
+    origin.git("clone", "-q", "--depth", "2", "file://" + origin.path, clone)
+
+    assert get_shallow_commits(Repo(origin.path)) == set()
+    assert get_shallow_commits(MockRepo(branches=["master"])) == set()
+    repo = Repo(clone)
+    assert get_shallow_commits(repo) == {shas[1]}
+
+    # the boundary is only recorded when a walk reaches it
+    horizon = HistoryHorizon(shallow=get_shallow_commits(repo))
+    bounded = horizon.stop_at(shas[1])
+    assert list(get_bugfixes_for_branch(repo, "master", horizon=bounded)) == ["#2"]
+    assert horizon.cut_off == set()
+
+    assert list(get_bugfixes_for_branch(repo, "master", horizon=horizon)) == [
+        "#2",
+        "#1",
+    ]
+    assert horizon.cut_off == bounded.cut_off == {shas[1]}
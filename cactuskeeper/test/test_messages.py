@@ -0,0 +1,106 @@
+import re
+
+import pytest
+
+from cactuskeeper.messages import get_leading_class, MessageParser, scope_global_flags
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        (r"#\d+", r"\#"),
+        (r"\#\d+", r"\#"),
+        (r"\d+", r"\d"),
+        (r"[A-Z][A-Z0-9]+-\d+", "A-Z"),
+        (r"#?\d+", None),
+        (r"[a-z]*x", None),
+        (r"x{0,2}y", None),
+        (r"\b#\d+", None),
+        (r"[^a]x", None),
+        (r"[\w-]x", None),
+        (r"[ab", None),
+        (r"(?i)abc", None),
+        (r"a|b", None),
+        ("", None),
+    ],
+)
+def test_get_leading_class(pattern, expected):
+    assert get_leading_class(pattern) == expected
+
+
+MESSAGES = [
+    "fix: something \n\n more info #12",
+    "fix #12 in the shortlog only",
+    "fix: header\n\n# not an issue, but ABC-7 and #4 are",
+    "release: v1.2.3\n\n#7",
+    "feature ABC-1\n\nno issue",
+    "",
+    "  spaces  \n#3",
+]
+
+
+@pytest.mark.parametrize("patterns", [[r"#\d+"], [r"(#)(\d+)"]])
+def test_parse(patterns):
+    """the result is the same with and without known leading characters"""
+    parser = MessageParser(patterns)
+
+    assert parser.parse(MESSAGES) == [
+        ("fix: something", "#12", ""),
+        ("fix #12 in the shortlog only", "", ""),
+        ("fix: header", "#4", ""),
+        ("release: v1.2.3", "#7", "1.2.3"),
+        ("feature ABC-1", "", ""),
+        ("", "", ""),
+        ("spaces", "#3", ""),
+    ]
+    assert parser.parse([]) == []
+    assert parser.parse(["single"]) == [("single", "", "")]
+
+
+def test_parse_several_patterns():
+    parser = MessageParser([r"#\d+", r"[A-Z][A-Z0-9]+-\d+"])
+
+    assert [issue for _, issue, _ in parser.parse(MESSAGES)] == [
+        "#12",
+        "",
+        "ABC-7",
+        "#7",
+        "",
+        "",
+        "#3",
+    ]
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        (r"#\d+", r"#\d+"),
+        (r"(?i)jira-\d+", r"(?i:jira-\d+)"),
+        (r"(?ix)jira-\d+", r"(?ix:jira-\d+)"),
+        (r"(?:a)b", r"(?:a)b"),
+    ],
+)
+def test_scope_global_flags(pattern, expected):
+    assert scope_global_flags(pattern) == expected
+
+
+def test_parse_global_flags():
+    parser = MessageParser([r"#\d+", r"(?i)jira-\d+"])
+
+    assert parser.parse(["fix: a\n\nJira-12", "fix: b\n\n#3"]) == [
+        ("fix: a", "Jira-12", ""),
+        ("fix: b", "#3", ""),
+    ]
+
+
+@pytest.mark.parametrize(
+    "patterns,message",
+    [
+        ([r"#\d+", r"[A-Z+-\d+"], r"Invalid issue pattern '[A-Z+-\d+'"),
+        ([r"#\d+(?i)"], "Invalid issue pattern"),
+        ([r"(?P<n>#\d+)", r"(?P<n>[A-Z]+-\d+)"], "Invalid issue patterns"),
+    ],
+)
+def test_invalid_patterns(patterns, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        MessageParser(patterns)
@@ -0,0 +1,158 @@
+from binascii import unhexlify
+import struct
+import zlib
+
+import pytest
+
+from cactuskeeper.objects import (
+    apply_delta,
+    CommitGraph,
+    IDX_MAGIC,
+    ObjectStore,
+    PackIndex,
+)
+from cactuskeeper.test.helpers import GitRepo
+
+BODY = "\n".join("line {0} of a long commit message".format(i) for i in range(200))
+
+
+@pytest.fixture()
+def git_repo(tmpdir):
+    repo = GitRepo(tmpdir.join("repo"))
+    # similar commit messages are stored as deltas of each other when packed
+    repo.shas = [repo.commit("fix {0}\n\n{1}".format(i, BODY)) for i in range(4)]
+    return repo
+
+
+def git_object(git_repo, hexsha):
+    kind = git_repo.git("cat-file", "-t", hexsha)
+    with open(
+        git_repo.path + "/.git/objects/" + hexsha[:2] + "/" + hexsha[2:], "rb"
+    ) as f:
+        return kind, zlib.decompress(f.read()).partition(b"\0")[2]
+
+
+def test_read_loose_objects(git_repo):
+    store = ObjectStore(git_repo.path + "/.git")
+    assert store.packs == []
+
+    for hexsha in git_repo.shas:
+        assert store.read(hexsha) == git_object(git_repo, hexsha)
+
+    with pytest.raises(KeyError):
+        store.read("0" * 40)
+
+
+@pytest.mark.parametrize("offset_deltas", ["true", "false"])
+def test_read_packed_objects(git_repo, offset_deltas):
+    expected = {hexsha: git_object(git_repo, hexsha) for hexsha in git_repo.shas}
+    git_repo.git("config", "repack.useDeltaBaseOffset", offset_deltas)
+    git_repo.git("repack", "-q", "-a", "-d", "-f", "--window=50")
+    git_repo.git("prune-packed")
+
+    store = ObjectStore(git_repo.path + "/.git")
+    assert len(store.packs) == 1
+    # the messages are larger than a chunk, so they are inflated in pieces
+    store.packs[0].chunk_size = 100
+
+    for hexsha, (kind, content) in expected.items():
+        assert store.read(hexsha) == (kind, content)
+    assert store.read(git_repo.git("rev-parse", "HEAD^{tree}"))[0] == "tree"
+
+    with pytest.raises(KeyError):
+        store.read("0" * 40)
+
+    with pytest.raises(ValueError):
+        store.packs[0].inflate(len(store.packs[0].data))
+
+    store.close()
+    assert store.packs == []
+
+
+def test_find_prefix(git_repo):
+    hexsha = git_repo.shas[0]
+    loose = ObjectStore(git_repo.path + "/.git")
+    assert loose.find_prefix(hexsha[:7].upper()) == [hexsha]
+
+    git_repo.git("gc", "-q")
+    packed = ObjectStore(git_repo.path + "/.git")
+    assert packed.packs[0].index.count > 0
+    assert packed.find_prefix(hexsha[:5]) == [hexsha]
+    assert packed.find_prefix(hexsha) == [hexsha]
+    assert packed.find_prefix(hexsha[:2] + "0000") == []
+    assert packed.find_prefix("ffffffff") == []
+
+
+def test_pack_index_large_offsets(tmpdir):
+    sha = unhexlify("ab" * 20)
+    fanout = [0] * 0xAB + [1] * (256 - 0xAB)
+    data = IDX_MAGIC + struct.pack(">I", 2) + struct.pack(">256I", *fanout)
+    data += sha + struct.pack(">I", 0)
+    # the offset points to the first entry of the large offset table
+    data += struct.pack(">I", 0x80000000) + struct.pack(">Q", 1 << 33)
+    tmpdir.join("pack.idx").write_binary(data)
+
+    index = PackIndex(str(tmpdir.join("pack.idx")))
+    assert index.offset(sha) == 1 << 33
+    assert index.offset(unhexlify("aa" * 20)) is None
+    assert index.offset(unhexlify("ff" * 20)) is None
+    index.close()
+
+
+def test_pack_index_unsupported(tmpdir):
+    tmpdir.join("pack.idx").write_binary(b"\0" * 1100)
+
+    with pytest.raises(ValueError):
+        PackIndex(str(tmpdir.join("pack.idx")))
+
+
+def test_apply_delta():
+    base = b"0123456789"
+    # sizes 10 and 7, copy 4 bytes from offset 2, insert "abc"
+    delta = bytes([10, 7, 0x80 | 0x01 | 0x10, 2, 4, 3]) + b"abc"
+    assert apply_delta(base, delta) == b"2345abc"
+
+    with pytest.raises(ValueError):
+        apply_delta(base, bytes([10, 8, 3]) + b"abc")
+
+
+def test_commit_graph(git_repo):
+    # an octopus merge stores its extra parents in a separate chunk
+    for name in ("a", "b", "c"):
+        git_repo.branch(name, git_repo.shas[0])
+        git_repo.checkout(name)
+        git_repo.commit(name)
+    git_repo.checkout("master")
+    git_repo.git("merge", "-q", "-m", "octopus", "a", "b", "c")
+    git_repo.git("commit-graph", "write", "--reachable")
+
+    store = ObjectStore(git_repo.path + "/.git")
+    assert isinstance(store.commit_graph, CommitGraph)
+
+    log = git_repo.git(
+        "log", "--all", "--topo-order", "--reverse", "--format=%H %ct %P"
+    )
+    generations = {}
+    for line in log.splitlines():
+        hexsha, timestamp, *parent_shas = line.split()
+        generations[hexsha] = 1 + max(
+            (generations[parent] for parent in parent_shas), default=0
+        )
+        assert store.commit_graph.lookup(hexsha) == (
+            tuple(parent_shas),
+            int(timestamp),
+            generations[hexsha],
+        )
+
+    # commits made after writing the graph are missing from it
+    assert store.commit_graph.lookup(git_repo.commit("new")) is None
+
+    store.close()
+    assert store.commit_graph is None
+
+
+def test_commit_graph_unsupported(tmpdir):
+    tmpdir.join("commit-graph").write_binary(b"CGPH\2\1" + b"\0" * 100)
+
+    with pytest.raises(ValueError):
+        CommitGraph(str(tmpdir.join("commit-graph")))
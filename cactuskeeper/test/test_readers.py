@@ -0,0 +1,446 @@
+import os
+import subprocess
+
+from click.testing import CliRunner
+from git import Repo
+import pytest
+
+from cactuskeeper import aiogit
+from cactuskeeper.aiogit import AsyncReader
+from cactuskeeper.cli import cli
+from cactuskeeper.git import get_bugfixes_for_branch
+from cactuskeeper.readers import (
+    CommitRecord,
+    GitPythonReader,
+    PackReader,
+    StreamReader,
+)
+from cactuskeeper.test.helpers import GitRepo
+
+
+@pytest.fixture()
+def git_repo(tmpdir):
+    repo = GitRepo(tmpdir)
+    repo.commits(["base", "release: v0.9.0"])
+    repo.branch("release/v0.9")
+    repo.checkout("release/v0.9")
+    repo.commits(["fix: something \n\n #1", "fix: other thing \n\n #2"])
+    repo.checkout("master")
+    repo.git("merge", "-q", "--no-ff", "-m", "merge release", "release/v0.9")
+    repo.commit("fix: master only \n\n #3")
+    return repo
+
+
+def test_stream_reader_matches_gitpython(git_repo):
+    repo = Repo(git_repo.path)
+
+    expected = [
+        (c.hexsha, tuple(p.hexsha for p in c.parents), c.message)
+        for c in GitPythonReader(repo).iter_commits("master")
+    ]
+    result = [
+        (c.hexsha, tuple(p.hexsha for p in c.parents), c.message)
+        for c in StreamReader(repo).iter_commits("master")
+    ]
+
+    assert len(result) == 6
+    assert [r[:2] for r in result] == [e[:2] for e in expected]
+    assert [r[2].strip() for r in result] == [e[2].strip() for e in expected]
+
+
+def test_stream_reader_small_chunks(git_repo):
+    reader = StreamReader(Repo(git_repo.path))
+    expected = [c.message for c in reader.iter_commits("master")]
+
+    reader.chunk_size = 7
+    assert [c.message for c in reader.iter_commits("master")] == expected
+
+
+def test_stream_reader_stop_early(git_repo):
+    reader = StreamReader(Repo(git_repo.path))
+
+    commits = reader.iter_commits("master")
+    first = next(commits)
+    commits.close()
+
+    assert first.hexsha == git_repo.git("rev-parse", "master")
+
+
+def test_stream_reader_unknown_revision(git_repo):
+    reader = StreamReader(Repo(git_repo.path))
+
+    with pytest.raises(subprocess.CalledProcessError):
+        list(reader.iter_commits("does-not-exist"))
+
+
+def test_stream_reader_commit(git_repo):
+    reader = StreamReader(Repo(git_repo.path))
+    hexsha = git_repo.git("rev-parse", "release/v0.9")
+
+    commit = reader.commit(hexsha[:8])
+    assert commit.hexsha == hexsha
+    assert commit.message.startswith("fix: other thing")
+    assert [p.hexsha for p in commit.parents] == [
+        git_repo.git("rev-parse", "release/v0.9^")
+    ]
+
+    # the batch process is reused
+    assert reader.commit("0" * 40) is None
+    assert reader.commit("master^{tree}") is None
+    assert reader.commit(hexsha).hexsha == hexsha
+
+    reader.close()
+    reader.close()
+
+
+def test_async_reader(git_repo, monkeypatch):
+    repo = Repo(git_repo.path)
+    expected = [c.hexsha for c in StreamReader(repo).iter_commits("master")]
+    reader = AsyncReader(repo)
+
+    # prefetched walks are picked up by the walks with the same arguments
+    reader.prefetch(["master", "master~2..master", "release/v0.9"])
+    reader.prefetch(["master"])
+    assert len(reader._started) == 3
+    assert [c.hexsha for c in reader.iter_commits("master")] == expected
+    assert len(list(reader.iter_commits("master~2..master"))) == 4
+
+    monkeypatch.setattr(aiogit, "CHUNK_SIZE", 7)
+    assert [c.hexsha for c in reader.iter_commits("master")] == expected
+
+    commits = reader.iter_commits(["master"], grep="^fix:")
+    assert next(commits).message.startswith("fix: master only")
+    commits.close()
+
+    with pytest.raises(subprocess.CalledProcessError):
+        list(reader.iter_commits("does-not-exist"))
+
+    # the walk of release/v0.9 is still running
+    reader.close()
+    reader.close()
+
+
+def test_async_reader_commit(git_repo):
+    reader = AsyncReader(Repo(git_repo.path))
+    hexsha = git_repo.git("rev-parse", "release/v0.9")
+
+    commit = reader.commit(hexsha[:8])
+    assert commit.hexsha == hexsha
+    assert commit.message.startswith("fix: other thing")
+    assert [p.hexsha for p in commit.parents] == [
+        git_repo.git("rev-parse", "release/v0.9^")
+    ]
+
+    assert reader.commit("0" * 40) is None
+    assert reader.commit("master^{tree}") is None
+    assert reader.commit(hexsha).hexsha == hexsha
+    reader.close()
+
+
+def test_gitpython_reader_commit(git_repo):
+    hexsha = git_repo.git("rev-parse", "master")
+
+    assert GitPythonReader(Repo(git_repo.path)).commit(hexsha).hexsha == hexsha
+
+
+def test_commit_record_defaults():
+    record = CommitRecord("abc")
+    assert record.parents == []
+    assert record.message == ""
+
+
+def test_get_bugfixes_with_stream_reader(git_repo):
+    repo = Repo(git_repo.path)
+    reader = StreamReader(repo)
+
+    result = get_bugfixes_for_branch(repo, "master", reader=reader)
+
+    assert list(result.keys()) == ["#3", "#2", "#1"]
+
+
+def test_check_with_stream_reader(git_repo):
+    # drop the merge of the release branch from master
+    git_repo.git("reset", "-q", "--hard", "master~2")
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, ["--repo", git_repo.path, "--reader", "stream", "check"]
+    )
+
+    assert result.exit_code == 1
+    assert "#2\tfix: other thing" in result.output
+    assert "#1\tfix: something" in result.output
+
+
+@pytest.mark.parametrize("packed", [False, True])
+@pytest.mark.parametrize(
+    "rev",
+    [
+        "master",
+        "release/v0.9",
+        "release/v0.9..master",
+        "master..release/v0.9",
+        "master..master",
+    ],
+)
+def test_pack_reader_matches_gitpython(git_repo, packed, rev):
+    if packed:
+        git_repo.git("gc", "-q")
+    repo = Repo(git_repo.path)
+
+    expected = [
+        (c.hexsha, tuple(p.hexsha for p in c.parents), c.message)
+        for c in GitPythonReader(repo).iter_commits(rev)
+    ]
+    result = [
+        (c.hexsha, c.parent_shas, c.message) for c in PackReader(repo).iter_commits(rev)
+    ]
+
+    # commits made within the same second may be ordered differently
+    assert sorted(result) == sorted(expected)
+
+
+def test_pack_reader_topo_order(git_repo):
+    git_repo.checkout("release/v0.9")
+    git_repo.commit("fix: late fix \n\n #4")
+    reader = PackReader(Repo(git_repo.path))
+
+    commits = list(reader.iter_commits(["master", "release/v0.9"], topo_order=True))
+
+    assert len(commits) == 7
+    seen = set()
+    for commit in commits:
+        assert not seen.intersection(commit.parent_shas)
+        seen.add(commit.hexsha)
+
+
+def test_pack_reader_date_order(tmpdir, monkeypatch):
+    git_repo = GitRepo(tmpdir)
+
+    def commit(message, timestamp):
+        monkeypatch.setenv("GIT_COMMITTER_DATE", "@{0} +0000".format(timestamp))
+        return git_repo.commit(message)
+
+    base = commit("base", 1000)
+    git_repo.branch("release/v1.0")
+    feature = commit("feature", 4000)
+    git_repo.checkout("release/v1.0")
+    fix = commit("fix", 2000)
+    later_fix = commit("later fix", 3000)
+    reader = PackReader(Repo(git_repo.path))
+
+    commits = reader.iter_commits(["release/v1.0", "master"])
+    assert [c.hexsha for c in commits] == [feature, later_fix, fix, base]
+
+    # the base is first reached from master, then from the excluded branch
+    commits = reader.iter_commits("release/v1.0..master")
+    assert [c.hexsha for c in commits] == [feature]
+
+    commits = reader.iter_commits("master..release/v1.0", topo_order=True)
+    assert [c.hexsha for c in commits] == [later_fix, fix]
+
+
+@pytest.mark.parametrize("graph", [False, True])
+def test_pack_reader_commit_graph(git_repo, graph):
+    git_repo.git("gc", "-q")
+    if not graph:
+        os.remove(git_repo.path + "/.git/objects/info/commit-graph")
+    # commits made after writing the commit-graph are not in it
+    git_repo.checkout("release/v0.9")
+    late_fix = git_repo.commit("fix: late fix \n\n #4")
+    git_repo.checkout("master")
+
+    reader = PackReader(Repo(git_repo.path))
+    inflated = []
+    load = reader._load
+
+    def counting_load(hexsha):
+        inflated.append(hexsha)
+        return load(hexsha)
+
+    reader._load = counting_load
+
+    commits = list(reader.iter_commits("master..release/v0.9"))
+    assert [c.hexsha for c in commits] == [late_fix]
+    assert [c.message for c in commits] == ["fix: late fix\n\n #4\n"]
+
+    # without the commit-graph the history of master is inflated as well
+    if graph:
+        assert inflated == [late_fix]
+    else:
+        assert len(inflated) > 2
+
+    commits = list(reader.iter_commits("release/v0.9..master"))
+    assert [c.message.split()[0] for c in commits] == ["fix:", "merge"]
+
+
+@pytest.mark.parametrize("graph", [False, True])
+@pytest.mark.parametrize("length", [3, 8])
+def test_pack_reader_skewed_dates(tmpdir, monkeypatch, graph, length):
+    git_repo = GitRepo(tmpdir)
+
+    def commit(message, timestamp):
+        monkeypatch.setenv("GIT_COMMITTER_DATE", "@{0} +0000".format(timestamp))
+        return git_repo.commit(message)
+
+    # the base has a date after all of its descendants
+    commit("base", 5000)
+    git_repo.branch("excluded")
+    commit("fix", 2000)
+    git_repo.checkout("excluded")
+    for number in range(length):
+        commit("excluded {0}".format(number), 1000 - number)
+    if graph:
+        git_repo.git("commit-graph", "write", "--reachable")
+    reader = PackReader(Repo(git_repo.path))
+
+    commits = sorted(c.hexsha for c in reader.iter_commits("excluded..master"))
+
+    if graph:
+        # generation numbers give the exact result
+        expected = [git_repo.git("rev-parse", "master")]
+    else:
+        # like git, a long line of old commits is not walked to the end
+        expected = sorted(git_repo.git("rev-list", "excluded..master").split())
+        assert len(expected) == (1 if length == 3 else 2)
+    assert commits == expected
+
+
+def test_pack_reader_resolve(git_repo):
+    git_repo.git("tag", "-a", "-m", "release", "v0.9.0", "master~3")
+    git_repo.git("update-ref", "refs/remotes/origin/master", "master")
+    git_repo.git(
+        "symbolic-ref", "refs/remotes/origin/HEAD", "refs/remotes/origin/master"
+    )
+    reader = PackReader(Repo(git_repo.path))
+    master = git_repo.git("rev-parse", "master")
+
+    assert reader.resolve("HEAD") == master
+    assert reader.resolve("origin") == master
+    assert reader.resolve("origin/master") == master
+    assert reader.resolve("v0.9.0") == git_repo.git("rev-parse", "master~3")
+    assert reader.resolve(master[:7]) == master
+
+    git_repo.git("pack-refs", "--all")
+    assert reader.resolve("refs/heads/release/v0.9") == git_repo.git(
+        "rev-parse", "release/v0.9"
+    )
+
+    with pytest.raises(ValueError):
+        reader.resolve("does-not-exist")
+    with pytest.raises(ValueError):
+        reader.resolve(git_repo.git("rev-parse", "master^{tree}"))
+
+
+def test_pack_reader_commit(git_repo):
+    reader = PackReader(Repo(git_repo.path))
+    hexsha = git_repo.git("rev-parse", "release/v0.9")
+
+    commit = reader.commit(hexsha[:8])
+    assert commit.hexsha == hexsha
+    assert commit.message.startswith("fix: other thing")
+    assert commit.parent_shas == (git_repo.git("rev-parse", "release/v0.9^"),)
+
+    assert reader.commit("0" * 40) is None
+    reader.close()
+
+
+@pytest.mark.parametrize("graph", [False, True])
+def test_pack_reader_shallow(git_repo, graph):
+    if graph:
+        git_repo.git("gc", "-q")
+    # the history of master is cut off below the merge
+    boundary = git_repo.git("rev-parse", "master~1")
+    with open(os.path.join(git_repo.path, ".git", "shallow"), "w") as f:
+        f.write(boundary + "\n")
+    reader = PackReader(Repo(git_repo.path))
+
+    for rev in ["master", "release/v0.9..master"]:
+        commits = [c.hexsha for c in reader.iter_commits(rev)]
+        assert sorted(commits) == sorted(git_repo.git("rev-list", rev).split())
+    assert reader.commit(boundary).parent_shas == ()
+
+
+def test_check_with_pack_reader_in_shallow_clone(tmpdir):
+    origin = GitRepo(tmpdir.join("origin"))
+    origin.commits(["base", "release: v0.9.0"])
+    origin.branch("release/v0.9")
+    origin.commits(["feature", "feature 2"])
+    origin.checkout("release/v0.9")
+    origin.commit("fix: something \n\n #1")
+    origin.checkout("master")
+    clone = str(tmpdir.join("clone"))
+    origin.git(
+        "clone",
+        "-q",
+        "--depth",
+        "2",
+        "--no-single-branch",
+        "file://" + origin.path,
+        clone,
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli, ["--repo", clone, "--reader", "pack", "--remote", "origin", "check"]
+    )
+
+    assert result.exit_code == 1
+    assert "#1\tfix: something" in result.output
+
+
+def test_check_with_pack_reader_in_worktree(git_repo, tmpdir):
+    git_repo.git("reset", "-q", "--hard", "master~2")
+    git_repo.git("gc", "-q")
+    worktree = str(tmpdir.join("worktree"))
+    git_repo.git("worktree", "add", "-q", "-b", "feature", worktree, "master")
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--repo", worktree, "--reader", "pack", "check"])
+
+    assert result.exit_code == 1
+    assert "#2\tfix: other thing" in result.output
+
+
+def test_check_with_async_reader(git_repo):
+    git_repo.git("reset", "-q", "--hard", "master~2")
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--repo", git_repo.path, "--reader", "async", "check"])
+
+    assert result.exit_code == 1
+    assert "#2\tfix: other thing" in result.output
+    assert "#1\tfix: something" in result.output
+
+
+def test_check_with_pack_reader(git_repo):
+    git_repo.git("reset", "-q", "--hard", "master~2")
+    git_repo.git("gc", "-q")
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--repo", git_repo.path, "--reader", "pack", "check"])
+
+    assert result.exit_code == 1
+    assert "#2\tfix: other thing" in result.output
+    assert "#1\tfix: something" in result.output
+
+
+@pytest.mark.parametrize("branch", ["description", "config", "index"])
+def test_check_with_pack_reader_on_branch_named_like_a_file(git_repo, branch):
+    git_repo.git("checkout", "-q", "-b", branch, "master~2")
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--repo", git_repo.path, "--reader", "pack", "check"])
+
+    assert result.exit_code == 1
+    assert "#2\tfix: other thing" in result.output
+
+
+@pytest.mark.parametrize("reader", [GitPythonReader, StreamReader, PackReader])
+def test_reader_grep(git_repo, reader):
+    commits = reader(Repo(git_repo.path)).iter_commits("master", grep="^fix:")
+    assert sorted(c.message.split("#")[1].strip() for c in commits) == ["1", "2", "3"]
+
+    # matches any line of the message
+    commits = reader(Repo(git_repo.path)).iter_commits("master", grep="^ #2")
+    assert [c.message.split()[1] for c in commits] == ["other"]
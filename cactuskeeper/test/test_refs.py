@@ -0,0 +1,81 @@
+import os
+
+from cactuskeeper.refs import get_common_dir, iter_refs, read_ref
+from cactuskeeper.test.helpers import GitRepo
+
+
+def test_iter_refs(tmpdir):
+    repo = GitRepo(tmpdir)
+    first = repo.commit("base")
+    for name in ("release/v1.0", "release/v1.1", "feature/release/v9.9", "releases"):
+        repo.branch(name)
+    repo.git("pack-refs", "--all")
+
+    second = repo.commit("second")
+    # a loose ref takes precedence over the packed one
+    repo.git("update-ref", "refs/heads/release/v1.1", second)
+    repo.branch("release/v2.0")
+    git_dir = os.path.join(repo.path, ".git")
+    open(os.path.join(git_dir, "refs/heads/release/v3.0.lock"), "w").close()
+
+    assert iter_refs(git_dir, "refs/heads/release/") == [
+        ("refs/heads/release/v1.0", first),
+        ("refs/heads/release/v1.1", second),
+        ("refs/heads/release/v2.0", second),
+    ]
+    assert [name for name, _ in iter_refs(git_dir, "refs/heads/release")] == [
+        "refs/heads/release/v1.0",
+        "refs/heads/release/v1.1",
+        "refs/heads/release/v2.0",
+        "refs/heads/releases",
+    ]
+    assert iter_refs(git_dir, "refs/remotes/origin/") == []
+
+
+def test_iter_refs_skips_symbolic_refs(tmpdir):
+    repo = GitRepo(tmpdir)
+    hexsha = repo.commit("base")
+    repo.git("update-ref", "refs/remotes/origin/release/v1.0", hexsha)
+    repo.git(
+        "symbolic-ref", "refs/remotes/origin/HEAD", "refs/remotes/origin/release/v1.0"
+    )
+
+    git_dir = os.path.join(repo.path, ".git")
+    assert iter_refs(git_dir, "refs/remotes/origin/") == [
+        ("refs/remotes/origin/release/v1.0", hexsha)
+    ]
+    assert read_ref(git_dir, "refs/remotes/origin/HEAD") == hexsha
+
+
+def test_worktree(tmpdir):
+    repo = GitRepo(tmpdir.join("main"))
+    hexsha = repo.commit("base")
+    repo.branch("release/v1.0")
+    repo.git("worktree", "add", "-q", str(tmpdir.join("worktree")), "-b", "work")
+    repo.git("pack-refs", "--all")
+
+    git_dir = os.path.join(repo.path, ".git", "worktrees", "worktree")
+    assert get_common_dir(git_dir) == os.path.join(repo.path, ".git")
+    assert read_ref(git_dir, "HEAD") == hexsha
+    assert read_ref(git_dir, "refs/heads/release/v1.0") == hexsha
+    assert read_ref(git_dir, "refs/heads/missing") is None
+    assert read_ref(git_dir, "refs/heads/release") is None
+    assert iter_refs(git_dir, "refs/heads/release/") == [
+        ("refs/heads/release/v1.0", hexsha)
+    ]
+
+
+def test_read_ref_only_reads_refs(tmpdir):
+    repo = GitRepo(tmpdir)
+    hexsha = repo.commit("base")
+    repo.branch("description")
+    git_dir = os.path.join(repo.path, ".git")
+    with open(os.path.join(git_dir, "refs", "heads", "broken"), "w") as f:
+        f.write("not a sha\n")
+
+    # other files in the git directory are no refs
+    assert read_ref(git_dir, "description") is None
+    assert read_ref(git_dir, "config") is None
+    assert read_ref(git_dir, "refs/../config") is None
+    assert read_ref(git_dir, "refs/heads/description") == hexsha
+    assert read_ref(git_dir, "refs/heads/broken") is None
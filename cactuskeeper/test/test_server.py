@@ -0,0 +1,309 @@
+import io
+import os
+import socket
+import threading
+
+from click.testing import CliRunner
+import mock
+import pytest
+
+from cactuskeeper.cli import cli
+from cactuskeeper.client import get_default_socket_path, send_request
+from cactuskeeper.server import RequestHandler, Server
+from cactuskeeper.test.helpers import GitRepo, write_config_file
+
+
+@pytest.fixture()
+def git_repo(tmpdir):
+    repo = GitRepo(tmpdir.join("repo"))
+    repo.commits(["base", "release: v0.9.0"])
+    repo.branch("release/v0.9")
+    repo.checkout("release/v0.9")
+    repo.commit("fix: something \n\n #1")
+    repo.checkout("master")
+    repo.commit("feature")
+    return repo
+
+
+@pytest.fixture()
+def server(tmpdir):
+    socket_path = str(tmpdir.join("ck.sock"))
+    # the socket of a daemon which did not clean up is replaced
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(socket_path)
+
+    server = Server(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    send_request(socket_path, {"command": "shutdown"})
+    thread.join()
+    server.server_close()
+
+
+def test_default_socket_path(monkeypatch, tmpdir):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert get_default_socket_path().startswith("/run/user/1000/cactuskeeper-")
+
+    # without it, the socket is put into a directory private to the user
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    monkeypatch.setattr("tempfile.gettempdir", lambda: str(tmpdir))
+    directory = tmpdir.join("cactuskeeper-{0}".format(os.getuid()))
+    for _ in range(2):
+        assert get_default_socket_path() == str(directory.join("ck.sock"))
+        assert directory.stat().mode & 0o777 == 0o700
+
+    directory.chmod(0o755)
+    with pytest.raises(PermissionError):
+        get_default_socket_path()
+
+
+def test_existing_socket_path(server, tmpdir, capsys):
+    # a running daemon is not taken over, nor disturbed by the probe
+    with pytest.raises(ValueError, match="already listening"):
+        Server(server.server_address)
+    assert "config" in send_request(
+        server.server_address, {"command": "config", "repo": str(tmpdir)}
+    )
+    assert capsys.readouterr().err == ""
+
+    path = tmpdir.join("file")
+    path.write("data")
+    with pytest.raises(ValueError, match="is not a socket"):
+        Server(str(path))
+    assert path.read() == "data"
+
+
+def test_request_handler_without_client():
+    handler = RequestHandler.__new__(RequestHandler)
+    handler.server = mock.Mock()
+    handler.server.handle_request_data.return_value = {}
+
+    # a client leaving before the response is sent is no error
+    handler.rfile = io.BytesIO(b'{"command": "config"}\n')
+    handler.wfile = mock.Mock()
+    handler.wfile.write.side_effect = BrokenPipeError
+    handler.handle()
+
+    # connections without a request, like the probe for stale sockets, are ignored
+    handler.rfile = io.BytesIO(b"")
+    handler.wfile = mock.Mock()
+    handler.handle()
+    handler.wfile.write.assert_not_called()
+
+
+def test_check(server, git_repo):
+    request = {"command": "check", "repo": git_repo.path}
+
+    response = send_request(server.server_address, request)
+    assert response["branch"] == "master"
+    [[branch, fixes]] = response["missing"]
+    assert branch == "release/v0.9"
+    assert [fix[1:] for fix in fixes] == [["#1", "fix: something"]]
+
+    # the result is kept for the same branch tips and configuration
+    state = server.get_state(git_repo.path)
+    assert len(state.results.entries) == 1
+    assert send_request(server.server_address, request) == response
+    assert len(state.results.entries) == 1
+
+    git_repo.checkout("release/v0.9")
+    git_repo.commit("fix: other thing \n\n #2")
+    git_repo.checkout("master")
+    git_repo.commit("fix: something \n\n #1")
+
+    write_config_file(git_repo.path, {"ignore_issues": "#3"})
+    response = send_request(server.server_address, request)
+    [[branch, fixes]] = response["missing"]
+    assert [fix[1] for fix in fixes] == ["#2"]
+    assert len(state.results.entries) == 2
+
+    write_config_file(git_repo.path, {"ignore_issues": "#2"})
+    assert send_request(server.server_address, request)["missing"] == []
+
+
+def test_check_like_ck_check(server, git_repo, tmpdir):
+    """the daemon checks with the remote, patch-ids and shallow clones like check"""
+    git_repo.commit("fix: ported differently", {"a": "1\n"})
+    git_repo.checkout("release/v0.9")
+    git_repo.commit("fix: other \n\n #2", {"a": "1\n"})
+    git_repo.checkout("master")
+    clone = str(tmpdir.join("clone"))
+    git_repo.git(
+        "clone",
+        "-q",
+        "--depth",
+        "2",
+        "--no-single-branch",
+        "file://" + git_repo.path,
+        clone,
+    )
+    request = {"command": "check", "repo": clone, "remote": "origin"}
+
+    response = send_request(server.server_address, request)
+    assert [fix[1] for fix in response["missing"][0][1]] == ["#2", "#1"]
+    assert git_repo.git("rev-parse", "master~1") in response["cut_off"]
+
+    response = send_request(server.server_address, dict(request, patch_id=True))
+    assert [fix[1] for fix in response["missing"][0][1]] == ["#1"]
+
+    # without the remote, the clone has no release branches
+    del request["remote"]
+    assert send_request(server.server_address, request)["missing"] == []
+
+
+def test_release_log(server, git_repo):
+    request = {"command": "release-log", "repo": git_repo.path}
+
+    response = send_request(server.server_address, request)
+    assert response["version"] == "0.9.0"
+    assert response["found"]
+    assert response["commits"] == [["feature", ""]]
+
+    base = git_repo.git("rev-parse", "master~2")
+    response = send_request(server.server_address, dict(request, base=base[:8]))
+    assert response["found"]
+    assert len(response["commits"]) == 2
+
+    response = send_request(server.server_address, dict(request, base="abcdef"))
+    assert not response["found"]
+
+
+def test_release_log_without_release(server, tmpdir):
+    repo = GitRepo(tmpdir.join("other"))
+    repo.commit("base")
+
+    response = send_request(
+        server.server_address, {"command": "release-log", "repo": repo.path}
+    )
+    assert response == {"error": "ValueError: No release found on the branch"}
+
+
+def test_config_and_errors(server, git_repo):
+    write_config_file(git_repo.path, {"ignore_issues": "#1,#2"})
+
+    response = send_request(
+        server.server_address, {"command": "config", "repo": git_repo.path}
+    )
+    assert response["config"]["ignore_issues"] == ["#1", "#2"]
+
+    response = send_request(server.server_address, {"command": "nonsense"})
+    assert response == {"error": "ValueError: Unknown command 'nonsense'"}
+
+    response = send_request(server.server_address, {})
+    assert response == {"error": "KeyError: 'command'"}
+
+
+class TestCli:
+    def invoke(self, server, git_repo, *args):
+        runner = CliRunner()
+        return runner.invoke(
+            cli,
+            ["--repo", git_repo.path, "client", *args]
+            + ["--socket", server.server_address],
+        )
+
+    def test_serve(self, tmpdir):
+        socket_path = str(tmpdir.join("ck.sock"))
+
+        with mock.patch.object(Server, "serve_forever") as serve_forever:
+            result = CliRunner().invoke(cli, ["serve", "--socket", socket_path])
+
+        assert result.exit_code == 0
+        assert "Listening on " + socket_path in result.output
+        serve_forever.assert_called_once()
+        assert not tmpdir.join("ck.sock").exists()
+
+    def test_serve_existing_path(self, tmpdir):
+        tmpdir.join("ck.sock").write("")
+
+        result = CliRunner().invoke(
+            cli, ["serve", "--socket", str(tmpdir.join("ck.sock"))]
+        )
+        assert result.exit_code == 1
+        assert "is not a socket" in result.output
+
+    def test_default_socket_not_private(self, tmpdir, monkeypatch):
+        monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+        monkeypatch.setattr("tempfile.gettempdir", lambda: str(tmpdir))
+        tmpdir.mkdir("cactuskeeper-{0}".format(os.getuid())).chmod(0o777)
+
+        result = CliRunner().invoke(cli, ["client", "check"])
+        assert result.exit_code == 1
+        assert "is not a directory only the current user can access" in result.output
+
+    def test_shutdown(self, tmpdir):
+        socket_path = str(tmpdir.join("ck.sock"))
+        server = Server(socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        result = CliRunner().invoke(
+            cli, ["client", "shutdown", "--socket", socket_path]
+        )
+        assert result.exit_code == 0
+        assert result.output == ""
+        thread.join()
+
+        # the socket may already have been removed by someone else
+        tmpdir.join("ck.sock").remove()
+        server.server_close()
+
+    def test_check(self, server, git_repo):
+        result = self.invoke(server, git_repo, "check")
+        assert result.exit_code == 1
+        assert "#1\tfix: something" in result.output
+
+        git_repo.commit("fix: something \n\n #1")
+        result = self.invoke(server, git_repo, "check")
+        assert result.exit_code == 0
+        assert "The current branch is clean" in result.output
+
+    def test_check_options(self, server, git_repo, tmpdir):
+        git_repo.commit("port", {"a": "1\n"})
+        git_repo.checkout("release/v0.9")
+        git_repo.commit("fix: other \n\n #2", {"a": "1\n"})
+        git_repo.checkout("master")
+        git_repo.git("clone", "-q", git_repo.path, str(tmpdir.join("clone")))
+        clone = GitRepo(tmpdir.join("clone"))
+        args = ["--repo", clone.path, "--remote", "origin", "client", "check"]
+        args += ["--socket", server.server_address]
+
+        result = CliRunner().invoke(cli, args)
+        assert result.exit_code == 1
+        assert "#2\tfix: other" in result.output
+
+        result = CliRunner().invoke(cli, args + ["--patch-id"])
+        assert result.exit_code == 1
+        assert "#2" not in result.output
+        assert "#1\tfix: something" in result.output
+
+    def test_release_log(self, server, git_repo):
+        result = self.invoke(server, git_repo, "release-log")
+        assert result.exit_code == 0
+        assert "The last release on the branch is 0.9.0." in result.output
+        assert "\tfeature" in result.output
+
+        result = self.invoke(server, git_repo, "release-log", "--base", "abcdef")
+        assert "The specified commit was not found." in result.output
+
+        git_repo.commit("release: v1.0.0")
+        result = self.invoke(server, git_repo, "release-log")
+        assert "Last commit is already a release." in result.output
+
+    def test_config(self, server, git_repo):
+        result = self.invoke(server, git_repo, "config")
+        assert result.exit_code == 0
+        assert "tagged-files: []" in result.output
+
+    def test_errors(self, server, git_repo, tmpdir):
+        git_repo.git("checkout", "-q", "--detach")
+        result = self.invoke(server, git_repo, "check")
+        assert result.exit_code == 1
+        assert "Error: TypeError" in result.output
+
+        result = CliRunner().invoke(
+            cli, ["client", "check", "--socket", str(tmpdir.join("missing.sock"))]
+        )
+        assert result.exit_code == 1
+        assert "is ck serve running?" in result.output
@@ -0,0 +1,32 @@
+import time
+
+from cactuskeeper.stats import Stats
+
+
+def test_stats_disabled():
+    stats = Stats()
+
+    with stats.phase("walk"):
+        stats.count("commits")
+
+    assert stats.as_dict() == {"timings": {}, "counters": {}}
+
+
+def test_stats_nested_phases():
+    stats = Stats()
+    stats.enabled = True
+
+    with stats.phase("walk"):
+        with stats.phase("parsing"):
+            time.sleep(0.02)
+        stats.record("parsing", 0.5)
+        stats.count("commits")
+        stats.count("commits", 2)
+
+    # nested phases are not counted for the enclosing one
+    assert stats.timings["parsing"] >= 0.52
+    assert stats.timings["walk"] < 0.02
+    assert stats.counters == {"commits": 3}
+
+    stats.reset()
+    assert stats.as_dict() == {"timings": {}, "counters": {}}
@@ -0,0 +1,33 @@
+import pytest
+
+from cactuskeeper.table import CommitTable, pack_version, unpack_version
+
+
+@pytest.mark.parametrize("version", ["", "0.0.0", "1.2.3", "12.345.6"])
+def test_pack_version(version):
+    assert unpack_version(pack_version(version)) == version
+
+
+def test_commit_table():
+    table = CommitTable()
+    shas = ["ab" * 20, "abcd" + "0" * 36, "12" * 20, "abcd" + "f" * 36]
+    table.append(shas[0], "#1")
+    table.append(shas[1], "", "1.2.3")
+    table.append(shas[2], "#1")
+    assert len(table) == 3
+
+    assert [table.hexsha(i) for i in range(3)] == shas[:3]
+    assert [table.issue(i) for i in range(3)] == ["#1", "", "#1"]
+    assert [table.version(i) for i in range(3)] == ["", "1.2.3", ""]
+    # issue numbers are stored once
+    assert table.issue_names == ["#1"]
+
+    assert table.find_prefix("ab") == [0, 1]
+    assert table.find_prefix("abc") == [1]
+    assert table.find_prefix("1") == [2]
+    assert table.find_prefix("ff") == []
+    assert table.find_prefix("not hex") == []
+
+    # the search index is rebuilt for new commits
+    table.append(shas[3])
+    assert table.find_prefix("abcd") == [1, 3]